@@ -1,45 +1,352 @@
 """Flask app for Plant App."""
 
+import csv
+import io
+import json
+import logging
+import math
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+import threading
+import time
+import weakref
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
+from dotenv import load_dotenv
 from flask import (
-    Flask, render_template, session, flash, redirect, url_for, g, jsonify,
-    request
+    Blueprint, Flask, render_template, session, flash, redirect, url_for, g,
+    jsonify, request, current_app, make_response, send_file,
+    stream_with_context
 )
+from flask.ctx import _AppCtxGlobals
 
-import requests
-
-from flask_debugtoolbar import DebugToolbarExtension
-from models import connect_db, db, User, Like, Plant
+from config import load_config
+from json_providers import make_json_provider
+from metrics import (
+    CONTENT_TYPE, Gauge, TimedQueuePool, finish_request, instrument_engine,
+    perenual_listener, register_stats, registry, start_request
+)
+from models import (
+    connect_db, db, User, Like, Plant, PlantDetails, PlantFacet,
+    display_list, plant_card, utcnow, DEFAULT_IMG_URL, DEFAULT_UPGRADE_TEXT,
+    FACETS, PLANT_CYCLES, SAVED_SORTS
+)
+from passwords import HasherBusy, PasswordHasher
+from perenual import (
+    BACKGROUND, INTERACTIVE, PerenualClient, PerenualError
+)
+from quota import QuotaExhausted, RateScheduler
+from seed import plants_cli
+from suggest import SuggestIndex
 from forms import (
-    CSRFProtection, PlantSearchForm, SignupForm, LoginForm
+    CSRFProtection, PlantSearchForm, SignupForm, LoginForm, ProfileEditForm
 )
 
 from sqlalchemy.exc import IntegrityError
-# from utils import
+from thumbnails import (
+    ThumbnailCache, ThumbnailError, THUMBNAIL_MIMETYPE, THUMBNAIL_SIZES
+)
+from utils import (
+    JsonFormatter, SharedFlight, SingleFlight, TTLCache,
+    decode_cursor, encode_cursor, make_cache_key, make_etag, normalize_term
+)
+
+logger = logging.getLogger(__name__)
+
+# all routes live on this blueprint; create_app() registers it
+bp = Blueprint('main', __name__)
+
+# Process-wide bookkeeping, shared by every app in the process. Each app's
+# own clients, caches and pools live in app.extensions (see create_app).
 
-API_KEY = os.environ['PERENUAL_API_KEY']
+PREFETCH_MAX_PENDING = 32
+_prefetching = set()
+_prefetching_lock = threading.Lock()
 
-app = Flask(__name__)
+# ids of plants whose details are being refreshed in the background
+_refreshing = set()
+_refreshing_lock = threading.Lock()
 
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
-app.config['SECRET_KEY'] = os.environ.get('FLASK_SECERT_KEY', 'sssshhhh')
-app.config['SQLALCHEMY_ECHO'] = True
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
-app.config['WTF_CSRF_ENABLED'] = False
+# the suggestions index is loaded (or caught up) by one thread at a time
+suggest_loading = threading.Lock()
 
-toolbar = DebugToolbarExtension(app)
+# Last-Modified's stand-in for RELEASE: nothing this process renders is
+# older than the code it runs
+STARTED_AT = utcnow()
+
+# every app create_app() made in this process, for reset_apps_after_fork
+_apps = weakref.WeakSet()
+
+
+class AppGlobals(_AppCtxGlobals):
+    """Flask's g, except g.user is only looked up the first time something
+    reads it, so requests that never touch the user cost no user lookup.
+    """
+
+    @property
+    def user(self):
+        if 'user' not in self.__dict__:
+            user_id = self.__dict__.get('user_id')
+            self.__dict__['user'] = user_id and User.get_cached(user_id)
+
+        return self.__dict__['user']
+
+    @user.setter
+    def user(self, value):
+        self.__dict__['user'] = value
+
+
+def create_app(config=None):
+    """Create and configure the app.
+
+    config is a profile name from config.PROFILES ("development",
+    "testing", "production"), a Config instance, or None to pick the profile
+    from PLANT_APP_CONFIG.
+    """
+
+    load_dotenv()
+
+    app = Flask(__name__)
+    app.config.from_object(load_config(config))
+    app.app_ctx_globals_class = AppGlobals
+    app.json = make_json_provider(app, app.config['JSON_PROVIDER'])
+
+    if app.config['LOG_FORMAT']:
+        configure_logging(app.config['LOG_FORMAT'], app.config['LOG_LEVEL'])
+
+    if app.config['DEBUG_TB_ENABLED']:
+        init_debug_toolbar(app)
+
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        # time how long requests wait for a pooled connection
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).setdefault(
+            'poolclass', TimedQueuePool
+        )
+
+    connect_db(app)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_engine(engine)
+
+    # shared, pooled upstream clients; use these for every Perenual call
+    client_settings = dict(
+        base_url=app.config['PERENUAL_BASE_URL'],
+        connect_timeout=app.config['PERENUAL_CONNECT_TIMEOUT'],
+        read_timeout=app.config['PERENUAL_READ_TIMEOUT'],
+        retries=app.config['PERENUAL_RETRIES'],
+        pool_maxsize=app.config['PERENUAL_POOL_MAXSIZE'],
+    )
+    api_key = app.config['PERENUAL_API_KEY']
+
+    app.extensions['perenual'] = PerenualClient(api_key, **client_settings)
+    app.extensions['perenual'].on_request = perenual_listener('sync')
+
+    # every Perenual call, from any worker, takes a token from here first
+    scheduler = RateScheduler(
+        app.config['PERENUAL_QUOTA_DB'] or instance_file(
+            app, 'perenual_quota.db'
+        ),
+        app.config['PERENUAL_API_KEYS'] or [api_key],
+        per_minute=app.config['PERENUAL_RATE_PER_MINUTE'],
+        per_day=app.config['PERENUAL_QUOTA_PER_DAY'],
+        background_reserve=app.config['PERENUAL_BACKGROUND_RESERVE'],
+        max_wait=app.config['PERENUAL_QUOTA_MAX_WAIT'],
+    )
+    app.extensions['perenual'].scheduler = scheduler
+    register_quota_metrics(scheduler)
+
+    # bounded pool for fetching upcoming result pages in the background
+    app.extensions['prefetch_pool'] = ThreadPoolExecutor(
+        max_workers=app.config['PERENUAL_PREFETCH_WORKERS'],
+        thread_name_prefix='perenual-prefetch',
+    )
+
+    # plant images, fetched once and served as local thumbnails
+    app.extensions['thumbnails'] = ThumbnailCache(
+        app.config['THUMBNAIL_DIR'] or instance_file(app, 'thumbnails'),
+        max_bytes=app.config['THUMBNAIL_CACHE_MAX_BYTES'],
+        allowed_hosts=app.config['THUMBNAIL_HOSTS'],
+        connect_timeout=app.config['PERENUAL_CONNECT_TIMEOUT'],
+        read_timeout=app.config['PERENUAL_READ_TIMEOUT'],
+    )
+    register_stats(
+        'plant_app_thumbnails', app.extensions['thumbnails'].stats,
+        'Thumbnail cache',
+    )
+
+    # plant names by prefix, for /api/suggest; loaded on first use
+    app.extensions['suggest'] = SuggestIndex()
+    register_stats(
+        'plant_app_suggest', app.extensions['suggest'].stats,
+        'Suggestions index',
+    )
+
+    # Pages of search results (from Perenual's species list, trimmed to
+    # what the front end shows), keyed on normalized term + query params.
+    # Popular terms repeat all day; a hit skips the upstream call (and its
+    # quota).
+    app.extensions['species_cache'] = TTLCache(
+        ttl=app.config['PERENUAL_CACHE_TTL'],
+        max_entries=app.config['PERENUAL_CACHE_MAX_ENTRIES'],
+        max_bytes=app.config['PERENUAL_CACHE_MAX_BYTES'],
+    )
+    register_stats(
+        'plant_app_species_cache', app.extensions['species_cache'].stats,
+        'Species-list cache',
+    )
+
+    # One upstream fetch per page at a time: concurrent searches for a page
+    # that's being fetched (a trending term) wait for that fetch and share
+    # it.
+    app.extensions['search_flights'] = SingleFlight(
+        SharedFlight(
+            app.config['SEARCH_SHARED_FLIGHT_DIR'],
+            ttl=app.config['SEARCH_SHARED_FLIGHT_TTL'],
+        )
+        if app.config['SEARCH_SHARED_FLIGHT_DIR'] else None
+    )
+    register_stats(
+        'plant_app_search_flights', app.extensions['search_flights'].stats,
+        'Coalesced searches',
+    )
+
+    # user column values by id (see User.get_cached); kept short-lived
+    # because other worker processes can't see our invalidations
+    app.extensions['user_cache'] = TTLCache(
+        ttl=app.config['USER_CACHE_TTL'], max_entries=10_000
+    )
+    register_stats(
+        'plant_app_user_cache', app.extensions['user_cache'].stats,
+        'Logged-in user cache',
+    )
+
+    app.extensions['password_hasher'] = PasswordHasher(
+        rounds=app.config['BCRYPT_LOG_ROUNDS'],
+        max_workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+    )
+    register_stats(
+        'plant_app_password_hasher', app.extensions['password_hasher'].stats,
+        'Password hash pool',
+    )
+
+    app.register_blueprint(bp)
+    app.cli.add_command(plants_cli)
+
+    _apps.add(app)
+
+    return app
+
+
+def instance_file(app, name):
+    """Path of name in the app's instance folder, which is made if need be."""
+
+    os.makedirs(app.instance_path, exist_ok=True)
+    return os.path.join(app.instance_path, name)
+
+
+def register_quota_metrics(scheduler):
+    """Export the scheduler's remaining quota, per key and window, and its
+    grant/throttle counts.
+    """
+
+    def remaining():
+        for index, windows in scheduler.remaining().items():
+            for window, left in zip(('minute', 'day'), windows):
+                if left is not None:
+                    yield (index, window), left
+
+    registry.add(Gauge(
+        'plant_app_perenual_quota_remaining',
+        'Perenual calls left, by API key (index) and window.',
+        remaining,
+        ('key', 'window'),
+    ))
+    register_stats(
+        'plant_app_perenual_quota', scheduler.stats, 'Perenual rate scheduler'
+    )
+
+
+def configure_logging(log_format, level):
+    """Send all logging to stderr, as JSON lines or plain text."""
+
+    handler = logging.StreamHandler()
+
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s %(name)s: %(message)s'
+        ))
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+def init_debug_toolbar(app):
+    """Install the debug toolbar, imported only now: it's heavy, dev-only,
+    and not in the production requirements.
+    """
+
+    try:
+        from flask_debugtoolbar import DebugToolbarExtension
+
+    except ImportError:
+        logger.warning('flask-debugtoolbar is not installed; toolbar is off')
+        return
+
+    DebugToolbarExtension(app)
+
+
+def reset_after_fork(app):
+    """Drop connections inherited from the parent process.
+
+    With gunicorn --preload, the app is created once in the master and forked
+    into each worker; sockets opened before the fork would otherwise be
+    shared by every worker.
+    """
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+    app.extensions['perenual'].session.close()
+    app.extensions['thumbnails'].session.close()
+
+
+def reset_apps_after_fork():
+    """reset_after_fork every app in this process; runs in each forked
+    child.
+    """
+
+    for app in list(_apps):
+        reset_after_fork(app)
+
+
+os.register_at_fork(after_in_child=reset_apps_after_fork)
+
+
+def __getattr__(name):
+    """Build the default app on first access to app.app, so that
+    `gunicorn app:app` keeps working without importing this module doing the
+    work of create_app().
+    """
+
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-connect_db(app)
 
 #######################################
 # 404 error route
 
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found(e):
     """Custom 404 page when user visits an incorrect URL."""
 
@@ -52,28 +359,107 @@ def not_found(e):
 
 CURR_USER_KEY = "curr_user"
 NOT_LOGGED_IN_MSG = "You're not logged in."
+BUSY_MSG = "We're busy right now. Please try again in a moment."
+
+
+@bp.before_app_request
+def start_request_metrics():
+    """Start timing the request and counting its SQL."""
+
+    start_request()
+
+
+@bp.after_app_request
+def log_request(response):
+    """Record the request's metrics, and log them as one line."""
 
+    logger.info('request', extra=finish_request(response))
 
-@app.before_request
+    return response
+
+
+@bp.before_app_request
 def add_user_to_g():
-    """If we're logged in, add curr user instance to Flask global using
-    user.id.
+    """If we're logged in, add curr user's id to Flask global; g.user loads
+    the user instance from it on first use.
     """
 
-    if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+    g.user_id = session.get(CURR_USER_KEY)
+    # g outlives the request if an app context was already pushed
+    g.pop('user', None)
 
-    else:
-        g.user = None
 
-
-@app.before_request
+@bp.before_app_request
 def add_csrf_only_form():
     """Add a CSRF-only form so that every route can use it."""
 
     g.csrf_form = CSRFProtection()
 
 
+#######################################
+# HTTP caching
+
+
+def user_cache_scope():
+    """What about the current user can change a page's HTML, as ETag parts:
+    just "anon" when logged out.
+    """
+
+    if not g.user:
+        return ('anon',)
+
+    return (g.user.id, g.user.full_name, g.user.admin)
+
+
+def last_modified_of(*times):
+    """The latest of times (naive UTC; Nones are skipped) as a Last-Modified
+    value: aware, in whole seconds.
+    """
+
+    return max(time for time in times if time is not None).replace(
+        microsecond=0, tzinfo=timezone.utc
+    )
+
+
+def is_not_modified(etag, last_modified=None):
+    """Does the client's cached copy (If-None-Match, else If-Modified-Since)
+    still match?
+
+    last_modified must be no older than anything the ETag covers; leave it
+    out for responses that depend on something without a date (e.g. who's
+    logged in), so only the ETag can validate them.
+    """
+
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+
+    if last_modified is not None and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+
+    return False
+
+
+def conditional_response(render, etag, cache_control, last_modified=None):
+    """Answer with 304 if the client's copy is current, else with render().
+
+    Either way, the response carries the ETag, Last-Modified (an aware
+    datetime, whole seconds) and Cache-Control headers.
+    """
+
+    if is_not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    return response
+
+
 def do_login(user):
     """Log in user."""
 
@@ -84,6 +470,7 @@ def do_logout():
     """Logout user."""
 
     if CURR_USER_KEY in session:
+        User.invalidate_cache(session[CURR_USER_KEY])
         del session[CURR_USER_KEY]
 
 
@@ -91,19 +478,23 @@ def do_logout():
 # homepage
 
 
-@app.get('/')
+@bp.get('/')
 def homepage():
     """Show homepage."""
 
     form = PlantSearchForm()
 
-    return render_template('homepage.html', form=form)
+    return render_template(
+        'homepage.html',
+        form=form,
+        facet_options=facet_options(facet_args({})),
+    )
 
 
 #######################################
 # about
 
-@app.get('/about')
+@bp.get('/about')
 def about():
     """Show about page."""
 
@@ -113,7 +504,7 @@ def about():
 #######################################
 # features
 
-@app.get('/features')
+@bp.get('/features')
 def features():
     """Show features page."""
 
@@ -123,24 +514,219 @@ def features():
 #######################################
 # saved plants
 
-@app.get('/saved')
+@bp.get('/saved')
 def saved_plants():
-    """Show Saved Plants page."""
+    """Show Saved Plants page, one page of likes at a time.
+
+    Query string (all optional):
+        sort: "newest" (default) or "oldest"
+        cycle, watering, sunlight: only show plants with this value (see
+            Plant.facet_filters)
+        after: position token from the previous page's "Next page" link
+    """
 
     if not g.user:
         flash(NOT_LOGGED_IN_MSG, 'danger')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
+
+    sort = request.args.get('sort')
+    if sort not in SAVED_SORTS:
+        sort = SAVED_SORTS[0]
+
+    filters = facet_args(request.args)
+    after = saved_position(request.args.get('after'))
+
+    plants, next_after = Like.saved_page(
+        g.user.id, after, sort=sort, **filters
+    )
+
+    return render_template(
+        'saved.html',
+        plants=plants,
+        sort=sort,
+        filters=filters,
+        filtered=any(filters.values()),
+        facet_options=facet_options(filters),
+        first_page=after is None,
+        next_after=next_after and encode_cursor(*next_after),
+    )
+
+
+def facet_args(args):
+    """Return the facet filters in args (a query string or JSON body) as
+    {facet: value}, None where a facet isn't given.
+    """
+
+    return {facet: args.get(facet) or None for facet in FACETS}
+
+
+def facet_options(filters):
+    """Return {facet: [value, ...]} to offer as filters: the values stored
+    plants have (see PlantFacet), most common first, plus the chosen ones.
+    """
+
+    options = {}
+
+    for facet, counts in PlantFacet.counts().items():
+        values = list(counts)
+        if facet == 'cycle':
+            values += [cycle for cycle in PLANT_CYCLES if cycle not in counts]
+        if filters[facet] and filters[facet] not in values:
+            values.append(filters[facet])
+        options[facet] = values
+
+    return options
+
+
+def saved_position(token):
+    """Turn an "after" token back into a (liked_at, plant_id) position, or
+    None (the first page) if it's missing or malformed.
+    """
+
+    values = token and decode_cursor(token)
+
+    try:
+        liked_at, plant_id = values
+        return datetime.fromisoformat(liked_at), int(plant_id)
+
+    except (TypeError, ValueError):
+        return None
+
+
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def export_csv(rows):
+    """Yield CSV lines for export rows: a header line, then one per plant,
+    with list values joined as on the page ("a, b").
+    """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield line(EXPORT_FIELDS)
+
+    for row in rows:
+        yield line([
+            display_list(value) if isinstance(value, list) else value
+            for value in row
+        ])
+
+
+def export_ndjson(rows):
+    """Yield a JSON object per export row, one per line."""
+
+    for row in rows:
+        plant = row._asdict()
+        plant['liked_at'] = plant['liked_at'].isoformat()
+        yield json.dumps(plant) + '\n'
+
+
+EXPORT_FIELDS = (
+    'id', 'common_name', 'scientific_name', 'cycle', 'watering', 'sunlight',
+    'default_image', 'liked_at',
+)
+
+# format: (mimetype, function from export rows to lines of text)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', export_csv),
+    'ndjson': ('application/x-ndjson', export_ndjson),
+}
+
+
+def chunked(lines, size):
+    """Join lines of text into UTF-8 chunks of about size bytes each, so a
+    long download isn't sent a line at a time.
+    """
+
+    chunk = []
+    length = 0
 
-    print('liked_plants:', g.user.liked_plants)
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
 
-    return render_template('saved.html', plants=g.user.liked_plants)
+        if length >= size:
+            yield ''.join(chunk).encode()
+            chunk = []
+            length = 0
+
+    if chunk:
+        yield ''.join(chunk).encode()
+
+
+def gzipped(chunks):
+    """Gzip a stream of byte chunks as it goes."""
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+@bp.get('/saved/export')
+def export_saved_plants():
+    """Download every plant the user likes, streamed as it's read.
+
+    Query string (all optional):
+        format: "csv" (default) or "ndjson"
+        sort, cycle, watering, sunlight: as for the Saved Plants page
+
+    Rows come from a server-side cursor (see Like.export_rows) and are sent
+    in EXPORT_CHUNK_BYTES chunks, gzipped if the client accepts it, so a
+    worker's memory doesn't grow with the number of likes.
+    """
+
+    if not g.user:
+        flash(NOT_LOGGED_IN_MSG, 'danger')
+        return redirect(url_for('main.login'))
+
+    export_format = request.args.get('format')
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'csv'
+    mimetype, encode = EXPORT_FORMATS[export_format]
+
+    sort = request.args.get('sort')
+    if sort not in SAVED_SORTS:
+        sort = SAVED_SORTS[0]
+
+    rows = Like.export_rows(g.user.id, sort=sort, **facet_args(request.args))
+    body = chunked(encode(rows), EXPORT_CHUNK_BYTES)
+
+    headers = {
+        "Content-Disposition":
+            f'attachment; filename="saved-plants.{export_format}"',
+        "Cache-Control": 'private, no-store',
+        "Vary": 'Accept-Encoding',
+        # let a proxy pass chunks on as they come, not buffer the download
+        "X-Accel-Buffering": 'no',
+    }
+
+    if 'gzip' in request.accept_encodings:
+        body = gzipped(body)
+        headers["Content-Encoding"] = 'gzip'
+
+    return current_app.response_class(
+        stream_with_context(body), mimetype=mimetype, headers=headers
+    )
 
 
 #######################################
 # user signup/login/logout routes
 
 
-@app.route('/signup', methods=['GET', 'POST'])
+@bp.route('/signup', methods=['GET', 'POST'])
 def signup():
     """Handle user signup.
     GET: shows registration form.
@@ -153,15 +739,27 @@ def signup():
     form = SignupForm()
 
     if form.validate_on_submit():
-        new_user = User.register(
-            username=form.username.data,
-            first_name=form.first_name.data,
-            last_name=form.last_name.data,
-            bio=form.bio.data,
-            email=form.email.data,
-            password=form.password.data,
-            image_url=form.image_url.data or User.image_url.default.arg,
-        )
+        # cheap check first, so a taken username doesn't cost a bcrypt hash;
+        # the commit below still catches a race for the same name
+        if User.username_taken(form.username.data):
+            flash('Username already taken.', 'danger')
+            return render_template('/auth/signup-form.html', form=form)
+
+        try:
+            new_user = User.register(
+                username=form.username.data,
+                first_name=form.first_name.data,
+                last_name=form.last_name.data,
+                bio=form.bio.data,
+                email=form.email.data,
+                password=form.password.data,
+                image_url=form.image_url.data or User.image_url.default.arg,
+            )
+
+        except HasherBusy:
+            flash(BUSY_MSG, 'danger')
+            return render_template('/auth/signup-form.html', form=form), 503
+
         try:
             db.session.commit()
 
@@ -171,13 +769,13 @@ def signup():
 
         do_login(new_user)
         flash('You are signed up and logged in.')
-        return redirect(url_for('homepage'))
+        return redirect(url_for('main.homepage'))
 
     else:
         return render_template('/auth/signup-form.html', form=form)
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Handles logging in user.
     GET: shows login form.
@@ -188,52 +786,59 @@ def login():
     form = LoginForm()
 
     if form.validate_on_submit():
-        user = User.authenticate(
-            form.username.data,
-            form.password.data,
-        )
+        try:
+            user = User.authenticate(
+                form.username.data,
+                form.password.data,
+            )
+
+        except HasherBusy:
+            flash(BUSY_MSG, 'danger')
+            return render_template('/auth/login-form.html', form=form), 503
 
         if user:
+            # saves the rehashed password, if authenticate upgraded it
+            db.session.commit()
             do_login(user)
             flash(f'Hello, {user.username}!')
-            return redirect(url_for('homepage'))
+            return redirect(url_for('main.homepage'))
 
         flash('Invalid credentials.', 'danger')
 
     return render_template('/auth/login-form.html', form=form)
 
 
-@app.post('/logout')
+@bp.post('/logout')
 def logout():
     """Handles logging out user."""
 
     if not g.csrf_form.validate_on_submit() or not g.user:
         flash("Access unauthorized", "danger")
-        return redirect(url_for('homepage'))
+        return redirect(url_for('main.homepage'))
 
     do_logout()
 
     flash('You have successfully logged out.')
-    return redirect(url_for('homepage'))
+    return redirect(url_for('main.homepage'))
 
 
 #######################################
 # general user routes
 
 
-@app.get('/profile')
+@bp.get('/profile')
 def show_profile():
     """Shows user profile."""
 
     if not g.user:
         # if not logged in, you shouldn't be able to view a user's profile
         flash(NOT_LOGGED_IN_MSG, 'danger')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     return render_template('/profile/detail.html', user=g.user)
 
 
-@app.route('/profile/edit', methods=['GET', 'POST'])
+@bp.route('/profile/edit', methods=['GET', 'POST'])
 def edit_profile():
     """Edit current user profile.
     GET: show profile edit form.
@@ -242,7 +847,7 @@ def edit_profile():
 
     if not g.user:
         flash(NOT_LOGGED_IN_MSG, 'danger')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     form = ProfileEditForm(obj=g.user)
 
@@ -259,8 +864,10 @@ def edit_profile():
             flash("Update failed.")
             return render_template('/profile/edit-form.html', form=form)
 
+        User.invalidate_cache(g.user.id)
+
         flash("Profile edited.")
-        return redirect(url_for('show_profile'))
+        return redirect(url_for('main.show_profile'))
 
     return render_template('/profile/edit-form.html', form=form)
 
@@ -268,21 +875,64 @@ def edit_profile():
 #######################################
 # plant/plants routes
 
+# list-valued plant columns (scientific_name, sunlight) show as "a, b"
+bp.add_app_template_filter(display_list)
+
 
-@app.get('/plants/<int:plant_id>')
+@bp.get('/plants/<int:plant_id>')
 def plant_detail(plant_id):
-    """Show detail for plant."""
+    """Show detail for plant, with its Perenual species details (see
+    plant_details).
+
+    Conditional: the ETag covers the plant's updated_at, when its details
+    were fetched, the user it's rendered for and the release, so repeat
+    views get a 304 without rendering. Logged-out pages may be cached by
+    browsers and CDNs for PLANT_PAGE_MAX_AGE, and also validated by date;
+    logged-in ones only by the browser, which must revalidate by ETag.
+    """
 
     plant = Plant.query.get_or_404(plant_id)
+    details = plant_details(plant)
+
+    def render():
+        return render_template(
+            'plant/detail.html',
+            plant=plant,
+            details=details,
+            show_edit=g.user and g.user.admin,
+            upgrade_text=DEFAULT_UPGRADE_TEXT,
+        )
 
-    return render_template(
-        'plant/detail.html',
-        plant=plant,
-        show_edit=g.user and g.user.admin,
+    # a pending flash message is rendered once; never cache that page
+    if '_flashes' in session:
+        response = make_response(render())
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    if g.user:
+        cache_control = 'private, no-cache'
+        last_modified = None
+    else:
+        cache_control = (
+            f"public, max-age={current_app.config['PLANT_PAGE_MAX_AGE']}"
+        )
+        last_modified = last_modified_of(
+            plant.updated_at, details and details.fetched_at, STARTED_AT
+        )
+
+    return conditional_response(
+        render,
+        etag=make_etag(
+            'plant', plant.id, plant.updated_at,
+            details and details.fetched_at, *user_cache_scope(),
+            current_app.config['RELEASE'],
+        ),
+        cache_control=cache_control,
+        last_modified=last_modified,
     )
 
 
-# @app.route('/plants/<int:plant_id>/edit', methods=["GET", "POST"])
+# @bp.route('/plants/<int:plant_id>/edit', methods=["GET", "POST"])
 # def edit_plant(plant_id):
 #     """GET: show form for editing plant. Form fields same as adding new plant.
 #     POST: handles editing plant.
@@ -310,17 +960,180 @@ def plant_detail(plant_id):
 #             return render_template('/plant/edit-form.html', form=form, plant=plant)
 
 #         flash(f'{plant.common_name} edited.')
-#         return redirect(url_for('plant_detail', plant_id=plant_id))
+#         return redirect(url_for('main.plant_detail', plant_id=plant_id))
 
 #     else:
 #         return render_template('/plant/edit-form.html', form=form, plant=plant)
 
 
+def plant_details(plant):
+    """Return plant's species details (a PlantDetails), or None if they
+    can't be had.
+
+    Only the first view of a plant waits on Perenual, to fetch them. After
+    that the stored copy is returned right away, and once it's older than
+    PLANT_DETAILS_MAX_AGE it's refreshed in the background (stale while
+    revalidating), so later views never wait on upstream.
+    """
+
+    details = db.session.get(PlantDetails, plant.id)
+
+    if details is None:
+        try:
+            return fetch_plant_details(plant.id)
+
+        except PerenualError as exc:
+            logger.warning('plant details fetch failed', extra={
+                "plant_id": plant.id, "upstream_status": exc.status,
+            })
+            return None
+
+    if details.is_stale(current_app.config['PLANT_DETAILS_MAX_AGE']):
+        refresh_plant_details(plant.id)
+
+    return details
+
+
+def fetch_plant_details(plant_id, priority=INTERACTIVE):
+    """Fetch a plant's species details from Perenual and store them; return
+    the PlantDetails. Raises PerenualError if Perenual fails.
+
+    A 404 is stored as empty details, so a plant Perenual has no details
+    for isn't asked about again until they're stale.
+    """
+
+    perenual = current_app.extensions['perenual']
+
+    try:
+        details = perenual.species_details(plant_id, priority=priority)
+
+    except PerenualError as exc:
+        if exc.status != 404:
+            raise
+        details = {}
+
+    stored = PlantDetails.store(plant_id, details)
+    db.session.commit()
+
+    return stored
+
+
+def _refresh_details(app, plant_id):
+    """Background task: re-fetch a plant's details, in its own app
+    context.
+    """
+
+    try:
+        with app.app_context():
+            fetch_plant_details(plant_id, priority=BACKGROUND)
+
+    except PerenualError as exc:
+        logger.warning('plant details refresh failed', extra={
+            "plant_id": plant_id, "upstream_status": exc.status,
+        })
+
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(plant_id)
+
+
+def refresh_plant_details(plant_id):
+    """Start re-fetching a plant's details in the background, on the
+    prefetch pool. Returns the future, or None if a refresh is already
+    running (or PREFETCH_MAX_PENDING of them are).
+    """
+
+    with _refreshing_lock:
+        if (plant_id in _refreshing or
+                len(_refreshing) >= PREFETCH_MAX_PENDING):
+            return None
+        _refreshing.add(plant_id)
+
+    app = current_app._get_current_object()
+
+    return app.extensions['prefetch_pool'].submit(
+        _refresh_details, app, plant_id
+    )
+
+
+#######################################
+# image routes
+
+# thumbnails never change under a given URL (the source URL is in it, and
+# the source is re-fetched only once evicted)
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+
+
+@bp.app_template_global()
+def thumbnail_url(src, size='card'):
+    """URL to show image src at size through the thumbnail proxy; src as-is
+    if the proxy won't fetch it (e.g. our own /static images).
+    """
+
+    if not src or not current_app.extensions['thumbnails'].allows(src):
+        return src
+
+    return url_for('main.image_thumbnail', size=size, src=src)
+
+
+def with_thumbnails(results, size='card'):
+    """Return a page of search results with each plant's image pointed at
+    the thumbnail proxy. results may be cached, so it's left alone.
+    """
+
+    return {
+        **results,
+        "data": [
+            {**plant, "default_image": thumbnail_url(plant["default_image"],
+                                                     size)}
+            for plant in results["data"]
+        ],
+    }
+
+
+@bp.get('/images/<size>')
+def image_thumbnail(size):
+    """Serve a thumbnail of the remote image in ?src= at size (a name from
+    THUMBNAIL_SIZES).
+
+    The image is fetched and scaled once, then served from the disk cache,
+    cacheable by browsers and CDNs for a year. Images that can't be fetched
+    redirect to the default plant image instead.
+    """
+
+    thumbnails = current_app.extensions['thumbnails']
+    src = request.args.get('src', '')
+
+    if size not in THUMBNAIL_SIZES or not thumbnails.allows(src):
+        return jsonify({"error": "Unknown image"}), 404
+
+    try:
+        path = thumbnails.get(src, size)
+
+    except ThumbnailError as exc:
+        logger.warning(
+            'thumbnail failed', extra={"src": src, "error": str(exc)}
+        )
+        return redirect(DEFAULT_IMG_URL)
+
+    response = send_file(
+        path,
+        mimetype=THUMBNAIL_MIMETYPE,
+        etag=os.path.basename(path).split('.')[0],
+        max_age=THUMBNAIL_MAX_AGE,
+        conditional=True,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+
+    return response
+
+
 #######################################
 # likes routes
 
 
-@app.get('/api/likes')
+@bp.get('/api/likes')
 def likes_plant():
     """Given plant_id in the URL query string, checks if the current user likes
     specific plant. Returns JSON:
@@ -337,10 +1150,7 @@ def likes_plant():
     # them to login to use that feature. Once logged in, bring them back to
     # original location.
 
-    print('We got into likes_plant on backend/server-side!')
-    print('This is plant_id', int(request.args.get('plant_id')))
     plant_id = int(request.args.get('plant_id'))
-    print('This is plant_id', plant_id)
 
     plant = Plant.query.get_or_404(plant_id)
 
@@ -353,38 +1163,98 @@ def likes_plant():
     else:
         like = False
 
-    return jsonify({"likes": like})
+    # private to this user, and revalidated every time: it flips on a click
+    return conditional_response(
+        lambda: jsonify({"likes": like}),
+        etag=make_etag('likes', g.user.id, plant_id, like),
+        cache_control='private, no-cache',
+    )
+
+
+MAX_BATCH_LIKES = 100
+
+
+@bp.get('/api/likes/batch')
+def likes_plants_batch():
+    """Given many plant_id values in the URL query string
+    (?plant_id=1&plant_id=2...), checks which of those plants the current user
+    likes, with a single query. Returns JSON:
+
+    {"likes": {"1": true, "2": false, ...}}
+
+    """
+
+    if not g.user:
+        return jsonify({"error": "Not logged in"})
+
+    try:
+        plant_ids = {
+            int(plant_id) for plant_id in request.args.getlist('plant_id')
+        }
+    except ValueError:
+        return jsonify({"error": "plant_id must be an integer"}), 400
+
+    if len(plant_ids) > MAX_BATCH_LIKES:
+        return jsonify(
+            {"error": f"At most {MAX_BATCH_LIKES} plant_ids per request"}
+        ), 400
+
+    liked = set()
+    if plant_ids:
+        liked = set(db.session.scalars(
+            db.select(Like.plant_id).where(
+                (Like.user_id == g.user.id) & (Like.plant_id.in_(plant_ids))
+            )
+        ))
+
+    return conditional_response(
+        lambda: jsonify({
+            "likes": {str(plant_id): plant_id in liked for plant_id in plant_ids}
+        }),
+        etag=make_etag(
+            'likes-batch', g.user.id, sorted(plant_ids), sorted(liked)
+        ),
+        cache_control='private, no-cache',
+    )
 
 
-@app.post('/api/like')
+@bp.post('/api/like')
 def handle_user_like():
-    """Handles user liking plant."""
+    """Handles user liking plant.
+
+    Idempotent: liking a plant twice (a double click) is fine. One INSERT,
+    however many plants the user has saved; a 404 for a plant we don't have
+    costs one more lookup.
+    """
 
     if not g.user:
         return jsonify({"error": "Not logged in"})
 
     plant_id = int(request.json['plant_id'])
-    plant = Plant.query.get_or_404(plant_id)
-
-    g.user.liked_plants.append(plant)
 
+    added = Like.add(g.user.id, plant_id)
     db.session.commit()
 
+    if not added and db.session.get(Plant, plant_id) is None:
+        return jsonify({"error": "No such plant"}), 404
+
     return jsonify({"liked": plant_id})
 
 
-@app.post('/api/unlike')
+@bp.post('/api/unlike')
 def handle_user_unliking():
-    """Handles user unliking a plant."""
+    """Handles user unliking a plant.
+
+    Idempotent: unliking a plant that isn't liked is fine. One DELETE,
+    however many plants the user has saved.
+    """
 
     if not g.user:
         return jsonify({"error": "Not logged in"})
 
     plant_id = int(request.json['plant_id'])
-    plant = Plant.query.get_or_404(plant_id)
-
-    g.user.liked_plants.remove(plant)
 
+    Like.remove(g.user.id, plant_id)
     db.session.commit()
 
     return jsonify({"unliked": plant_id})
@@ -392,86 +1262,533 @@ def handle_user_unliking():
 
 #######################################
 # Perenual API routes
-# TODO: add plant detail route for Perenual API request
 
 
-@app.post('/api/get-plant-list')
-def handle_json_form_data():
-    """Takes in a JSON body with the following:
+PERENUAL_PAGE_SIZE = 30
+
 
-        searchTerm: input value from user searching for plant
+def search_local_first(term, page):
+    """Answer a search from the plants table, as a page of search results
+    (see search_results_page).
 
-    Interprets JSON data, sends requests to Perenual API, and returns JSON resp.
+    Returns None when there are too few local matches, so the caller
+    should go upstream. The decision covers every local match, not just
+    this page's, so all pages of a term come from the same place and don't
+    repeat or skip plants. Also None for a page past the last local one.
+
+    Plants on the page older than LOCAL_SEARCH_MAX_AGE are served as they
+    are, and refreshed in the background (see refresh_local_page).
     """
 
-    print('We got into handle_json_form_data!')
+    if current_app.config['PLANT_SEARCH_MODE'] != 'local-first':
+        return None
 
-    data = request.json
-    print('This is data', data)
+    total = Plant.count_local(term)
 
-    print('We got passed form validation! Now checking JSON.')
-    form = PlantSearchForm(obj=data)
+    if total < current_app.config['LOCAL_SEARCH_MIN_RESULTS']:
+        return None
 
-    print('This is form', form)
+    if page > local_last_page(total):
+        return None
 
-    if form.validate_on_submit():
-        print('We got passed form validation for PlantSearchForm!')
-        term = form.term.data
-
-        print('This is term', term)
-
-        resp = requests.get(
-            f'https://perenual.com/api/species-list',
-            params={
-                "key": API_KEY,
-                "q": term,
-                "order": "asc",
-            }
+    return local_results_page(term, page, total, refresh_stale=True)
+
+
+def search_filtered(term, page, filters):
+    """Answer a search narrowed by facet filters (see Plant.facet_filters)
+    from the plants table, as a page of search results.
+
+    Perenual can't filter on the values we store, so filtered searches only
+    see plants already stored (by earlier searches or `flask plants
+    import`).
+    """
+
+    total = Plant.count_local(term, filters)
+
+    return local_results_page(term, page, total, filters)
+
+
+def local_last_page(total):
+    return max(1, -(-total // PERENUAL_PAGE_SIZE))
+
+
+def local_results_page(term, page, total, filters=None,
+                       refresh_stale=False):
+    """One page of search_local results, of total matches in all. With
+    refresh_stale, refresh_local_page if any of them is stale.
+    """
+
+    plants = Plant.search_local(
+        term, limit=PERENUAL_PAGE_SIZE,
+        offset=(page - 1) * PERENUAL_PAGE_SIZE, filters=filters,
+    )
+
+    stale_before = utcnow() - current_app.config['LOCAL_SEARCH_MAX_AGE']
+    if refresh_stale and any(
+        plant.fetched_at < stale_before for plant in plants
+    ):
+        refresh_local_page(term, page)
+
+    return {
+        "data": [plant.to_card() for plant in plants],
+        "current_page": page,
+        "last_page": local_last_page(total),
+        "total": total,
+    }
+
+
+def search_results_page(rows, plant_data, page):
+    """The search API's response for one page: the plants as cards (see
+    plant_card), plus the paging fields the front end uses. rows are the
+    page's plants, already through Plant.from_perenual.
+    """
+
+    current_page = plant_data.get("current_page") or page
+
+    return {
+        "data": [plant_card(row) for row in rows],
+        "current_page": current_page,
+        "last_page": plant_data.get("last_page") or current_page,
+        "total": plant_data.get("total") or len(rows),
+    }
+
+
+def species_cache_key(term, page):
+    """Cache key for one page of species-list results for a normalized term."""
+
+    return make_cache_key(term, {"order": "asc", "page": page})
+
+
+def store_species_page(term, page, plant_data):
+    """Store the plants from one page of Perenual species-list results, and
+    cache the page as search results. Returns the search results page.
+    """
+
+    rows = [Plant.from_perenual(plant) for plant in plant_data.get("data", [])]
+
+    Plant.upsert_many(rows, refresh=True)
+    db.session.commit()
+
+    # this worker can suggest them straight away; others catch up
+    suggestions = current_app.extensions['suggest']
+    if suggestions.loaded:
+        suggestions.add(
+            (row['id'], row.get('common_name') or '',
+             row.get('scientific_name') or ())
+            for row in rows
         )
 
-        print('This is resp', resp)
+    results = search_results_page(rows, plant_data, page)
+    current_app.extensions['species_cache'].set(
+        species_cache_key(term, page), results
+    )
+
+    return results
+
+
+def fetch_species_page(term, page, priority=INTERACTIVE):
+    """Fetch one page of species-list results from Perenual, store its plants
+    and cache it as search results, which it returns. Raises PerenualError if
+    Perenual fails (or the rate scheduler has no token for priority).
+    """
+
+    perenual = current_app.extensions['perenual']
+    plant_data = perenual.species_list(term, page=page, priority=priority)
+
+    return store_species_page(term, page, plant_data)
+
+
+def fetch_species_page_once(term, page, fetch_page, priority=INTERACTIVE):
+    """fetch_page(term, page), unless the page is already being fetched (in
+    this process or, with a shared flight, another worker): then wait for
+    that fetch and return its results.
+
+    priority is fetch_page's rate-scheduler priority. Only fetches of the
+    same priority are shared: a search mustn't inherit the QuotaExhausted
+    of a background prefetch the scheduler refused where it wouldn't refuse
+    the search.
+    """
+
+    species_cache = current_app.extensions['species_cache']
+    key = species_cache_key(term, page)
+
+    def fetch():
+        # it may have been cached since the caller looked
+        return species_cache.get(key) or fetch_page(term, page)
+
+    plant_data = current_app.extensions['search_flights'].do(
+        f'{priority}:{key}', fetch
+    )
+
+    # results shared by another worker aren't in this one's cache yet
+    if key not in species_cache:
+        species_cache.set(key, plant_data)
+
+    return plant_data
 
-        plant_data = resp.json()
-        print('This is plant_data', plant_data)
 
-        for plant in plant_data.get("data"):
+def prefetch_species_page(term, page):
+    """fetch_species_page at background priority: skipped, rather than
+    waiting, when the rate scheduler is short of tokens.
+    """
 
-            print('This is plant', plant)
+    return fetch_species_page(term, page, priority=BACKGROUND)
 
-            default_img = None
-            if plant.get('default_image', None) == None:
-                default_img = Plant.default_image.default.arg
 
-            elif 'medium_url' not in plant.get('default_image') and 'original_url' in plant.get('default_image'):
-                default_img = plant['default_image']['original_url']
+def _prefetch_page(app, term, page):
+    """Background task: fetch a page into the cache, in its own app context."""
 
-            new_plant = Plant(
-                id = plant.get('id'),
-                common_name = plant.get('common_name'),
-                scientific_name = plant.get('scientific_name'),
-                cycle = plant.get('cycle'),
-                watering = plant.get('watering'),
-                sunlight = plant.get('sunlight'),
-                default_image = (default_img or
-                                 plant['default_image']['medium_url'])
+    try:
+        with app.app_context():
+            fetch_species_page_once(
+                term, page, prefetch_species_page, priority=BACKGROUND
             )
 
-            db.session.add(new_plant)
+    except PerenualError as exc:
+        logger.warning(
+            'prefetch failed',
+            extra={"term": term, "page": page, "upstream_status": exc.status},
+        )
 
-            try:
-                db.session.commit()
-                # flash(f'{new_plant.common_name} added w/ id {new_plant.id}')
+    finally:
+        with _prefetching_lock:
+            _prefetching.discard((term, page))
 
-            except IntegrityError:
-                # flash(f'Could not add plant id {new_plant.id} to db. ' +
-                #       f'Possibly already added {new_plant.common_name}.')
-                db.session.rollback()
 
-            # flash(f'{new_plant.common_name} added w/ id {new_plant.id}')
+def refresh_local_page(term, page):
+    """Fetch Perenual's page of term in the background, which refreshes the
+    stored plants it has (see store_species_page), so a stale local page is
+    fresh next time without this search waiting.
+
+    Stale plants Perenual doesn't return for the term stay stale; the page
+    is fetched at most once per PERENUAL_CACHE_TTL, not on every search.
+    Returns the future, or None if it wasn't started (see prefetch_page).
+    """
+
+    return prefetch_page(current_app._get_current_object(), term, page)
+
+
+def prefetch_page(app, term, page):
+    """Start fetching a page into the cache in the background, unless it's
+    already cached or being fetched, or PREFETCH_MAX_PENDING fetches are
+    queued. Returns the future, or None if it wasn't started.
+    """
+
+    if species_cache_key(term, page) in app.extensions['species_cache']:
+        return None
 
-        print('This is plant_data jsonify', jsonify(plant_data))
-        return jsonify(plant_data)
+    with _prefetching_lock:
+        if ((term, page) in _prefetching or
+                len(_prefetching) >= PREFETCH_MAX_PENDING):
+            return None
+        _prefetching.add((term, page))
+
+    return app.extensions['prefetch_pool'].submit(
+        _prefetch_page, app, term, page
+    )
+
+
+def prefetch_pages(term, page, last_page):
+    """Start fetching the pages after page (up to PERENUAL_PREFETCH_PAGES of
+    them, stopping at last_page) in the background, so paging forward is
+    served from the cache.
+
+    Pages already cached or already being fetched are skipped, as is
+    everything once PERENUAL_PREFETCH_MAX_PENDING fetches are queued.
+    Returns the futures for the pages it started.
+    """
+
+    if not last_page:
+        return []
+
+    app = current_app._get_current_object()
+    stop = min(page + app.config['PERENUAL_PREFETCH_PAGES'], last_page)
+    futures = (
+        prefetch_page(app, term, next_page)
+        for next_page in range(page + 1, stop + 1)
+    )
+
+    return [future for future in futures if future is not None]
+
+
+def search_species(term, page, fetch_page, filters=None):
+    """Return one page of search results for a normalized term: from the
+    plants table if it has the term covered (see search_local_first), else
+    the cache, else fetch_page(term, page), which goes to Perenual;
+    concurrent searches for the same page share one fetch. Then prefetch
+    the upstream pages after it.
+
+    With any facet filters set, the page comes from search_filtered.
+
+    Raises PerenualError if Perenual fails.
+    """
+
+    if filters and any(filters.values()):
+        return search_filtered(term, page, filters)
+
+    plant_data = search_local_first(term, page)
+
+    # local pages are as cheap to serve as cached ones; nothing to prefetch
+    if plant_data is not None:
+        return plant_data
+
+    # cached pages were stored in the db when first fetched
+    plant_data = current_app.extensions['species_cache'].get(
+        species_cache_key(term, page)
+    )
+
+    if plant_data is None:
+        plant_data = fetch_species_page_once(term, page, fetch_page)
+
+    prefetch_pages(term, page, plant_data.get("last_page"))
+
+    return plant_data
+
+
+def search_failed(term, page, exc):
+    """Response for a search Perenual couldn't answer (exc).
+
+    Out of quota (QuotaExhausted): whatever the plants table has for the
+    term, marked "partial", or if it has nothing, a 429 with Retry-After.
+    Any other failure is a 502.
+    """
+
+    logger.warning('plant search failed upstream', extra={
+        "term": term, "page": page, "upstream_status": exc.status,
+    })
+
+    if not isinstance(exc, QuotaExhausted):
+        return jsonify(error={"upstream": [str(exc)]}), 502
+
+    total = Plant.count_local(term)
+    if total and page <= local_last_page(total):
+        return jsonify(with_thumbnails({
+            **local_results_page(term, page, total), "partial": True,
+        }))
+
+    response = jsonify(error={"upstream": [str(exc)]})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after_seconds(exc))
+    return response
+
+
+def retry_after_seconds(exc):
+    """Whole seconds until exc (QuotaExhausted) says to try again; with no
+    estimate, every key is out of daily quota: until midnight UTC.
+    """
+
+    if exc.retry_after is not None:
+        return max(1, math.ceil(exc.retry_after))
+
+    now = datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return math.ceil((midnight - now).total_seconds())
+
+
+@bp.post('/api/get-plant-list')
+def handle_json_form_data():
+    """Takes in a JSON body with the following:
+
+        term: input value from user searching for plant
+        page: (optional) page of results to return, 1 to 100, default 1
+        cycle, watering, sunlight: (optional) only plants with this value,
+            one of those /api/facets lists
+
+    Interprets JSON data, sends requests to Perenual API, and returns JSON resp:
+
+        {"data": [{id, common_name, scientific_name, cycle, watering,
+                   sunlight, default_image}, ...],
+         "current_page": 1, "last_page": 3, "total": 85}
+
+    Plants are already cleaned up for display (see plant_card). If Perenual
+    can't be asked, see search_failed.
+    """
+
+    data = request.json
+    form = PlantSearchForm(obj=data)
+
+    if form.validate_on_submit():
+        term = normalize_term(form.term.data)
+        page = form.page.data or 1
+
+        try:
+            plant_data = search_species(
+                term, page, fetch_species_page, facet_args(form.data)
+            )
+
+        except PerenualError as exc:
+            return search_failed(term, page, exc)
+
+        logger.debug(
+            'plant search',
+            extra={"term": term, "page": page,
+                   "results": len(plant_data.get("data", []))},
+        )
+        return jsonify(with_thumbnails(plant_data))
 
     else:
         error = {key: val for key, val in form.errors.items()}
-        return jsonify(error=error)
+        return jsonify(error=error), 400
+
+
+@bp.get('/api/facets')
+def show_facets():
+    """Returns how many stored plants have each filter value, for the
+    search page's filters:
+
+        {"cycle": {"Perennial": 1234, ...}, "watering": {...},
+         "sunlight": {"full sun": 2345, ...}}
+
+    Read from PlantFacet's running counts, most common values first.
+    """
+
+    counts = PlantFacet.counts()
+
+    return conditional_response(
+        lambda: jsonify(counts),
+        etag=make_etag('facets', counts),
+        cache_control='public, max-age=60',
+    )
+
+
+#######################################
+# suggestions
+
+SUGGEST_DEFAULT_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+
+# catching up re-reads plants updated this long before the newest one
+# indexed, for rows committed late by other workers; re-adding is a no-op
+SUGGEST_CATCH_UP_OVERLAP = timedelta(minutes=1)
+
+
+def plant_names(since=None):
+    """Return [(id, common name, scientific names, updated_at)] of plants
+    updated after since (every plant if since is None).
+    """
+
+    query = db.select(
+        Plant.id, Plant.common_name, Plant.scientific_name, Plant.updated_at
+    )
+    if since is not None:
+        query = query.where(Plant.updated_at > since)
+
+    return db.session.execute(query).all()
+
+
+def newest(rows, updated_at=None):
+    """The latest updated_at of rows (from plant_names), or updated_at."""
+
+    return max((row.updated_at for row in rows), default=updated_at)
+
+
+def catch_up_suggestions(index):
+    """Add plants updated since index was, by any worker. Returns how many
+    changed the index.
+    """
+
+    since = index.updated_at and index.updated_at - SUGGEST_CATCH_UP_OVERLAP
+    rows = plant_names(since)
+    index.checked = time.monotonic()
+
+    return index.add(
+        ((row.id, row.common_name, row.scientific_name) for row in rows),
+        newest(rows),
+    )
+
+
+def load_suggestions(index):
+    """Load index from the snapshot and catch it up, or build it from the
+    plants table if there's no snapshot. Rewrites the snapshot if it was
+    missing or out of date.
+    """
+
+    path = (
+        current_app.config['SUGGEST_SNAPSHOT']
+        or instance_file(current_app, 'suggest_index.json.gz')
+    )
+
+    if index.load_snapshot(path):
+        changed = catch_up_suggestions(index)
+    else:
+        rows = plant_names()
+        index.load(
+            ((row.id, row.common_name, row.scientific_name) for row in rows),
+            newest(rows),
+        )
+        index.checked = time.monotonic()
+        changed = True
+
+    if changed:
+        index.save(path)
+
+
+def suggest_index():
+    """The app's SuggestIndex, ready for lookups.
+
+    Loaded on first use (see load_suggestions); requests wait for that.
+    Then caught up every SUGGEST_REFRESH_SECONDS with plants other workers
+    stored, by whichever request comes first; the rest don't wait for it.
+    """
+
+    index = current_app.extensions['suggest']
+
+    if not index.loaded:
+        with suggest_loading:
+            if not index.loaded:
+                load_suggestions(index)
+
+    elif (
+        time.monotonic() - index.checked
+        > current_app.config['SUGGEST_REFRESH_SECONDS']
+        and suggest_loading.acquire(blocking=False)
+    ):
+        try:
+            catch_up_suggestions(index)
+        finally:
+            suggest_loading.release()
+
+    return index
+
+
+@bp.get('/api/suggest')
+def show_suggestions():
+    """Returns stored plants with a name starting with q, best first, for
+    search-as-you-type:
+
+        GET /api/suggest?q=jap&limit=8
+        {"suggestions": [{"id": 1234, "name": "Japanese Maple"}, ...]}
+
+    Matches common names (from any word) and scientific names. Answered
+    from memory (see suggest), never from Perenual. limit is at most
+    SUGGEST_MAX_LIMIT.
+    """
+
+    limit = request.args.get('limit', SUGGEST_DEFAULT_LIMIT, type=int)
+    suggestions = suggest_index().complete(
+        request.args.get('q', ''), max(1, min(limit, SUGGEST_MAX_LIMIT))
+    )
+
+    response = jsonify(suggestions=suggestions)
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+#######################################
+# metrics
+
+
+@bp.get('/metrics')
+def show_metrics():
+    """Request, SQL, pool, upstream and cache metrics for this process, in
+    the Prometheus text format.
+    """
+
+    token = current_app.config['METRICS_TOKEN']
+
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({"error": "Unauthorized"}), 401
+
+    return registry.render(), 200, {"Content-Type": CONTENT_TYPE}
@@ -0,0 +1,117 @@
+"""Benchmark: memory and time to export a user's saved plants.
+
+Compares building the export from User.liked_plants (every plant loaded,
+the whole file built in memory) with GET /saved/export, which streams rows
+from a server-side cursor, for users with --sizes likes:
+
+    python -m benchmarks.export --sizes 1000,10000,100000
+
+Reports seconds and peak Python memory (tracemalloc, so times are slower
+than without it) per export, and the bytes sent, plain and gzipped.
+Uses a throwaway SQLite database unless DATABASE_URL is set (its tables
+are dropped and recreated, so never point it at real data).
+"""
+
+import argparse
+import csv
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+from app import CURR_USER_KEY, create_app
+from benchmarks.likes import populate
+from config import TestingConfig
+from models import User, db, display_list
+
+
+def collection_export(user_id):
+    """The export as it would be built from User.liked_plants; returns the
+    number of bytes.
+    """
+
+    user = db.session.get(User, user_id)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    for plant in user.liked_plants:
+        writer.writerow([
+            plant.id, plant.common_name, display_list(plant.scientific_name),
+            plant.cycle, plant.watering, display_list(plant.sunlight),
+            plant.default_image,
+        ])
+
+    return len(buffer.getvalue().encode())
+
+
+def streamed_export(client, encoding):
+    """Read GET /saved/export a chunk at a time; returns the bytes sent."""
+
+    resp = client.get(
+        '/saved/export', headers={'Accept-Encoding': encoding},
+        buffered=False,
+    )
+    sent = sum(len(chunk) for chunk in resp.response)
+    resp.close()
+
+    return sent
+
+
+def measure(export):
+    """Return (seconds, peak MB, result) of one export."""
+
+    db.session.remove()
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    result = export()
+
+    seconds = time.perf_counter() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return seconds, peak / 1024 / 1024, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = TestingConfig()
+        config.SQLALCHEMY_DATABASE_URI = os.environ.get(
+            "DATABASE_URL", f"sqlite:///{tmpdir}/export.db"
+        )
+        app = create_app(config)
+
+        with app.app_context():
+            users, _plant_id = populate(sizes)
+
+            print(f"{'likes':>8}{'collection s':>14}{'peak MB':>9}"
+                  f"{'streamed s':>12}{'peak MB':>9}{'bytes':>12}"
+                  f"{'gzipped':>10}")
+
+            for size in sizes:
+                old = measure(lambda: collection_export(users[size]))
+
+                with app.test_client() as client:
+                    with client.session_transaction() as sess:
+                        sess[CURR_USER_KEY] = users[size]
+
+                    new = measure(lambda: streamed_export(client, 'identity'))
+                    gzipped = measure(lambda: streamed_export(client, 'gzip'))
+
+                print(f"{size:8}{old[0]:14.2f}{old[1]:9.1f}"
+                      f"{new[0]:12.2f}{new[1]:9.1f}{new[2]:12}"
+                      f"{gzipped[2]:10}")
+
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Benchmark: facet counts and filtered searches as the catalog grows.
+
+Imports --sizes plants (in batches, through Plant.upsert_many, which keeps
+the PlantFacet counts) and, at each size, times:
+
+    upsert      importing one batch of plants, facet counting included
+    counts      PlantFacet.counts(), what /api/facets serves
+    scan        the same counts from a scan of the plants table
+    filtered    a filtered search (Plant.search_local with filters)
+
+    python -m benchmarks.facets --sizes 10000,100000,300000
+
+Reports median milliseconds. Uses a throwaway SQLite database unless
+DATABASE_URL is set (its tables are dropped and recreated, so never point
+it at real data).
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+from app import create_app
+from config import TestingConfig
+from models import Plant, PlantFacet, db, facet_counts
+
+BATCH = 1000
+
+CYCLES = ('Perennial', 'Annual', 'Biennial', 'Herbaceous Perennial')
+WATERING = ('Frequent', 'Average', 'Minimum', 'None')
+SUNLIGHT = ('full sun', 'part shade', 'full shade', 'sun-part shade',
+            'filtered shade')
+
+
+def fake_plants(start, count, rng):
+    for plant_id in range(start, start + count):
+        yield {
+            "id": plant_id,
+            "common_name": f"plant {plant_id}",
+            "scientific_name": [f"Plantae {plant_id}"],
+            "cycle": rng.choice(CYCLES),
+            "watering": rng.choice(WATERING),
+            "sunlight": rng.sample(SUNLIGHT, rng.randint(1, 3)),
+        }
+
+
+def scan_counts():
+    """Facet counts the slow way: read every plant."""
+
+    counts = Counter()
+    rows = db.session.execute(
+        db.select(Plant.cycle, Plant.watering, Plant.sunlight)
+        .execution_options(yield_per=10_000)
+    )
+    for batch in rows.partitions():
+        counts.update(facet_counts(batch))
+    return counts
+
+
+def median_ms(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,300000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = TestingConfig()
+        config.SQLALCHEMY_DATABASE_URI = os.environ.get(
+            "DATABASE_URL", f"sqlite:///{tmpdir}/facets.db"
+        )
+        app = create_app(config)
+
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+            print(f"{'plants':>8}{'upsert ms':>11}{'counts ms':>11}"
+                  f"{'scan ms':>10}{'filtered ms':>13}")
+
+            stored = 0
+            for size in sizes:
+                upserts = []
+                while stored < size:
+                    count = min(BATCH, size - stored)
+                    rows = [
+                        Plant.from_perenual(plant)
+                        for plant in fake_plants(stored + 1, count, rng)
+                    ]
+                    start = time.perf_counter()
+                    Plant.upsert_many(rows)
+                    db.session.commit()
+                    upserts.append((time.perf_counter() - start) * 1000)
+                    stored += count
+
+                filters = {"cycle": "Perennial", "watering": "Minimum",
+                           "sunlight": "full sun"}
+
+                def filtered():
+                    Plant.search_local("plant 1", filters=filters)
+
+                print(
+                    f"{size:8}{statistics.median(upserts):11.2f}"
+                    f"{median_ms(PlantFacet.counts, args.repeat):11.2f}"
+                    f"{median_ms(scan_counts, args.repeat):10.1f}"
+                    f"{median_ms(filtered, args.repeat):13.2f}"
+                )
+
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
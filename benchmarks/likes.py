@@ -0,0 +1,151 @@
+"""Benchmark: cost of a like + unlike for users with more and more likes.
+
+Compares the old writes, which appended to and removed from
+User.liked_plants (loading the whole collection first), with Like.add and
+Like.remove (one statement each). Each user likes --sizes plants already;
+every round starts a fresh session, as a request would:
+
+    python -m benchmarks.likes --sizes 10,1000,100000 --repeat 5
+
+Reports the median milliseconds and SQL statements per like + unlike.
+Uses a throwaway SQLite database unless DATABASE_URL is set (its tables
+are dropped and recreated, so never point it at real data).
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from app import create_app
+from config import TestingConfig
+from metrics import SQL_QUERIES
+from models import Like, Plant, User, db, utcnow
+
+BATCH = 10_000
+
+
+def statements():
+    return sum(value for _suffix, _labels, value in SQL_QUERIES.samples())
+
+
+def populate(sizes):
+    """Store max(sizes) + 1 plants and a user per size who likes that many
+    of them; return {size: user id}. The last plant is liked by no one.
+    """
+
+    db.drop_all()
+    db.create_all()
+
+    plant_count = max(sizes) + 1
+    for start in range(1, plant_count + 1, BATCH):
+        db.session.execute(db.insert(Plant), [
+            {"id": plant_id, "common_name": f"plant {plant_id}",
+             "scientific_name": [f"Plantae {plant_id}"]}
+            for plant_id in range(start, min(start + BATCH, plant_count + 1))
+        ])
+
+    users = {}
+    for size in sizes:
+        user = User(
+            username=f"likes{size}", email=f"likes{size}@example.com",
+            first_name="Bench", last_name=str(size), hashed_password="x",
+        )
+        db.session.add(user)
+        db.session.flush()
+        users[size] = user.id
+
+        now = utcnow()
+        for start in range(1, size + 1, BATCH):
+            db.session.execute(db.insert(Like), [
+                {"user_id": user.id, "plant_id": plant_id, "created_at": now}
+                for plant_id in range(start, min(start + BATCH, size + 1))
+            ])
+
+    db.session.commit()
+    return users, plant_count
+
+
+def collection_toggle(user_id, plant_id):
+    """The old handle_user_like / handle_user_unliking."""
+
+    user = db.session.get(User, user_id)
+    plant = db.session.get(Plant, plant_id)
+    user.liked_plants.append(plant)
+    db.session.commit()
+
+    db.session.remove()
+
+    user = db.session.get(User, user_id)
+    plant = db.session.get(Plant, plant_id)
+    user.liked_plants.remove(plant)
+    db.session.commit()
+
+
+def statement_toggle(user_id, plant_id):
+    Like.add(user_id, plant_id)
+    db.session.commit()
+
+    db.session.remove()
+
+    Like.remove(user_id, plant_id)
+    db.session.commit()
+
+
+def measure(toggle, user_id, plant_id, repeat):
+    """Median (ms, statements) of repeat like + unlike rounds."""
+
+    times, counts = [], []
+
+    for _ in range(repeat):
+        db.session.remove()
+        before = statements()
+        start = time.perf_counter()
+
+        toggle(user_id, plant_id)
+
+        times.append((time.perf_counter() - start) * 1000)
+        counts.append(statements() - before)
+
+    return statistics.median(times), statistics.median(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,1000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = TestingConfig()
+        config.SQLALCHEMY_DATABASE_URI = os.environ.get(
+            "DATABASE_URL", f"sqlite:///{tmpdir}/likes.db"
+        )
+        app = create_app(config)
+
+        with app.app_context():
+            users, plant_id = populate(sizes)
+
+            print(f"median of {args.repeat} like + unlike rounds\n")
+            print(f"{'likes':>8}{'collection ms':>16}{'statements':>12}"
+                  f"{'single ms':>12}{'statements':>12}")
+
+            for size in sizes:
+                old = measure(
+                    collection_toggle, users[size], plant_id, args.repeat
+                )
+                new = measure(
+                    statement_toggle, users[size], plant_id, args.repeat
+                )
+                print(f"{size:8}{old[0]:16.2f}{old[1]:12.0f}"
+                      f"{new[0]:12.2f}{new[1]:12.0f}")
+
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
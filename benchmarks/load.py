@@ -0,0 +1,356 @@
+"""Benchmark: latency and throughput of the main routes under load.
+
+Starts a stub Perenual (benchmarks/stub_perenual.py) serving the recorded
+fixtures in benchmarks/fixtures, runs the app in gunicorn against it, signs
+up --concurrency virtual users and has them run each scenario in turn,
+--requests steps per scenario (a like step is two requests):
+
+    search  POST /api/get-plant-list, fixture terms and made-up ones
+    detail  GET /plants/<id> (the first view of a plant fetches its details)
+    like    POST /api/like then POST /api/unlike for the same plant
+    saved   GET /saved, for users with a few saved plants
+
+    python -m benchmarks.load --requests 400 --concurrency 20
+
+Reports requests per second and p50/p95/p99 latency per scenario. Results
+are compared with the baseline in benchmarks/load_baseline.json: the run
+fails (exit status 1) if any scenario had errors, or its p50 or p95 is
+more than --tolerance slower, or its requests per second that much lower.
+p99 is reported but not checked; at these sample sizes it's a handful of
+requests. --save-baseline records this run as the new baseline instead.
+A baseline only means anything on the machine and settings it was
+recorded with; comparing runs with different settings is refused.
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from benchmarks.search_concurrency import (
+    app_env, create_tables, free_port, percentile, start_gunicorn,
+)
+from benchmarks.record_fixtures import FIXTURES_DIR
+from benchmarks.stub_perenual import start_in_process
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'load_baseline.json')
+
+FIXTURE_TERMS = ('rose', 'maple', 'fern')
+# not in the fixtures: the stub makes these up
+MADE_UP_TERMS = tuple(f'bench{n}' for n in range(20))
+
+SAVED_PER_USER = 5
+
+# checked against the baseline; p99 is only reported (see above)
+CHECKED = ('p50_ms', 'p95_ms', 'rps')
+
+
+class VirtualUser:
+    """One logged-in user with their own cookie jar."""
+
+    def __init__(self, base_url, number, rng):
+        self.number = number
+        self.rng = rng
+        self.client = aiohttp.ClientSession(
+            base_url,
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+            timeout=aiohttp.ClientTimeout(total=60),
+        )
+
+    async def sign_up(self):
+        async with self.client.post('/signup', data={
+            "username": f'load{self.number}',
+            "first_name": 'Load',
+            "last_name": str(self.number),
+            "email": f'load{self.number}@example.com',
+            "password": 'password',
+        }, allow_redirects=False) as resp:
+            if resp.status != 302:
+                raise RuntimeError(f'signup answered {resp.status}')
+
+    async def close(self):
+        await self.client.close()
+
+
+async def search(user, plant_ids):
+    term = user.rng.choice(FIXTURE_TERMS + MADE_UP_TERMS)
+    async with user.client.post(
+        '/api/get-plant-list', json={"term": term}
+    ) as resp:
+        return [resp.status == 200 and "data" in await resp.json()]
+
+
+async def detail(user, plant_ids):
+    plant_id = user.rng.choice(plant_ids)
+    async with user.client.get(f'/plants/{plant_id}') as resp:
+        await resp.read()
+        return [resp.status == 200]
+
+
+async def like(user, plant_ids):
+    plant_id = user.rng.choice(plant_ids)
+    results = []
+
+    for path in ('/api/like', '/api/unlike'):
+        async with user.client.post(path, json={"plant_id": plant_id}) as resp:
+            body = await resp.json()
+            results.append(resp.status == 200 and "error" not in body)
+
+    return results
+
+
+async def saved(user, plant_ids):
+    async with user.client.get('/saved', allow_redirects=False) as resp:
+        await resp.read()
+        return [resp.status == 200]
+
+
+SCENARIOS = {
+    "search": search,
+    "detail": detail,
+    "like": like,
+    "saved": saved,
+}
+
+
+async def time_step(step, user, plant_ids, latencies):
+    """Run one step; record its latency per request (a step of two requests
+    records half its time twice). Returns the number of failed requests.
+    """
+
+    start = time.perf_counter()
+    try:
+        results = await step(user, plant_ids)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        results = [False]
+
+    elapsed = time.perf_counter() - start
+    latencies.extend([elapsed / len(results)] * len(results))
+
+    return results.count(False)
+
+
+async def run_scenario(step, users, plant_ids, total):
+    """Have users run step until total requests are done; return
+    (latencies, failures, seconds).
+    """
+
+    latencies = []
+    failures = 0
+    remaining = total
+
+    async def loop(user):
+        nonlocal failures, remaining
+        while remaining > 0:
+            remaining -= 1
+            failures += await time_step(step, user, plant_ids, latencies)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(loop(user) for user in users))
+
+    return latencies, failures, time.perf_counter() - start
+
+
+async def set_up(base_url, concurrency, seed):
+    """Sign up the users, search the fixture terms so their plants are
+    stored, and save a few plants for every user. Returns (users, plant ids).
+    """
+
+    users = [
+        VirtualUser(base_url, n, random.Random(seed + n))
+        for n in range(concurrency)
+    ]
+    await asyncio.gather(*(user.sign_up() for user in users))
+
+    plant_ids = []
+    for term in FIXTURE_TERMS:
+        async with users[0].client.post(
+            '/api/get-plant-list', json={"term": term}
+        ) as resp:
+            plant_ids += [plant["id"] for plant in (await resp.json())["data"]]
+
+    if not plant_ids:
+        raise RuntimeError('fixture searches returned no plants')
+
+    for user in users:
+        for plant_id in user.rng.sample(
+            plant_ids, min(SAVED_PER_USER, len(plant_ids))
+        ):
+            async with user.client.post(
+                '/api/like', json={"plant_id": plant_id}
+            ) as resp:
+                await resp.read()
+
+    return users, plant_ids
+
+
+async def run_all(base_url, scenarios, args):
+    """Run every scenario in turn; return {name: result dict}."""
+
+    users, plant_ids = await set_up(base_url, args.concurrency, args.seed)
+    results = {}
+
+    try:
+        for name in scenarios:
+            latencies, failures, seconds = await run_scenario(
+                SCENARIOS[name], users, plant_ids, args.requests
+            )
+            results[name] = {
+                "requests": len(latencies),
+                "errors": failures,
+                "rps": round(len(latencies) / seconds, 1),
+                **{
+                    f'p{pct}_ms': round(percentile(latencies, pct) * 1000, 1)
+                    for pct in (50, 95, 99)
+                },
+            }
+
+    finally:
+        await asyncio.gather(*(user.close() for user in users))
+
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    """Return a list of messages, one per check this run fails."""
+
+    problems = []
+
+    for name, result in results.items():
+        if result["errors"]:
+            problems.append(f'{name}: {result["errors"]} failed requests')
+
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+
+        for metric in CHECKED:
+            now, then = result[metric], base[metric]
+            if metric == 'rps':
+                worse = now < then * (1 - tolerance)
+            else:
+                worse = now > then * (1 + tolerance)
+
+            if worse:
+                problems.append(
+                    f'{name}: {metric} {now} vs baseline {then}'
+                )
+
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--padding", type=int, default=0)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--scenarios", default=",".join(SCENARIOS),
+        help="comma-separated subset of: " + ", ".join(SCENARIOS),
+    )
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    settings = {
+        name: getattr(args, name)
+        for name in ("requests", "concurrency", "threads", "latency",
+                     "jitter", "error_rate", "padding")
+    }
+
+    stub, stub_url = start_in_process(
+        free_port(), latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, padding=args.padding,
+        fixtures=args.fixtures,
+    )
+
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = {
+                **app_env(stub_url, os.environ.get(
+                    "DATABASE_URL", f"sqlite:///{tmpdir}/load.db"
+                )),
+                "PLANT_SEARCH_MODE": "local-first",
+                "PERENUAL_QUOTA_DB": os.path.join(tmpdir, "quota.db"),
+                "THUMBNAIL_DIR": os.path.join(tmpdir, "thumbnails"),
+                "GUNICORN_THREADS": str(args.threads),
+                "PERENUAL_POOL_MAXSIZE": str(args.threads),
+            }
+            create_tables(env)
+
+            port = free_port()
+            # the shipped gunicorn.conf.py, one worker
+            proc = start_gunicorn([], port, env)
+
+            try:
+                results = asyncio.run(run_all(
+                    f"http://127.0.0.1:{port}", scenarios, args
+                ))
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    finally:
+        stub.terminate()
+
+    print(f"{args.requests} steps per scenario, {args.concurrency} users, "
+          f"upstream latency {args.latency * 1000:.0f} "
+          f"+ up to {args.jitter * 1000:.0f} ms\n")
+    print(f"{'scenario':9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'errors':>8}")
+    for name, result in results.items():
+        print(f"{name:9}{result['rps']:9.1f}{result['p50_ms']:9.1f}"
+              f"{result['p95_ms']:9.1f}{result['p99_ms']:9.1f}"
+              f"{result['errors']:8d}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as out:
+            json.dump(
+                {"settings": settings, "scenarios": results}, out, indent=2
+            )
+            out.write("\n")
+        print(f"\nsaved as the baseline in {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nno baseline at {args.baseline}; record one with "
+              f"--save-baseline")
+        return
+
+    with open(args.baseline) as saved_baseline:
+        baseline = json.load(saved_baseline)
+
+    if baseline["settings"] != settings:
+        sys.exit(
+            f"\nbaseline was recorded with {baseline['settings']}; rerun "
+            f"with the same settings, or --save-baseline"
+        )
+
+    problems = regressions(results, baseline, args.tolerance)
+    if problems:
+        print(f"\nregressions (tolerance {args.tolerance:.0%}):")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+
+    print(f"\nwithin {args.tolerance:.0%} of the baseline")
+
+
+if __name__ == "__main__":
+    main()
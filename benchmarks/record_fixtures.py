@@ -0,0 +1,70 @@
+"""Record real Perenual responses as fixtures for the stub server.
+
+Fetches species-list pages for each term, and species details for the
+first --details plants of each page, and writes them where
+benchmarks/stub_perenual.py --fixtures looks for them:
+
+    PERENUAL_API_KEY=... python -m benchmarks.record_fixtures \\
+        --terms rose,maple,fern --pages 1 --details 3
+
+Each call counts against the key's daily quota (1 + details per page, per
+term and page). Existing fixtures are overwritten.
+"""
+
+import argparse
+import os
+
+from benchmarks.stub_perenual import Fixtures
+from perenual import PERENUAL_BASE_URL, PerenualClient
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def record(client, fixtures, terms, pages, details):
+    """Fetch and save every response; return how many were saved."""
+
+    saved = 0
+
+    for term in terms:
+        for page in range(1, pages + 1):
+            body = client.species_list(term, page)
+            fixtures.save(Fixtures.species_list_path(term, page), body)
+            saved += 1
+
+            for plant in body.get('data', [])[:details]:
+                fixtures.save(
+                    Fixtures.species_details_path(plant['id']),
+                    client.species_details(plant['id']),
+                )
+                saved += 1
+
+            if page >= body.get('last_page', page):
+                break
+
+    return saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--terms', default='rose,maple,fern')
+    parser.add_argument('--pages', type=int, default=1)
+    parser.add_argument('--details', type=int, default=3)
+    parser.add_argument('--out', default=FIXTURES_DIR)
+    parser.add_argument('--base-url', default=PERENUAL_BASE_URL)
+    args = parser.parse_args()
+
+    api_key = os.environ.get('PERENUAL_API_KEY')
+    if not api_key:
+        parser.error('PERENUAL_API_KEY must be set')
+
+    client = PerenualClient(api_key, base_url=args.base_url)
+    saved = record(
+        client, Fixtures(args.out), args.terms.split(','), args.pages,
+        args.details,
+    )
+
+    print(f'saved {saved} responses to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""Benchmark: concurrent searches one worker process can keep in flight.
+
+Starts a stub Perenual (benchmarks/stub_perenual.py) with a fixed latency,
+then, for each setup below, runs the app in a single gunicorn worker and
+fires --requests searches (POST /api/get-plant-list) for distinct terms,
+--concurrency at a time:
+
+    sync     gunicorn.conf.py with a sync worker (the old setup)
+    shipped  gunicorn.conf.py as deployed: a gthread worker with
+             GUNICORN_THREADS threads (--threads, default the config's)
+
+Reports throughput, latency percentiles and the peak number of requests
+the stub saw in flight at once, i.e. upstream concurrency per worker:
+
+    python -m benchmarks.search_concurrency --latency 0.2 --concurrency 200
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from benchmarks.stub_perenual import fetch_stats, start_in_process
+
+# gunicorn options on top of gunicorn.conf.py
+SETUPS = {
+    # a sync worker with threads > 1 would quietly become gthread
+    "sync": ["-k", "sync", "--threads", "1"],
+    "shipped": [],
+}
+
+SEARCH_PATH = "/api/get-plant-list"
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def app_env(stub_url, database_url):
+    """Environment for the app under test: stub upstream, no local search,
+    no prefetch, so every request makes exactly one upstream call.
+    """
+
+    return {
+        **os.environ,
+        "PERENUAL_API_KEY": "bench",
+        "FLASK_SECERT_KEY": "bench",
+        "METRICS_TOKEN": "bench",
+        "PERENUAL_BASE_URL": stub_url,
+        "DATABASE_URL": database_url,
+        "PLANT_SEARCH_MODE": "upstream",
+        "PERENUAL_PREFETCH_PAGES": "0",
+        "PERENUAL_READ_TIMEOUT": "60",
+    }
+
+
+def create_tables(env):
+    subprocess.run(
+        [sys.executable, "-c",
+         "from app import app; from models import db; "
+         "app.app_context().push(); db.create_all()"],
+        cwd=ROOT, env=env, check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def start_gunicorn(args, port, env):
+    """Start one gunicorn worker with the shipped gunicorn.conf.py, plus
+    args, on port.
+    """
+
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+         "-w", "1", *args,
+         "-b", f"127.0.0.1:{port}", "--timeout", "120", "app:app"],
+        cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+
+    proc.kill()
+    raise RuntimeError("gunicorn didn't start")
+
+
+async def fire(base_url, path, total, concurrency, run_id):
+    """POST total searches, concurrency at a time; return latencies and
+    the number of failures.
+    """
+
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+
+    async with aiohttp.ClientSession(
+        base_url, connector=connector, timeout=timeout
+    ) as client:
+
+        async def one(i):
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    async with client.post(
+                        path, json={"term": f"bench{run_id}x{i}"}
+                    ) as resp:
+                        ok = resp.status == 200 and "data" in await resp.json()
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                failures += not ok
+
+        await asyncio.gather(*(one(i) for i in range(total)))
+
+    return latencies, failures
+
+
+def percentile(values, pct):
+    return statistics.quantiles(values, n=100)[pct - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument(
+        "--setups", default="sync,shipped",
+        help="comma-separated subset of: " + ", ".join(SETUPS),
+    )
+    args = parser.parse_args()
+
+    stub, stub_url = start_in_process(free_port(), latency=args.latency)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database_url = os.environ.get(
+            "DATABASE_URL", f"sqlite:///{tmpdir}/bench.db"
+        )
+        env = app_env(stub_url, database_url)
+        if args.threads:
+            env["GUNICORN_THREADS"] = str(args.threads)
+            env["PERENUAL_POOL_MAXSIZE"] = str(args.threads)
+        create_tables(env)
+
+        print(f"upstream latency {args.latency * 1000:.0f} ms, "
+              f"{args.requests} requests, {args.concurrency} concurrent\n")
+        print(f"{'setup':8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'errors':>7} {'peak upstream in flight':>24}")
+
+        for run_id, name in enumerate(args.setups.split(",")):
+            port = free_port()
+            proc = start_gunicorn(SETUPS[name], port, env)
+
+            try:
+                fetch_stats(stub_url, reset=True)
+                start = time.perf_counter()
+                latencies, failures = asyncio.run(fire(
+                    f"http://127.0.0.1:{port}", SEARCH_PATH, args.requests,
+                    args.concurrency, run_id,
+                ))
+                elapsed = time.perf_counter() - start
+
+            finally:
+                proc.terminate()
+                proc.wait()
+
+            print(
+                f"{name:8} {args.requests / elapsed:8.1f} "
+                f"{percentile(latencies, 50) * 1000:8.0f} "
+                f"{percentile(latencies, 95) * 1000:8.0f} "
+                f"{failures:7d} "
+                f"{fetch_stats(stub_url)['peak_in_flight']:24d}"
+            )
+
+    stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark: size and encoding time of one page of search results.
+
+Compares the raw Perenual species-list page the search API used to pass
+through with the trimmed results it sends now (see search_results_page),
+under each JSON provider available (json_providers):
+
+    python -m benchmarks.search_payload --page-size 30 --number 2000
+
+Reports bytes on the wire (plain and gzipped) and the median time to encode
+one page, plus the one-off cost of trimming a page (done once per fetch;
+the trimmed page is what gets cached).
+"""
+
+import argparse
+import gzip
+import statistics
+import timeit
+
+from flask import Flask
+
+from app import search_results_page
+from benchmarks.stub_perenual import species_list_page
+from json_providers import make_json_provider, orjson
+from models import Plant
+
+
+def trim(raw, page):
+    rows = [Plant.from_perenual(plant) for plant in raw["data"]]
+    return search_results_page(rows, raw, page)
+
+
+def median_us(func, number, repeat):
+    """Median microseconds per call of func, over repeat runs of number."""
+
+    runs = timeit.repeat(func, number=number, repeat=repeat)
+    return statistics.median(runs) / number * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=30)
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    raw = species_list_page("maple", 1, args.page_size, 10)
+    payloads = {"raw": raw, "trimmed": trim(raw, 1)}
+
+    app = Flask(__name__)
+    providers = ["default"] + (["orjson"] if orjson is not None else [])
+
+    print(f"one page of {args.page_size} plants\n")
+    print(f"{'payload':10}{'bytes':>10}{'gzipped':>10}" + "".join(
+        f"{name + ' us':>14}" for name in providers
+    ))
+
+    for label, payload in payloads.items():
+        body = make_json_provider(app, "default").dumps(payload).encode()
+        timings = [
+            median_us(
+                lambda provider=make_json_provider(app, name):
+                    provider.dumps(payload),
+                args.number, args.repeat,
+            )
+            for name in providers
+        ]
+
+        print(
+            f"{label:10}{len(body):10}{len(gzip.compress(body)):10}"
+            + "".join(f"{us:14.1f}" for us in timings)
+        )
+
+    trim_us = median_us(lambda: trim(raw, 1), args.number // 10, args.repeat)
+    print(f"\ntrimming a fetched page: {trim_us:.1f} us")
+
+    if orjson is None:
+        print("(orjson is not installed; only the default provider was run)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Benchmark: how long a fresh process takes to serve its first response.
+
+For each config profile, starts --runs fresh interpreters that each import
+the app module, call create_app() and GET / with the test client, timing
+every step (and the whole process, interpreter start included). Reports
+medians:
+
+    python -m benchmarks.startup --profiles production,development
+
+With --budget MS, exits non-zero if any profile's median whole-process time
+(interpreter start to first response) is over MS milliseconds, so it can
+guard a CI job. --importtime lists the modules that cost the most to import
+(python -X importtime).
+
+Uses a throwaway SQLite database; GET / doesn't query it.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+flask_app = app_module.create_app({profile!r})
+created = time.perf_counter()
+with flask_app.test_client() as client:
+    status = client.get('/').status_code
+responded = time.perf_counter()
+print(json.dumps({{
+    "import": imported - start,
+    "create_app": created - imported,
+    "first_response": responded - created,
+    "status": status,
+}}))
+"""
+
+STEPS = ("import", "create_app", "first_response", "process")
+
+
+def app_env(database_url):
+    return {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "TEST_DATABASE_URL": database_url,
+        "PERENUAL_API_KEY": "bench",
+        "FLASK_SECERT_KEY": "bench",
+        "METRICS_TOKEN": "bench",
+    }
+
+
+def run_once(profile, env):
+    """Time one fresh process; return a dict of seconds per step."""
+
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD.format(profile=profile)],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    if timings.pop("status") != 200:
+        raise RuntimeError(f"GET / failed under the {profile} profile")
+
+    timings["process"] = elapsed
+    return timings
+
+
+def import_costs(env, top):
+    """Return the top (cumulative microseconds, module) import costs."""
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+    )
+
+    costs = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, module = line[len("import time:"):].split("|")
+        costs.append((int(cumulative), module.rstrip()))
+
+    return sorted(costs, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--profiles", default="production,development")
+    parser.add_argument(
+        "--budget", type=float,
+        help="fail if the median whole-process time exceeds this many ms",
+    )
+    parser.add_argument(
+        "--importtime", type=int, default=0, metavar="N",
+        help="also list the N most expensive imports",
+    )
+    args = parser.parse_args()
+
+    over_budget = []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = app_env(f"sqlite:///{tmpdir}/bench.db")
+
+        print(f"median of {args.runs} fresh processes, ms\n")
+        print(f"{'profile':12}" + "".join(f"{step:>16}" for step in STEPS))
+
+        for profile in args.profiles.split(","):
+            runs = [run_once(profile, env) for _ in range(args.runs)]
+            medians = {
+                step: statistics.median(run[step] for run in runs) * 1000
+                for step in STEPS
+            }
+
+            print(f"{profile:12}" + "".join(
+                f"{medians[step]:16.1f}" for step in STEPS
+            ))
+
+            if args.budget and medians["process"] > args.budget:
+                over_budget.append(profile)
+
+        if args.importtime:
+            print("\nmost expensive imports (cumulative ms):")
+            for cumulative, module in import_costs(env, args.importtime):
+                print(f"{cumulative / 1000:10.1f}  {module}")
+
+    if over_budget:
+        sys.exit(
+            f"over the {args.budget:.0f} ms startup budget: "
+            + ", ".join(over_budget)
+        )
+
+
+if __name__ == "__main__":
+    main()
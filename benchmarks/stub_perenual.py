@@ -0,0 +1,348 @@
+"""Local stand-in for the Perenual API, for benchmarks.
+
+Serves /api/species-list and /api/species/details/<id>, and
+/storage/<id>/<name>.jpg with made-up images (needs Pillow), after an
+artificial delay (latency, plus up to jitter more), and tracks how many
+requests it has in flight at once (GET /__stats). Run it on its own:
+
+    python -m benchmarks.stub_perenual --port 8765 --latency 0.2
+
+Species responses come from recorded fixtures (see
+benchmarks/record_fixtures.py) when --fixtures has one for the request, and
+are made up otherwise. --error-rate answers that share of requests with a
+503; --padding adds that many bytes to every species-list item, to see what
+bigger upstream payloads cost.
+
+then point the app at it with PERENUAL_BASE_URL=http://127.0.0.1:8765/api.
+GET /__stats?reset returns the counters and resets the peak.
+"""
+
+import argparse
+import functools
+import io
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from urllib.request import urlopen
+
+
+class StubStats:
+    """Request counters shared by all handler threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def enter(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.peak_in_flight = self.in_flight
+
+
+def fake_plant(plant_id, term=''):
+    """Return a species-list "data" item shaped like Perenual's."""
+
+    name = f'{term or "plant"} {plant_id}'.strip()
+
+    return {
+        "id": plant_id,
+        "common_name": name.title(),
+        "scientific_name": [f'Plantae {name}'],
+        "other_name": [],
+        "cycle": "Perennial",
+        "watering": "Average",
+        "sunlight": ["full sun", "part shade"],
+        "default_image": {
+            "license": 45,
+            "license_name": "Attribution-ShareAlike 3.0 Unported",
+            "original_url": f'https://perenual.com/storage/{plant_id}/og.jpg',
+            "regular_url": f'https://perenual.com/storage/{plant_id}/reg.jpg',
+            "medium_url": f'https://perenual.com/storage/{plant_id}/med.jpg',
+            "small_url": f'https://perenual.com/storage/{plant_id}/small.jpg',
+            "thumbnail": f'https://perenual.com/storage/{plant_id}/thumb.jpg',
+        },
+    }
+
+
+def species_list_page(term, page, page_size, last_page):
+    """Return a species-list response body for term and page."""
+
+    # stable ids per term, so repeat searches hit the same rows
+    base = (zlib.crc32(term.encode()) % 100_000) * 1000 + (page - 1) * page_size
+
+    return {
+        "data": [
+            fake_plant(base + offset + 1, term) for offset in range(page_size)
+        ],
+        "to": page * page_size,
+        "per_page": page_size,
+        "current_page": page,
+        "from": (page - 1) * page_size + 1,
+        "last_page": last_page,
+        "total": last_page * page_size,
+    }
+
+
+class Fixtures:
+    """Recorded Perenual responses in directory, laid out as
+    record_fixtures writes them:
+
+        species-list/<term>-<page>.json
+        species-details/<id>.json
+
+    Files are read once and kept in memory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def species_list_path(term, page):
+        slug = re.sub(r'[^a-z0-9]+', '_', term.lower()).strip('_') or '_'
+        return os.path.join('species-list', f'{slug}-{page}.json')
+
+    @staticmethod
+    def species_details_path(plant_id):
+        return os.path.join('species-details', f'{plant_id}.json')
+
+    def species_list(self, term, page):
+        """Return the recorded species-list body for term and page, or None."""
+
+        return self._load(self.species_list_path(term, page))
+
+    def species_details(self, plant_id):
+        """Return the recorded details body for plant_id, or None."""
+
+        return self._load(self.species_details_path(plant_id))
+
+    def save(self, path, body):
+        """Write body to path (one of the paths above)."""
+
+        path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'w') as fixture:
+            json.dump(body, fixture, indent=1, sort_keys=True)
+            fixture.write('\n')
+
+    def _load(self, path):
+        with self._lock:
+            if path not in self._cache:
+                try:
+                    with open(os.path.join(self.directory, path)) as fixture:
+                        self._cache[path] = json.load(fixture)
+                except FileNotFoundError:
+                    self._cache[path] = None
+
+            return self._cache[path]
+
+
+def padded(body, padding):
+    """Return a species-list body with padding bytes added to every item."""
+
+    if not padding:
+        return body
+
+    return {
+        **body,
+        "data": [{**plant, "padding": "x" * padding} for plant in body["data"]],
+    }
+
+
+@functools.lru_cache(maxsize=64)
+def fake_image(plant_id, width=1200, height=900):
+    """Return JPEG bytes of a width x height image, colored by plant_id."""
+
+    from PIL import Image
+
+    color = (plant_id * 47 % 256, plant_id * 91 % 256, plant_id * 13 % 256)
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(out, 'JPEG', quality=90)
+
+    return out.getvalue()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers Perenual-style GETs; settings live on the server."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = {key: vals[0] for key, vals in parse_qs(url.query).items()}
+
+        if url.path == '/__stats':
+            stats = server.stats.as_dict()
+            if 'reset' in query:
+                server.stats.reset()
+            return self.send_json(200, stats)
+
+        server.stats.enter()
+
+        try:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+
+            if random.random() < server.error_rate:
+                return self.send_json(503, {"message": "stub error"})
+
+            if url.path == '/api/species-list':
+                term = query.get('q') or ''
+                page = int(query.get('page', 1))
+                body = (
+                    server.fixtures and server.fixtures.species_list(term, page)
+                ) or species_list_page(
+                    term, page, server.page_size, server.last_page
+                )
+                return self.send_json(200, padded(body, server.padding))
+
+            if url.path.startswith('/api/species/details/'):
+                plant_id = int(url.path.rsplit('/', 1)[1])
+                body = (
+                    server.fixtures and server.fixtures.species_details(plant_id)
+                ) or fake_plant(plant_id)
+                return self.send_json(200, body)
+
+            if url.path.startswith('/storage/'):
+                plant_id = int(url.path.split('/')[2])
+                return self.send_body(200, 'image/jpeg', fake_image(plant_id))
+
+            return self.send_json(404, {"message": "not found"})
+
+        finally:
+            server.stats.leave()
+
+    def send_json(self, status, body):
+        self.send_body(status, 'application/json', json.dumps(body).encode())
+
+    def send_body(self, status, content_type, payload):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        """Keep benchmark output quiet."""
+
+
+class StubServer(ThreadingHTTPServer):
+    """Thread-per-connection server with a listen backlog deep enough for
+    hundreds of simultaneous connects.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def make_server(host='127.0.0.1', port=0, latency=0.2, error_rate=0.0,
+                page_size=30, last_page=5, jitter=0.0, padding=0,
+                fixtures=None):
+    """Return a stub server (not yet serving); port 0 picks a free port.
+    fixtures is a directory of recorded responses, or None.
+    """
+
+    server = StubServer((host, port), StubHandler)
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.page_size = page_size
+    server.last_page = last_page
+    server.padding = padding
+    server.fixtures = fixtures and Fixtures(fixtures)
+    server.stats = StubStats()
+
+    return server
+
+
+def start_in_thread(**settings):
+    """Start a stub server in a daemon thread; return (server, base_url)."""
+
+    server = make_server(**settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    host, port = server.server_address
+    return server, f'http://{host}:{port}/api'
+
+
+def start_in_process(port, **settings):
+    """Start a stub server in a child process, so it doesn't share a GIL
+    with the load generator; returns (process, base_url) once it's up.
+    """
+
+    args = [sys.executable, '-m', 'benchmarks.stub_perenual', '--port', str(port)]
+    for name, value in settings.items():
+        args += [f'--{name.replace("_", "-")}', str(value)]
+
+    proc = subprocess.Popen(args, stdout=subprocess.DEVNULL)
+    stats_url = f'http://127.0.0.1:{port}/__stats'
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            urlopen(stats_url, timeout=0.5).close()
+            return proc, f'http://127.0.0.1:{port}/api'
+        except OSError:
+            time.sleep(0.05)
+
+    proc.kill()
+    raise RuntimeError('stub Perenual did not start')
+
+
+def fetch_stats(base_url, reset=False):
+    """Return the stats of a stub server started with start_in_process."""
+
+    url = base_url.rsplit('/api', 1)[0] + '/__stats' + ('?reset' if reset else '')
+    with urlopen(url) as resp:
+        return json.loads(resp.read())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--page-size', type=int, default=30)
+    parser.add_argument('--last-page', type=int, default=5)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--padding', type=int, default=0)
+    parser.add_argument('--fixtures')
+    args = parser.parse_args()
+
+    stub = make_server(
+        args.host, args.port, args.latency, args.error_rate, args.page_size,
+        args.last_page, args.jitter, args.padding, args.fixtures,
+    )
+    print(f'Stub Perenual on http://{args.host}:{args.port}/api')
+    stub.serve_forever()
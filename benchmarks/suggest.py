@@ -0,0 +1,120 @@
+"""Benchmark: /api/suggest's prefix index at catalog sizes.
+
+Builds a SuggestIndex of --sizes made-up plants (two- or three-word common
+names, one or two scientific names), then times lookups of random 1 to 6
+character prefixes of real names, adding plants one by one (as
+store_species_page does), and writing and loading its snapshot:
+
+    python -m benchmarks.suggest --sizes 10000,100000,300000 --lookups 20000
+
+Reports p50/p99 microseconds per lookup and per add, seconds to build and
+to load the snapshot, and the snapshot's size. Needs no database.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.search_concurrency import percentile
+from suggest import SuggestIndex
+
+WORDS = (
+    'red white golden dwarf giant sugar silver japanese creeping weeping '
+    'mountain swamp sweet wild common black blue spotted climbing desert '
+    'maple rose fern oak pine lily fir orchid ivy palm sage mint aster '
+    'violet moss thistle laurel willow birch poppy daisy tulip'
+).split()
+
+GENERA = (
+    'acer rosa abies quercus pinus lilium hedera salvia mentha aster viola '
+    'salix betula papaver tulipa ficus citrus prunus malus juniperus'
+).split()
+
+
+def made_up_plants(count, rng):
+    """Return count (id, common name, scientific names) tuples."""
+
+    plants = []
+
+    for plant_id in range(1, count + 1):
+        common_name = ' '.join(
+            rng.choice(WORDS) for _ in range(rng.choice((2, 2, 3)))
+        ).title()
+        scientific_names = [
+            f'{rng.choice(GENERA).title()} {rng.choice(WORDS)}{plant_id}'
+            for _ in range(rng.choice((1, 1, 2)))
+        ]
+        plants.append((plant_id, common_name, scientific_names))
+
+    return plants
+
+
+def time_each(calls):
+    """Run every call; return its times in microseconds."""
+
+    times = []
+
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        times.append((time.perf_counter() - start) * 1_000_000)
+
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,300000')
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--adds', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'plants':>8}{'build s':>9}{'load s':>8}{'snapshot':>10}"
+          f"{'lookup p50':>12}{'p99 us':>8}{'add p50':>9}{'p99 us':>8}")
+
+    for size in (int(size) for size in args.sizes.split(',')):
+        rng = random.Random(args.seed)
+        plants = made_up_plants(size + args.adds, rng)
+        existing, new = plants[:size], plants[size:]
+
+        index = SuggestIndex()
+        start = time.perf_counter()
+        index.load(existing)
+        build = time.perf_counter() - start
+
+        prefixes = []
+        for _ in range(args.lookups):
+            _id, common_name, scientific_names = rng.choice(existing)
+            name = rng.choice((common_name, *scientific_names)).lower()
+            words = name.split()
+            name = ' '.join(words[rng.randrange(len(words)):])
+            prefixes.append(name[:rng.randint(1, 6)])
+
+        lookups = time_each(
+            lambda prefix=prefix: index.complete(prefix)
+            for prefix in prefixes
+        )
+        adds = time_each(
+            lambda plant=plant: index.add([plant]) for plant in new
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'suggest.json.gz')
+            index.save(path)
+            snapshot_mb = os.path.getsize(path) / 1024 / 1024
+
+            start = time.perf_counter()
+            SuggestIndex().load_snapshot(path)
+            load = time.perf_counter() - start
+
+        print(f"{size:8}{build:9.2f}{load:8.2f}{snapshot_mb:8.1f}MB"
+              f"{percentile(lookups, 50):12.1f}"
+              f"{percentile(lookups, 99):8.1f}"
+              f"{percentile(adds, 50):9.1f}{percentile(adds, 99):8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Configuration profiles for Plant App.
+
+create_app() takes a profile name (or a Config instance); without one it
+uses the PLANT_APP_CONFIG environment variable, defaulting to "production":
+
+    PLANT_APP_CONFIG=development flask run --debug
+
+Settings are read from the environment when a profile is instantiated, not
+when this module is imported.
+"""
+
+import os
+from datetime import timedelta
+
+from passwords import DEFAULT_ROUNDS
+from perenual import PERENUAL_BASE_URL
+
+
+TRUTHY = {'1', 'true', 'yes'}
+
+
+def env(name, default=None, cast=str):
+    """Return environment variable name, cast, or default if it's unset."""
+
+    value = os.environ.get(name)
+    return default if value is None else cast(value)
+
+
+def env_flag(name, default=False):
+    """Return environment variable name as a bool ("1", "true", "yes" are
+    true).
+    """
+
+    return env(name, default, lambda value: value.lower() in TRUTHY)
+
+
+class Config:
+    """Settings shared by every profile."""
+
+    SQLALCHEMY_ECHO = False
+    WTF_CSRF_ENABLED = False
+    DEBUG_TB_ENABLED = False
+
+    def __init__(self):
+        self.SQLALCHEMY_DATABASE_URI = env('DATABASE_URL')
+        self.SECRET_KEY = env('FLASK_SECERT_KEY', 'sssshhhh')
+
+        # "json" (one object per line), "text", or None to leave logging alone
+        self.LOG_FORMAT = env('LOG_FORMAT', 'json')
+        self.LOG_LEVEL = env('LOG_LEVEL', 'INFO')
+        # if set, /metrics requires "Authorization: Bearer <token>";
+        # production won't start without one
+        self.METRICS_TOKEN = env('METRICS_TOKEN')
+
+        # part of every ETag, so a deploy (with new templates) invalidates
+        # what browsers and CDNs have cached
+        self.RELEASE = env('RELEASE', env('RENDER_GIT_COMMIT', ''))
+        # "auto", "orjson" or "default"; see json_providers
+        self.JSON_PROVIDER = env('JSON_PROVIDER', 'auto')
+
+        # how long browsers/CDNs may reuse a logged-out plant page
+        self.PLANT_PAGE_MAX_AGE = env('PLANT_PAGE_MAX_AGE', 300, int)
+
+        self.PERENUAL_API_KEY = env('PERENUAL_API_KEY')
+        # several keys (comma-separated) to spread calls over; defaults to
+        # just PERENUAL_API_KEY
+        self.PERENUAL_API_KEYS = env(
+            'PERENUAL_API_KEYS', None, lambda value: value.split(',')
+        )
+        if self.PERENUAL_API_KEYS and not self.PERENUAL_API_KEY:
+            self.PERENUAL_API_KEY = self.PERENUAL_API_KEYS[0]
+        self.PERENUAL_BASE_URL = env('PERENUAL_BASE_URL', PERENUAL_BASE_URL)
+        self.PERENUAL_CONNECT_TIMEOUT = env(
+            'PERENUAL_CONNECT_TIMEOUT', 3.05, float
+        )
+        self.PERENUAL_READ_TIMEOUT = env('PERENUAL_READ_TIMEOUT', 10, float)
+        self.PERENUAL_RETRIES = env('PERENUAL_RETRIES', 2, int)
+        # keep-alive connections per worker; one per gunicorn thread (see
+        # gunicorn.conf.py)
+        self.PERENUAL_POOL_MAXSIZE = env('PERENUAL_POOL_MAXSIZE', 32, int)
+
+        # Perenual's limits per key (0: none); see quota. The buckets live
+        # in PERENUAL_QUOTA_DB, default <instance path>/perenual_quota.db,
+        # which must be on a disk every worker shares.
+        self.PERENUAL_RATE_PER_MINUTE = env('PERENUAL_RATE_PER_MINUTE', 0, int)
+        self.PERENUAL_QUOTA_PER_DAY = env('PERENUAL_QUOTA_PER_DAY', 0, int)
+        # share of each limit background calls (prefetch, detail refresh)
+        # leave for users' searches
+        self.PERENUAL_BACKGROUND_RESERVE = env(
+            'PERENUAL_BACKGROUND_RESERVE', 0.25, float
+        )
+        # how long a search may wait for a token before giving up
+        self.PERENUAL_QUOTA_MAX_WAIT = env('PERENUAL_QUOTA_MAX_WAIT', 5, float)
+        self.PERENUAL_QUOTA_DB = env('PERENUAL_QUOTA_DB')
+
+        # Perenual species-list responses cached in-process
+        self.PERENUAL_CACHE_TTL = env('PERENUAL_CACHE_TTL', 60 * 60, int)
+        self.PERENUAL_CACHE_MAX_ENTRIES = env(
+            'PERENUAL_CACHE_MAX_ENTRIES', 1024, int
+        )
+        self.PERENUAL_CACHE_MAX_BYTES = env(
+            'PERENUAL_CACHE_MAX_BYTES', 32 * 1024 * 1024, int
+        )
+
+        # how many pages past the one asked for to fetch in the background,
+        # and how many threads do it
+        self.PERENUAL_PREFETCH_PAGES = env('PERENUAL_PREFETCH_PAGES', 2, int)
+        self.PERENUAL_PREFETCH_WORKERS = env(
+            'PERENUAL_PREFETCH_WORKERS', 4, int
+        )
+
+        # set to a directory (on local disk, shared by the workers) to
+        # coalesce identical searches across workers too, not just threads;
+        # results are shared for SEARCH_SHARED_FLIGHT_TTL seconds
+        self.SEARCH_SHARED_FLIGHT_DIR = env('SEARCH_SHARED_FLIGHT_DIR')
+        self.SEARCH_SHARED_FLIGHT_TTL = env(
+            'SEARCH_SHARED_FLIGHT_TTL', 10, int
+        )
+
+        # "local-first" answers searches from the plants table when it has
+        # enough matches (refreshing, in the background, ones older than
+        # LOCAL_SEARCH_MAX_AGE); "upstream" always asks Perenual
+        self.PLANT_SEARCH_MODE = env('PLANT_SEARCH_MODE', 'local-first')
+        self.LOCAL_SEARCH_MIN_RESULTS = env(
+            'LOCAL_SEARCH_MIN_RESULTS', 10, int
+        )
+        self.LOCAL_SEARCH_MAX_AGE = timedelta(
+            days=env('LOCAL_SEARCH_MAX_AGE_DAYS', 7, int)
+        )
+
+        # /api/suggest's in-memory index of plant names (see suggest) is
+        # loaded from this snapshot, default <instance path>/
+        # suggest_index.json.gz, and catches up with plants other workers
+        # stored every SUGGEST_REFRESH_SECONDS
+        self.SUGGEST_SNAPSHOT = env('SUGGEST_SNAPSHOT')
+        self.SUGGEST_REFRESH_SECONDS = env('SUGGEST_REFRESH_SECONDS', 60, int)
+
+        # a plant's species details are refreshed in the background once
+        # they're this old
+        self.PLANT_DETAILS_MAX_AGE = timedelta(
+            days=env('PLANT_DETAILS_MAX_AGE_DAYS', 30, int)
+        )
+
+        self.USER_CACHE_TTL = env('USER_CACHE_TTL', 30, int)
+
+        # plant image thumbnails (see thumbnails); the directory defaults to
+        # <instance path>/thumbnails. Set USE_X_SENDFILE=1 behind a server
+        # that can send the files itself.
+        self.THUMBNAIL_DIR = env('THUMBNAIL_DIR')
+        self.THUMBNAIL_CACHE_MAX_BYTES = env(
+            'THUMBNAIL_CACHE_MAX_BYTES', 256 * 1024 * 1024, int
+        )
+        # hosts (and their subdomains) the image proxy may fetch from
+        self.THUMBNAIL_HOSTS = env(
+            'THUMBNAIL_HOSTS', ['perenual.com'], lambda value: value.split(',')
+        )
+        self.USE_X_SENDFILE = env_flag('USE_X_SENDFILE')
+
+        # bcrypt work factor for new hashes; older hashes are upgraded on login
+        self.BCRYPT_LOG_ROUNDS = env('BCRYPT_LOG_ROUNDS', DEFAULT_ROUNDS, int)
+        self.PASSWORD_HASH_WORKERS = env('PASSWORD_HASH_WORKERS', 2, int)
+        self.PASSWORD_HASH_MAX_PENDING = env(
+            'PASSWORD_HASH_MAX_PENDING', 32, int
+        )
+
+
+class DevelopmentConfig(Config):
+    """Local development: debug toolbar on, SQL echo if asked for."""
+
+    DEBUG_TB_ENABLED = True
+    DEBUG_TB_INTERCEPT_REDIRECTS = True
+
+    def __init__(self):
+        super().__init__()
+        self.SQLALCHEMY_ECHO = env_flag('SQLALCHEMY_ECHO')
+        self.LOG_FORMAT = env('LOG_FORMAT', 'text')
+        self.LOG_LEVEL = env('LOG_LEVEL', 'DEBUG')
+
+
+class TestingConfig(Config):
+    """Test suite: its own database, cheap hashes, no upstream key needed."""
+
+    TESTING = True
+
+    def __init__(self):
+        super().__init__()
+        self.SQLALCHEMY_DATABASE_URI = env(
+            'TEST_DATABASE_URL', 'postgresql:///plant_app_test'
+        )
+        self.PERENUAL_API_KEY = env('PERENUAL_API_KEY', 'test')
+        self.BCRYPT_LOG_ROUNDS = 4
+        self.LOG_FORMAT = None
+
+
+class ProductionConfig(Config):
+    """Deployed app. Requires DATABASE_URL, PERENUAL_API_KEY,
+    FLASK_SECERT_KEY and METRICS_TOKEN.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # no default: sessions signed with a known key can be forged
+        self.SECRET_KEY = env('FLASK_SECERT_KEY')
+
+        for name in ('SQLALCHEMY_DATABASE_URI', 'PERENUAL_API_KEY',
+                     'SECRET_KEY', 'METRICS_TOKEN'):
+            if not getattr(self, name):
+                raise RuntimeError(f'{name} must be set in production')
+
+
+PROFILES = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
+
+
+def load_config(config=None):
+    """Return a Config for config: a profile name, a Config (returned
+    as-is), or None for the PLANT_APP_CONFIG profile.
+    """
+
+    if isinstance(config, Config):
+        return config
+
+    name = config or env('PLANT_APP_CONFIG', 'production')
+
+    try:
+        return PROFILES[name]()
+
+    except KeyError:
+        raise ValueError(
+            f'Unknown config profile {name!r}; '
+            f'use one of {", ".join(PROFILES)}'
+        ) from None
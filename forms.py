@@ -1,8 +1,12 @@
 """Forms for Plant App."""
 
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SelectField, PasswordField
-from wtforms.validators import InputRequired, URL, Optional, Email, Length
+from wtforms import (
+    StringField, TextAreaField, SelectField, PasswordField, IntegerField
+)
+from wtforms.validators import (
+    InputRequired, URL, Optional, Email, Length, NumberRange
+)
 
 
 class PlantSearchForm(FlaskForm):
@@ -13,6 +17,29 @@ class PlantSearchForm(FlaskForm):
         validators=[InputRequired(), Length(max=30)],
     )
 
+    # nobody pages this far by hand; past it, a page number is only a way
+    # to make us ask Perenual for pages that don't exist
+    page = IntegerField(
+        "Page",
+        validators=[Optional(), NumberRange(min=1, max=100)],
+    )
+
+    # facet filters; see Plant.facet_filters
+    cycle = StringField(
+        "Cycle",
+        validators=[Optional(), Length(max=50)],
+    )
+
+    watering = StringField(
+        "Watering",
+        validators=[Optional(), Length(max=50)],
+    )
+
+    sunlight = StringField(
+        "Sunlight",
+        validators=[Optional(), Length(max=50)],
+    )
+
 
 class SignupForm(FlaskForm):
     """Form for registering/adding new user."""
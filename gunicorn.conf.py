@@ -0,0 +1,24 @@
+"""gunicorn settings for Plant App; gunicorn reads this file from the working
+directory, so the start command is just:
+
+    gunicorn app:app
+
+Each worker is a gthread worker: a search mostly waits on Perenual, and
+while it does, the worker's other threads keep serving. With sync workers,
+one slow upstream call held a whole worker. Every setting can be changed
+from the environment (or overridden on the command line).
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# requests each worker serves at once; they mostly wait on Perenual or the
+# db, so this is well above the CPU count. PERENUAL_POOL_MAXSIZE should
+# match it, or threads past the pool size open connections they can't keep.
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+
+# long enough for a search that waits on Perenual's timeouts and retries
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
@@ -0,0 +1,82 @@
+"""JSON encoding for Plant App responses.
+
+The JSON_PROVIDER setting picks the provider create_app() installs:
+
+    "orjson"   OrjsonProvider; needs the optional orjson package
+    "default"  Flask's own, built on the json module
+    "auto"     orjson if it's installed, else Flask's (the default)
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with orjson doing the encoding and decoding.
+
+    Output matches Flask's: dates still go through Flask's default(), so
+    they come out as HTTP dates, not ISO strings. Keys aren't sorted unless
+    sort_keys is set. Calls with json module options (which orjson doesn't
+    have) are passed to Flask's provider.
+    """
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        # json module options (e.g. the session serializer's separators)
+        # have no orjson equivalent
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+
+        return self._dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        # e.g. the session serializer's object_hook
+        if kwargs:
+            return super().loads(s, **kwargs)
+
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+
+        return self._app.response_class(
+            self._dumps_bytes(obj), mimetype=self.mimetype
+        )
+
+    def _dumps_bytes(self, obj):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+
+        if self.compact is False or (self.compact is None and self._app.debug):
+            option |= orjson.OPT_INDENT_2
+
+        return orjson.dumps(obj, default=self.default, option=option)
+
+
+def make_json_provider(app, name='auto'):
+    """Return the JSON provider called name (see above) for app."""
+
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'default'
+
+    if name == 'orjson':
+        if orjson is None:
+            raise RuntimeError(
+                'JSON_PROVIDER is "orjson", but orjson is not installed'
+            )
+        return OrjsonProvider(app)
+
+    if name == 'default':
+        provider = DefaultJSONProvider(app)
+        # sorting buys nothing for an API read by our own JS
+        provider.sort_keys = False
+        return provider
+
+    raise ValueError(f'Unknown JSON_PROVIDER {name!r}')
@@ -0,0 +1,319 @@
+"""Request, database and upstream metrics for Plant App, served at /metrics
+in the Prometheus text format.
+
+Metrics are kept per process: under gunicorn with several workers, each
+scrape of /metrics sees the worker that answered it. Scrape each worker (or
+run one worker per container) to see them all.
+"""
+
+import bisect
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# seconds; Prometheus client defaults
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 7.5, 10,
+)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(names, values, extra=''):
+    """Format label names and values as {a="1",b="2"} (or '' if none)."""
+
+    pairs = [
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('"', '\\"')
+        .replace('\n', '\\n')
+    )
+
+
+def _format_value(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class Counter:
+    """Monotonic count, optionally split by labels."""
+
+    type = 'counter'
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """Yield (suffix, label text, value) for every labelled value."""
+
+        with self._lock:
+            values = dict(self._values)
+
+        for key, value in sorted(values.items()):
+            yield '', _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Distribution of observed values over fixed buckets, optionally split
+    by labels.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, description, labelnames=(),
+                 buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0]
+
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total)
+                      for key, (counts, total) in self._values.items()}
+
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield (
+                    '_bucket',
+                    _format_labels(self.labelnames, key, le),
+                    cumulative,
+                )
+
+            labels = _format_labels(self.labelnames, key)
+            yield '_sum', labels, total
+            yield '_count', labels, cumulative
+
+
+class Gauge:
+    """Current values, read from collect() at scrape time.
+
+    collect returns an iterable of (label values tuple, value).
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, description, collect, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._collect = collect
+
+    def samples(self):
+        for key, value in self._collect():
+            yield '', _format_labels(self.labelnames, key), value
+
+
+class Registry:
+    """A set of metrics that render together as one /metrics page."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def add(self, metric):
+        """Register metric (replacing one of the same name); return it."""
+
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text format."""
+
+        lines = []
+
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+
+            for suffix, labels, value in metric.samples():
+                lines.append(
+                    f'{metric.name}{suffix}{labels} {_format_value(value)}'
+                )
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.add(Histogram(
+    'plant_app_request_duration_seconds',
+    'Time to handle a request, by route.',
+    ('method', 'route', 'status'),
+))
+REQUEST_SQL_QUERIES = registry.add(Histogram(
+    'plant_app_request_sql_queries',
+    'SQL statements run per request, by route.',
+    ('route',),
+    buckets=COUNT_BUCKETS,
+))
+REQUEST_SQL_TIME = registry.add(Histogram(
+    'plant_app_request_sql_duration_seconds',
+    'Time spent in SQL statements per request, by route.',
+    ('route',),
+))
+SQL_QUERIES = registry.add(Counter(
+    'plant_app_sql_queries_total',
+    'SQL statements run, in or out of requests.',
+))
+POOL_CHECKOUT_WAIT = registry.add(Histogram(
+    'plant_app_db_pool_checkout_wait_seconds',
+    'Time spent waiting for a db connection from the pool.',
+))
+PERENUAL_LATENCY = registry.add(Histogram(
+    'plant_app_perenual_request_duration_seconds',
+    'Perenual API call latency, by client and response status.',
+    ('client', 'status'),
+))
+
+
+def register_stats(prefix, stats, description):
+    """Export each value of a stats() dict (e.g. TTLCache.stats) as a gauge
+    named prefix_key, read fresh at every scrape.
+    """
+
+    for key in stats():
+        registry.add(Gauge(
+            f'{prefix}_{key}',
+            f'{description}: {key}.',
+            lambda key=key: [((), stats()[key])],
+        ))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a
+    connection, into POOL_CHECKOUT_WAIT.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+
+        try:
+            return super()._do_get()
+
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+def request_route():
+    """The matched URL rule (e.g. /plants/<int:plant_id>), a low-cardinality
+    label for the current request.
+    """
+
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def perenual_listener(client_name):
+    """Return a PerenualClient on_request callback feeding PERENUAL_LATENCY."""
+
+    def on_request(elapsed, status):
+        PERENUAL_LATENCY.observe(
+            elapsed, client=client_name, status=status or 'error'
+        )
+
+    return on_request
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    SQL_QUERIES.inc()
+
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+        g.sql_time += elapsed
+
+
+def _handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_start'):
+        conn.info['query_start'].pop()
+
+
+def instrument_engine(engine):
+    """Count and time every SQL statement run on engine."""
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+def start_request():
+    """Start the clock and SQL counters for the current request."""
+
+    g.request_start = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_time = 0.0
+
+
+def finish_request(response):
+    """Record the current request's metrics; return a dict of them (for the
+    request log line).
+    """
+
+    route = request_route()
+    elapsed = time.perf_counter() - g.request_start
+
+    REQUEST_LATENCY.observe(
+        elapsed, method=request.method, route=route,
+        status=response.status_code,
+    )
+    REQUEST_SQL_QUERIES.observe(g.sql_queries, route=route)
+    REQUEST_SQL_TIME.observe(g.sql_time, route=route)
+
+    return {
+        "method": request.method,
+        "route": route,
+        "path": request.path,
+        "status": response.status_code,
+        "duration_ms": round(elapsed * 1000, 2),
+        "sql_queries": g.sql_queries,
+        "sql_ms": round(g.sql_time * 1000, 2),
+    }
@@ -1,20 +1,156 @@
 """Data models for Plant App"""
 
-from flask_bcrypt import Bcrypt
+import ast
+import json
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, case, event, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import make_transient_to_detached
+
+from passwords import HasherBusy
 
-bcrypt = Bcrypt()
 db = SQLAlchemy()
 
 DEFAULT_PROFILE_IMG = '/static/images/default-pic.png'
 DEFAULT_IMG_URL = '/static/images/sadplant.png'
 DEFAULT_UPGRADE_TEXT = 'upgrade API plan'
 
+# what Perenual sends in place of fields our plan doesn't include
+UPGRADE_TEXT_PREFIX = 'Upgrade Plans To Premium/Supreme'
+UPGRADE_IMG_URL = 'https://perenual.com/storage/image/upgrade_access.jpg'
+
+SAVED_PAGE_SIZE = 24
+SAVED_SORTS = ('newest', 'oldest')
+PLANT_CYCLES = ('Perennial', 'Annual', 'Biennial', 'Biannual')
+
+# plant columns searches and Saved Plants can be filtered on; PlantFacet
+# keeps a count of plants per value of each
+FACETS = ('cycle', 'watering', 'sunlight')
+
+# dialect-specific INSERT constructs that support ON CONFLICT
+UPSERT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+# list-valued Perenual fields: a JSON array of strings (JSONB on Postgres,
+# so it can be indexed and searched with @>)
+StringList = db.JSON().with_variant(postgresql.JSONB(), 'postgresql')
+
+
+def text_to_list(value):
+    """Parse a list-valued field from how it used to be stored as text:
+    '{a,"b c"}' (Postgres array text), "['a', 'b']" (a Python repr) or
+    '["a"]' (JSON) -> a list of strings. Any other text is a one-item list,
+    except the upgrade stand-in, which means no values. Used by the
+    "flask plants migrate-lists" migration.
+    """
+
+    value = (value or '').strip()
+
+    if value.startswith('{') and value.endswith('}'):
+        return [
+            item.strip().strip('"')
+            for item in value[1:-1].split(',')
+            if item.strip()
+        ]
+
+    if value.startswith('[') and value.endswith(']'):
+        try:
+            items = json.loads(value)
+        except ValueError:
+            try:
+                items = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                items = value[1:-1].split(',')
+
+        return [str(item).strip() for item in items if str(item).strip()]
+
+    if not value or value == DEFAULT_UPGRADE_TEXT or is_upgrade_text(value):
+        return []
+
+    return [value]
+
+
+def is_upgrade_text(value):
+    """Is value Perenual's "Upgrade Plans To Premium/Supreme..." stand-in?"""
+
+    return isinstance(value, str) and value.startswith(UPGRADE_TEXT_PREFIX)
+
+
+def without_upgrade_text(value):
+    """Return value with Perenual's upgrade stand-in removed: None for the
+    stand-in itself; for a list, the list without it.
+    """
+
+    if isinstance(value, (list, tuple)):
+        return [item for item in value if not is_upgrade_text(item)]
+
+    return None if is_upgrade_text(value) else value
+
+
+def display_list(values, missing=''):
+    """Show a list-valued field as text: ['a', 'b'] -> 'a, b'; missing if
+    there are no values.
+    """
+
+    return ', '.join(values) if values else missing
+
+
+def utcnow():
+    """Return the current time as naive UTC, for timestamp columns."""
+
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# trigram indexes below need pg_trgm; other dialects skip them
+event.listen(
+    db.metadata,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(
+        dialect='postgresql'
+    ),
+)
+
+
 class Plant(db.Model):
     """Plant information."""
 
     __tablename__ = 'plants'
 
+    __table_args__ = (
+        db.Index(
+            'ix_plants_common_name_trgm',
+            'common_name',
+            postgresql_using='gin',
+            postgresql_ops={'common_name': 'gin_trgm_ops'},
+        ).ddl_if(dialect='postgresql'),
+        db.Index(
+            'ix_plants_scientific_name_trgm',
+            db.cast(db.column('scientific_name'), db.Text).label(
+                'scientific_name_text'
+            ),
+            postgresql_using='gin',
+            postgresql_ops={'scientific_name_text': 'gin_trgm_ops'},
+        ).ddl_if(dialect='postgresql'),
+        # serves sunlight_includes (jsonb @>)
+        db.Index(
+            'ix_plants_sunlight',
+            'sunlight',
+            postgresql_using='gin',
+            postgresql_ops={'sunlight': 'jsonb_path_ops'},
+        ).ddl_if(dialect='postgresql'),
+        # facet filters (see facet_filters): cycle, or cycle and watering
+        db.Index('ix_plants_cycle_watering', 'cycle', 'watering'),
+        db.Index('ix_plants_watering', 'watering'),
+        # catching up the suggestions index (plants updated since ...)
+        db.Index('ix_plants_updated_at', 'updated_at'),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -26,8 +162,9 @@ class Plant(db.Model):
     )
 
     scientific_name = db.Column(
-        db.Text,
+        StringList,
         nullable=False,
+        default=list,
     )
 
     cycle = db.Column(
@@ -42,10 +179,11 @@ class Plant(db.Model):
         default=DEFAULT_UPGRADE_TEXT,
     )
 
+    # empty if Perenual didn't tell us (shown as the upgrade text)
     sunlight = db.Column(
-        db.Text,
+        StringList,
         nullable=False,
-        default=DEFAULT_UPGRADE_TEXT,
+        default=list,
     )
 
     default_image = db.Column(
@@ -54,6 +192,516 @@ class Plant(db.Model):
         default=DEFAULT_IMG_URL,
     )
 
+    # bumped whenever an upsert actually changes the row
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=utcnow,
+    )
+
+    # last time Perenual sent us this row; local search treats old rows as stale
+    fetched_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=utcnow,
+    )
+
+    @classmethod
+    def from_perenual(cls, plant):
+        """Given one item of Perenual species-list "data", return a dict of
+        column values ready for upsert_many.
+
+        Missing values fall back to the column defaults, since a NULL would
+        fail the whole batch.
+
+        This is the one place Perenual data gets cleaned up: the medium
+        image is preferred over the original (the "upgrade" placeholder
+        image counts as none), and upgrade stand-in text counts as missing.
+        List-valued fields (scientific_name, sunlight) stay lists.
+        """
+
+        image = plant.get('default_image') or {}
+        default_img = next(
+            (url for url in (image.get('medium_url'), image.get('original_url'))
+             if url and url != UPGRADE_IMG_URL),
+            DEFAULT_IMG_URL,
+        )
+
+        def text(key):
+            return without_upgrade_text(plant.get(key)) or None
+
+        def values(key):
+            value = without_upgrade_text(plant.get(key)) or []
+            if isinstance(value, str):
+                value = [value]
+            return [str(item) for item in value if item]
+
+        scientific_name = values('scientific_name')
+
+        return {
+            'id': plant['id'],
+            'common_name': (
+                plant.get('common_name') or display_list(scientific_name)
+            ),
+            'scientific_name': scientific_name,
+            'cycle': text('cycle') or DEFAULT_UPGRADE_TEXT,
+            'watering': text('watering') or DEFAULT_UPGRADE_TEXT,
+            'sunlight': values('sunlight'),
+            'default_image': default_img,
+        }
+
+    @classmethod
+    def upsert_many(cls, rows, refresh=False):
+        """Insert many plants (dicts from from_perenual) in one statement.
+
+        Plants already stored are skipped with ON CONFLICT DO NOTHING, or, if
+        refresh is true, have their columns overwritten and fetched_at reset;
+        updated_at only moves when a column actually differs.
+        PlantFacet counts are updated to match, from the rows the statement
+        returns (and, for a refresh, the values it replaced).
+        Works on Postgres and SQLite. Doesn't commit; caller must.
+        """
+
+        # a page can repeat an id, which ON CONFLICT DO UPDATE rejects; in
+        # id order, so concurrent upserts lock shared rows in the same order
+        rows = sorted(
+            {row['id']: row for row in rows}.values(),
+            key=lambda row: row['id'],
+        )
+
+        if not rows:
+            return
+
+        dialect = db.session.get_bind().dialect.name
+        stmt = UPSERT_INSERTS[dialect](cls)
+        facet_columns = [getattr(cls, facet) for facet in FACETS]
+        replaced = []
+
+        if refresh:
+            now = utcnow()
+            columns = [col for col in rows[0] if col != 'id']
+            changed = or_(*(
+                getattr(cls, col).is_distinct_from(stmt.excluded[col])
+                for col in columns
+            ))
+
+            set_ = {col: stmt.excluded[col] for col in columns}
+            set_['updated_at'] = case((changed, now), else_=cls.updated_at)
+            set_['fetched_at'] = now
+
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[cls.id],
+                set_=set_,
+            )
+
+            # the values about to be overwritten, to take off their counts
+            query = db.select(*facet_columns).where(
+                cls.id.in_([row['id'] for row in rows])
+            ).order_by(cls.id)
+            if dialect == 'postgresql':
+                query = query.with_for_update()
+            replaced = db.session.execute(query).all()
+
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[cls.id])
+
+        # rows inserted or updated; those skipped by DO NOTHING aren't here
+        written = db.session.execute(
+            stmt.returning(*facet_columns), rows
+        ).all()
+
+        counts = facet_counts(written)
+        counts.subtract(facet_counts(replaced))
+        PlantFacet.add(counts)
+
+    @classmethod
+    def search_local(cls, term, limit=30, offset=0, filters=None):
+        """Search stored plants by common or scientific name, best first.
+
+        On Postgres this is served by the trigram indexes and ranked by
+        trigram similarity (so near-misses like "monstra" still match);
+        elsewhere it falls back to a case-insensitive substring match, ranked
+        prefix-first then by name length. Scientific names are matched in
+        their JSON text, which is what the trigram index covers.
+
+        filters optionally narrows the matches by facet (see facet_filters).
+        """
+
+        matches, rank = cls._local_matches(term)
+
+        query = (
+            db.select(cls)
+            .where(matches, *cls.facet_filters(**(filters or {})))
+            .order_by(rank, db.func.length(cls.common_name), cls.id)
+            .limit(limit)
+            .offset(offset)
+        )
+
+        return db.session.scalars(query).all()
+
+    @classmethod
+    def count_local(cls, term, filters=None):
+        """How many stored plants search_local(term, filters=filters) would
+        find, without a limit.
+        """
+
+        matches, _rank = cls._local_matches(term)
+
+        return db.session.scalar(
+            db.select(db.func.count())
+            .select_from(cls)
+            .where(matches, *cls.facet_filters(**(filters or {})))
+        )
+
+    @classmethod
+    def _local_matches(cls, term):
+        """Return (WHERE clause, ORDER BY rank) for search_local."""
+
+        scientific_name = db.cast(cls.scientific_name, db.Text)
+
+        matches = or_(
+            cls.common_name.icontains(term, autoescape=True),
+            scientific_name.icontains(term, autoescape=True),
+        )
+
+        if db.session.get_bind().dialect.name == 'postgresql':
+            matches = or_(
+                matches,
+                cls.common_name.op('%')(term),
+                scientific_name.op('%')(term),
+            )
+            rank = db.func.greatest(
+                db.func.similarity(cls.common_name, term),
+                db.func.similarity(scientific_name, term),
+            ).desc()
+
+        else:
+            rank = case(
+                (cls.common_name.istartswith(term, autoescape=True), 0),
+                else_=1,
+            )
+
+        return matches, rank
+
+    @classmethod
+    def facet_filters(cls, cycle=None, watering=None, sunlight=None):
+        """Return WHERE clauses for plants with the given cycle, watering
+        and sunlight value (exact values, as PlantFacet lists them); None
+        means any. Served by ix_plants_cycle_watering / ix_plants_watering
+        and, on Postgres, ix_plants_sunlight.
+        """
+
+        clauses = []
+
+        if cycle:
+            clauses.append(cls.cycle == cycle)
+        if watering:
+            clauses.append(cls.watering == watering)
+        if sunlight:
+            clauses.append(cls.sunlight_includes(sunlight))
+
+        return clauses
+
+    @classmethod
+    def sunlight_includes(cls, value):
+        """A filter for plants whose sunlight list includes value, e.g.
+        Plant.query.where(Plant.sunlight_includes('full sun')).
+
+        JSONB containment on Postgres, served by ix_plants_sunlight;
+        json_each on SQLite. Either way a match on a whole value, not a
+        substring of the stored text.
+        """
+
+        if db.session.get_bind().dialect.name == 'postgresql':
+            return db.type_coerce(cls.sunlight, postgresql.JSONB).contains(
+                [value]
+            )
+
+        items = db.func.json_each(cls.sunlight).table_valued('value')
+        return db.exists().select_from(items).where(items.c.value == value)
+
+    def to_card(self):
+        """Serialize to a search-result card; see plant_card."""
+
+        return plant_card({
+            col.key: getattr(self, col.key) for col in CARD_COLUMNS
+        })
+
+
+CARD_COLUMNS = (
+    Plant.id, Plant.common_name, Plant.scientific_name, Plant.cycle,
+    Plant.watering, Plant.sunlight, Plant.default_image,
+)
+
+
+def plant_card(row):
+    """Project a plant row (a Plant.from_perenual dict, or a Plant's column
+    values) to just what a search-result card shows, lists as display text.
+    """
+
+    return {
+        "id": row['id'],
+        "common_name": row['common_name'],
+        "scientific_name": display_list(row['scientific_name']),
+        "cycle": row['cycle'],
+        "watering": row['watering'],
+        "sunlight": display_list(row['sunlight'], DEFAULT_UPGRADE_TEXT),
+        "default_image": row['default_image'],
+    }
+
+
+def facet_counts(rows):
+    """Count the facet values in rows of (cycle, watering, sunlight): a
+    Counter of (facet, value). Placeholder values don't count.
+    """
+
+    counts = Counter()
+
+    for cycle, watering, sunlight in rows:
+        for facet, value in (('cycle', cycle), ('watering', watering)):
+            if value and value != DEFAULT_UPGRADE_TEXT:
+                counts[facet, value] += 1
+
+        for value in set(sunlight or ()):
+            counts['sunlight', value] += 1
+
+    return counts
+
+
+class PlantFacet(db.Model):
+    """How many stored plants have each value of each of FACETS.
+
+    Plant.upsert_many keeps these up to date as plants are written, so a
+    facet sidebar reads a few dozen rows instead of counting the plants
+    table. Plants deleted by hand aren't subtracted; `flask plants
+    recount-facets` rebuilds the counts from scratch.
+    """
+
+    __tablename__ = 'plant_facets'
+
+    facet = db.Column(
+        db.Text,
+        primary_key=True,
+    )
+
+    value = db.Column(
+        db.Text,
+        primary_key=True,
+    )
+
+    plants = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    @classmethod
+    def add(cls, counts):
+        """Add counts (a Counter of (facet, value), possibly negative) in
+        one upsert. Doesn't commit; caller must.
+
+        Rows are written in (facet, value) order, so concurrent stores
+        lock the counters they share in the same order and can't deadlock.
+        """
+
+        rows = [
+            {'facet': facet, 'value': value, 'plants': count}
+            for (facet, value), count in sorted(counts.items()) if count
+        ]
+
+        if not rows:
+            return
+
+        dialect = db.session.get_bind().dialect.name
+        stmt = UPSERT_INSERTS[dialect](cls)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.facet, cls.value],
+            set_={'plants': cls.plants + stmt.excluded.plants},
+        )
+
+        db.session.execute(stmt, rows)
+
+    @classmethod
+    def counts(cls):
+        """Return {facet: {value: plants}} for every facet, most common
+        values first; values no plant has are left out.
+        """
+
+        counts = {facet: {} for facet in FACETS}
+
+        for facet, value, plants in db.session.execute(
+            db.select(cls.facet, cls.value, cls.plants)
+            .where(cls.plants > 0)
+            .order_by(cls.facet, cls.plants.desc(), cls.value)
+        ):
+            counts.setdefault(facet, {})[value] = plants
+
+        return counts
+
+    @classmethod
+    def recount(cls, batch_size=10_000):
+        """Rebuild every count from the plants table. Returns the number
+        of plants counted. Doesn't commit; caller must.
+        """
+
+        counts = Counter()
+        plants = 0
+
+        rows = db.session.execute(
+            db.select(Plant.cycle, Plant.watering, Plant.sunlight)
+            .execution_options(yield_per=batch_size)
+        )
+        for batch in rows.partitions():
+            counts.update(facet_counts(batch))
+            plants += len(batch)
+
+        db.session.execute(db.delete(cls))
+        cls.add(counts)
+
+        return plants
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__} "
+            f"{self.facet}={self.value!r} plants={self.plants}>"
+        )
+
+
+# species-details fields kept for the plant page, in display order
+DETAIL_FIELDS = (
+    'type', 'family', 'origin', 'dimension', 'hardiness', 'growth_rate',
+    'maintenance', 'care_level', 'soil', 'propagation', 'pruning_month',
+    'flowering_season', 'attracts', 'indoor', 'drought_tolerant',
+    'tropical', 'edible_fruit', 'edible_leaf', 'medicinal',
+    'poisonous_to_humans', 'poisonous_to_pets',
+)
+
+
+def detail_text(value):
+    """Show one species-details value as text: lists joined, flags as
+    Yes/No, ranges (e.g. hardiness {"min": "5", "max": "9"}) as "5-9".
+    """
+
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(item) for item in value)
+
+    if isinstance(value, dict):
+        if value.keys() >= {'min', 'max'}:
+            low, high = value['min'], value['max']
+            return str(low) if low == high else f'{low}-{high}'
+
+        return ', '.join(f'{key}: {item}' for key, item in value.items())
+
+    return str(value)
+
+
+class PlantDetails(db.Model):
+    """A plant's Perenual species details, beyond the columns the search
+    listing gives us. Kept apart from plants: fetched on first view of a
+    plant's page, and refreshed in the background once stale.
+    """
+
+    __tablename__ = 'plant_details'
+
+    plant_id = db.Column(
+        db.Integer,
+        db.ForeignKey('plants.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    description = db.Column(
+        db.Text,
+    )
+
+    # DETAIL_FIELDS Perenual gave us real values for
+    data = db.Column(
+        db.JSON,
+        nullable=False,
+        default=dict,
+    )
+
+    fetched_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=utcnow,
+    )
+
+    @classmethod
+    def from_perenual(cls, details):
+        """Given a Perenual species-details response, return a dict of column
+        values for store(). Upgrade stand-ins and empty values are dropped.
+        """
+
+        data = {}
+        for field in DETAIL_FIELDS:
+            value = without_upgrade_text(details.get(field))
+            if value not in (None, '', [], {}):
+                data[field] = value
+
+        return {
+            'description': without_upgrade_text(details.get('description')),
+            'data': data,
+        }
+
+    @classmethod
+    def store(cls, plant_id, details):
+        """Save a Perenual species-details response for plant_id (replacing
+        any earlier copy), and fill in the plant's own columns from it where
+        it has real values. Returns the PlantDetails. Doesn't commit; caller
+        must.
+        """
+
+        row = {
+            'plant_id': plant_id,
+            **cls.from_perenual(details),
+            'fetched_at': utcnow(),
+        }
+
+        dialect = db.session.get_bind().dialect.name
+        stmt = UPSERT_INSERTS[dialect](cls).values(row)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.plant_id],
+            set_={col: stmt.excluded[col] for col in row if col != 'plant_id'},
+        )
+        db.session.execute(stmt)
+
+        current = db.session.get(Plant, plant_id)
+
+        if current is not None and details.get('id') == plant_id:
+            plant = Plant.from_perenual(details)
+
+            # placeholders in the details mustn't replace what we know
+            for col, value in plant.items():
+                if value in (DEFAULT_UPGRADE_TEXT, DEFAULT_IMG_URL, '', []):
+                    plant[col] = getattr(current, col)
+
+            Plant.upsert_many([plant], refresh=True)
+
+        return db.session.execute(
+            db.select(cls).where(cls.plant_id == plant_id),
+            execution_options={'populate_existing': True},
+        ).scalar_one()
+
+    def is_stale(self, max_age):
+        """Were these details fetched longer than max_age (a timedelta) ago?"""
+
+        return utcnow() - self.fetched_at > max_age
+
+    def items(self):
+        """Return [(label, text), ...] for the plant page, in DETAIL_FIELDS
+        order.
+        """
+
+        return [
+            (field.replace('_', ' ').capitalize(),
+             detail_text(self.data[field]))
+            for field in DETAIL_FIELDS if field in self.data
+        ]
+
+
 class User(db.Model):
     """User information."""
 
@@ -128,7 +776,7 @@ class User(db.Model):
         image_url=DEFAULT_PROFILE_IMG):
         """Register a new user and handle password hashing."""
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = current_app.extensions['password_hasher'].hash(password)
 
         new_user = User(
             username=username,
@@ -150,17 +798,67 @@ class User(db.Model):
 
         If found matching user, returns that user object. If not found or if
         password is incorrect, returns False.
+
+        A password hashed with an outdated work factor is rehashed with the
+        current one; the caller commits the change. If the hasher is too
+        busy for that, the rehash waits for a later login.
         """
 
         user = cls.query.filter_by(username=username).one_or_none()
+        password_hasher = current_app.extensions['password_hasher']
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.hashed_password, password)
+            is_auth = password_hasher.check(user.hashed_password, password)
             if is_auth:
+                if password_hasher.needs_rehash(user.hashed_password):
+                    try:
+                        user.hashed_password = password_hasher.hash(password)
+                    except HasherBusy:
+                        pass
                 return user
 
         return False
 
+    @classmethod
+    def username_taken(cls, username):
+        """Is there already a user with this username?"""
+
+        return db.session.scalar(
+            db.select(cls.id).where(cls.username == username).limit(1)
+        ) is not None
+
+    @classmethod
+    def get_cached(cls, user_id):
+        """Return the user with this id, attached to the current session.
+
+        Served from the app's user_cache (a TTLCache of column values) when
+        possible, merged in without a query; otherwise loaded from the db and
+        cached. Returns None if no such user.
+        """
+
+        cache = current_app.extensions['user_cache']
+        values = cache.get(user_id)
+
+        if values is not None:
+            user = cls(**values)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+        user = db.session.get(cls, user_id)
+
+        if user is not None:
+            cache.set(user_id, {
+                col.key: getattr(user, col.key) for col in cls.__table__.columns
+            })
+
+        return user
+
+    @classmethod
+    def invalidate_cache(cls, user_id):
+        """Forget the cached copy of this user, e.g. after changing them."""
+
+        current_app.extensions['user_cache'].delete(user_id)
+
     liked_plants = db.relationship(
         "Plant", secondary="likes", backref="liking_users"
     )
@@ -169,6 +867,17 @@ class User(db.Model):
         return f"<{self.__class__.__name__} id={self.id} name={self.username}>"
 
 
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, user):
+    """Drop a user from the user cache whenever the ORM writes them, including
+    a new user (registered via User.register) that reuses an old id.
+    """
+
+    User.invalidate_cache(user.id)
+
+
 class Like(db.Model):
     """Tracks which user likes which plant."""
 
@@ -176,6 +885,8 @@ class Like(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint("user_id", "plant_id"),
+        # a user's likes in saved order; serves both sorts and the keyset
+        db.Index('ix_likes_user_created', 'user_id', 'created_at', 'plant_id'),
     )
 
     user_id = db.Column(
@@ -190,6 +901,137 @@ class Like(db.Model):
         primary_key=True,
     )
 
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=utcnow,
+        server_default=db.func.now(),
+    )
+
+    @classmethod
+    def add(cls, user_id, plant_id):
+        """Record that user_id likes plant_id, in one INSERT ... SELECT ...
+        ON CONFLICT DO NOTHING, whatever the user has liked before.
+
+        Returns True if a like was added; False if the user already liked
+        the plant, or there's no such plant. Doesn't commit; caller must.
+        """
+
+        dialect = db.session.get_bind().dialect.name
+        stmt = (
+            UPSERT_INSERTS[dialect](cls)
+            .from_select(
+                ['user_id', 'plant_id', 'created_at'],
+                db.select(
+                    db.literal(user_id), Plant.id, db.literal(utcnow())
+                ).where(Plant.id == plant_id),
+            )
+            .on_conflict_do_nothing(index_elements=['user_id', 'plant_id'])
+        )
+
+        return db.session.execute(stmt).rowcount > 0
+
+    @classmethod
+    def remove(cls, user_id, plant_id):
+        """Forget that user_id likes plant_id, in one DELETE. Returns True if
+        there was a like to remove. Doesn't commit; caller must.
+        """
+
+        stmt = db.delete(cls).where(
+            (cls.user_id == user_id) & (cls.plant_id == plant_id)
+        )
+
+        return db.session.execute(stmt).rowcount > 0
+
+    @classmethod
+    def saved_page(cls, user_id, after=None, limit=SAVED_PAGE_SIZE,
+                   sort='newest', *, cycle=None, watering=None,
+                   sunlight=None):
+        """Return one page of the plants a user likes, and the position to
+        pass as after= for the next page (None on the last page).
+
+        Keyset-paginated on (created_at, plant_id), so every page costs the
+        same however deep it is. Rows carry only what the Saved Plants page
+        shows: id, common_name, scientific_name, default_image, liked_at.
+        sort is "newest" or "oldest"; cycle, watering and sunlight
+        optionally filter the plants (see Plant.facet_filters).
+        """
+
+        key = db.tuple_(cls.created_at, cls.plant_id)
+        newest = sort != 'oldest'
+
+        query = (
+            db.select(
+                Plant.id,
+                Plant.common_name,
+                Plant.scientific_name,
+                Plant.default_image,
+                cls.created_at.label('liked_at'),
+            )
+            .join(cls, cls.plant_id == Plant.id)
+            .where(cls.user_id == user_id)
+            .order_by(
+                *((cls.created_at.desc(), cls.plant_id.desc()) if newest
+                  else (cls.created_at, cls.plant_id))
+            )
+            .limit(limit + 1)
+        )
+
+        query = query.where(*Plant.facet_filters(
+            cycle=cycle, watering=watering, sunlight=sunlight
+        ))
+
+        if after:
+            query = query.where(key < after if newest else key > after)
+
+        rows = db.session.execute(query).all()
+
+        if len(rows) <= limit:
+            return rows, None
+
+        rows = rows[:limit]
+        return rows, (rows[-1].liked_at, rows[-1].id)
+
+    @classmethod
+    def export_rows(cls, user_id, sort='newest', batch_size=1000, *,
+                    cycle=None, watering=None, sunlight=None):
+        """Yield every plant a user likes, with when they liked it: id,
+        common_name, scientific_name, cycle, watering, sunlight,
+        default_image, liked_at. sort and filters as for saved_page.
+
+        Read batch_size rows at a time from a server-side cursor, so memory
+        stays flat however many likes there are. The session's transaction
+        stays open until the last row is read.
+        """
+
+        newest = sort != 'oldest'
+
+        query = (
+            db.select(
+                Plant.id,
+                Plant.common_name,
+                Plant.scientific_name,
+                Plant.cycle,
+                Plant.watering,
+                Plant.sunlight,
+                Plant.default_image,
+                cls.created_at.label('liked_at'),
+            )
+            .join(cls, cls.plant_id == Plant.id)
+            .where(cls.user_id == user_id)
+            .where(*Plant.facet_filters(
+                cycle=cycle, watering=watering, sunlight=sunlight
+            ))
+            .order_by(
+                *((cls.created_at.desc(), cls.plant_id.desc()) if newest
+                  else (cls.created_at, cls.plant_id))
+            )
+            .execution_options(yield_per=batch_size)
+        )
+
+        for batch in db.session.execute(query).partitions():
+            yield from batch
+
     def __repr__(self):
         return (
             f"<{self.__class__.__name__} " +
@@ -203,6 +1045,4 @@ def connect_db(app):
     You should call this in your Flask app.
     """
 
-    app.app_context().push()
-    db.app = app
     db.init_app(app)
@@ -0,0 +1,182 @@
+"""Password hashing for Plant App.
+
+bcrypt is slow on purpose: about 250 ms of CPU per hash or check at the
+default work factor. Run inline, a burst of logins stalls every other request
+on the worker. PasswordHasher runs bcrypt in a small process pool instead,
+and turns calls away once too many are waiting, rather than queueing them
+without limit.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+DEFAULT_ROUNDS = 12
+
+
+class HasherBusy(Exception):
+    """Too many password hashes are already waiting; try again later."""
+
+
+def _hash(password, rounds):
+    """Hash password with a fresh salt. Runs in a pool process."""
+
+    salt = bcrypt.gensalt(rounds)
+    return bcrypt.hashpw(password.encode('UTF-8'), salt).decode('UTF-8')
+
+
+def _check(hashed, password):
+    """Does password match hashed? Runs in a pool process."""
+
+    return bcrypt.checkpw(password.encode('UTF-8'), hashed.encode('UTF-8'))
+
+
+def hash_rounds(hashed):
+    """Return the work factor a bcrypt hash was made with:
+
+        >>> hash_rounds('$2b$12$' + 53 * 'x')
+        12
+    """
+
+    return int(hashed.split('$')[2])
+
+
+class PasswordHasher:
+    """Hashes and checks passwords with bcrypt in a bounded process pool.
+
+    rounds is the bcrypt work factor for new hashes. At most max_workers
+    hashes run at once; once max_pending calls are running or queued, more
+    raise HasherBusy. With max_workers=0, bcrypt runs inline on the calling
+    thread instead (handy for scripts and tests).
+
+    The pool is started on first use, and again in a forked child (e.g. a
+    gunicorn worker after --preload), whose copy of it doesn't work.
+    Queue-depth and timing counters are available from stats().
+    """
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, max_workers=2, max_pending=32,
+                 timeout=30):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def shutdown(self):
+        """Stop the pool's processes, if it's running."""
+
+        with self._lock:
+            pool, self._pool = self._pool, None
+
+        if pool is not None and self._pid == os.getpid():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def hash(self, password):
+        """Return a bcrypt hash of password, at the configured work factor."""
+
+        return self._call(_hash, password, self.rounds)
+
+    def check(self, hashed, password):
+        """Does password match the bcrypt hash hashed?"""
+
+        return self._call(_check, hashed, password)
+
+    def needs_rehash(self, hashed):
+        """Was hashed made with a different work factor than the current
+        one?
+        """
+
+        return hash_rounds(hashed) != self.rounds
+
+    def stats(self):
+        """Return a dict of queue depth, call and wait-time counters."""
+
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "pending": self.pending,
+                "peak_pending": self.peak_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "wait_total": self.wait_total,
+                "wait_max": self.wait_max,
+            }
+
+    def _call(self, func, *args):
+        """Run func(*args) in the pool, wait for and return its result.
+
+        Raises HasherBusy if max_pending calls are already waiting, if the
+        result takes longer than timeout seconds, or if the pool broke.
+        """
+
+        if not self.max_workers:
+            return func(*args)
+
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherBusy('Too many password hashes waiting')
+
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+            pool = self._get_pool()
+
+        start = time.perf_counter()
+
+        try:
+            future = pool.submit(func, *args)
+            return future.result(self.timeout)
+
+        except FutureTimeoutError:
+            # if it's still queued, don't let it take a worker later
+            future.cancel()
+            raise HasherBusy('Password hash timed out') from None
+
+        except BrokenProcessPool as exc:
+            # a pool process died; start a fresh pool next call
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise HasherBusy('Password hash pool broke') from exc
+
+        finally:
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+                self.wait_total += elapsed
+                self.wait_max = max(self.wait_max, elapsed)
+
+    def _get_pool(self):
+        """Return the pool for this process, starting it if needed. Caller
+        must hold the lock.
+        """
+
+        if self._pool is None or self._pid != os.getpid():
+            # spawn, not fork: forking a process with live threads (db pools,
+            # the prefetch pool...) can copy locks held mid-operation
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            self._pid = os.getpid()
+
+        return self._pool
+
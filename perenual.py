@@ -0,0 +1,199 @@
+"""Client for the Perenual plant API."""
+
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+PERENUAL_BASE_URL = 'https://perenual.com/api'
+
+# call priorities for the rate scheduler (see quota.py)
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+# upstream statuses worth retrying; anything else 4xx is our fault
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class PerenualError(Exception):
+    """Perenual couldn't be reached, or answered with an error status."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class PerenualClient:
+    """Pooled, keep-alive client for Perenual.
+
+    All calls share one requests.Session, so repeat calls reuse open TLS
+    connections. Every call has connect/read timeouts; idempotent GETs are
+    retried with jittered exponential backoff on connection errors, timeouts
+    and 429/5xx responses. Latency and error counters are kept for stats().
+    """
+
+    def __init__(self, api_key, base_url=PERENUAL_BASE_URL,
+                 connect_timeout=3.05, read_timeout=10, retries=2,
+                 backoff=0.25, pool_maxsize=10, sleep=time.sleep):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self._sleep = sleep
+        # called with (seconds, HTTP status or None) after every attempt
+        self.on_request = None
+        # a quota.RateScheduler; if set, every attempt first takes a token
+        # from it, and uses the API key it hands out
+        self.scheduler = None
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def stats(self):
+        """Return a dict of call, error and latency counters."""
+
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "retries": self.retried,
+                "latency_total": self.latency_total,
+                "latency_max": self.latency_max,
+            }
+
+    def _request_args(self, path, params, api_key):
+        """Return (url, params) for a GET of path, API key included."""
+
+        return f'{self.base_url}{path}', {"key": api_key, **(params or {})}
+
+    def _take_key(self, priority):
+        """Return the API key for the next attempt: the scheduler's (which
+        may wait for, or refuse, a token; see quota.RateScheduler), else
+        ours.
+        """
+
+        if self.scheduler is None:
+            return self.api_key
+
+        return self.scheduler.acquire(priority)
+
+    def _rate_limited(self, api_key):
+        """Perenual answered 429: tell the scheduler, so all workers back
+        off that key.
+        """
+
+        if self.scheduler is not None:
+            self.scheduler.penalize(api_key)
+
+    def _should_retry(self, error, attempt):
+        """Should a failed attempt be retried? Counts the retry if so."""
+
+        retryable = error.status is None or error.status in RETRY_STATUSES
+        if not retryable or attempt == self.retries:
+            return False
+
+        with self._lock:
+            self.retried += 1
+
+        return True
+
+    def _backoff_delay(self, attempt):
+        """Seconds to wait before retry number attempt + 1.
+
+        "Full jitter": spreads retries out so workers don't stampede.
+        """
+
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def _record(self, elapsed, status=None, failed=False):
+        """Count one attempt, its latency and its status (None if no response
+        came back).
+        """
+
+        with self._lock:
+            self.calls += 1
+            self.errors += failed
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+
+        if self.on_request is not None:
+            self.on_request(elapsed, status)
+
+    def species_list(self, term, page=1, order='asc', priority=INTERACTIVE):
+        """Search species by term; returns the parsed species-list JSON."""
+
+        return self.get(
+            '/species-list',
+            params={"q": term, "order": order, "page": page},
+            priority=priority,
+        )
+
+    def species_details(self, plant_id, priority=INTERACTIVE):
+        """Return the parsed species details JSON for a Perenual plant id."""
+
+        return self.get(f'/species/details/{plant_id}', priority=priority)
+
+    def get(self, path, params=None, priority=INTERACTIVE):
+        """GET path from Perenual and return parsed JSON.
+
+        Retries up to self.retries times; raises PerenualError if every
+        attempt fails (QuotaExhausted, from the scheduler, isn't retried).
+        priority is "interactive" or "background", for the scheduler.
+        """
+
+        for attempt in range(self.retries + 1):
+            api_key = self._take_key(priority)
+            url, query = self._request_args(path, params, api_key)
+            start = time.perf_counter()
+
+            try:
+                resp = self.session.get(url, params=query, timeout=self.timeout)
+
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                error = PerenualError(f'Perenual request failed: {exc}')
+
+            else:
+                if resp.ok:
+                    try:
+                        plant_data = resp.json()
+
+                    except requests.JSONDecodeError:
+                        error = PerenualError(
+                            f'Perenual answered {resp.status_code} with '
+                            f'invalid JSON',
+                            status=resp.status_code,
+                        )
+
+                    else:
+                        self._record(
+                            time.perf_counter() - start, resp.status_code
+                        )
+                        return plant_data
+
+                else:
+                    error = PerenualError(
+                        f'Perenual answered {resp.status_code}',
+                        status=resp.status_code,
+                    )
+                    if resp.status_code == 429:
+                        self._rate_limited(api_key)
+
+            elapsed = time.perf_counter() - start
+            self._record(elapsed, error.status, failed=True)
+
+            if not self._should_retry(error, attempt):
+                raise error
+
+            self._sleep(self._backoff_delay(attempt))
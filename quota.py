@@ -0,0 +1,314 @@
+"""Rate limiting for Perenual API calls, shared by every worker.
+
+Each API key has a per-minute limit and a daily quota. RateScheduler keeps
+a token bucket per key in a small SQLite file, so every process on the
+host draws from the same buckets:
+
+    key = scheduler.acquire('interactive')   # waits for a token if need be
+
+Calls have a priority. Interactive calls (a user's search) may use every
+token. Background calls (prefetching, refreshing details) may not use the
+last background_reserve share of either limit, so they back off before
+users feel the limit, and they never wait; without a token they're
+skipped. With several keys, each call takes the key with the most room,
+spreading load across them. A limit of 0 means no limit; usage is still
+counted.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from perenual import BACKGROUND, INTERACTIVE, PerenualError
+
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    day TEXT NOT NULL,
+    day_used INTEGER NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+# how long a key Perenual answered 429 for is left alone
+PENALTY_SECONDS = 60
+
+
+class QuotaExhausted(PerenualError):
+    """No API key has room for another Perenual call right now."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message, status=429)
+        self.retry_after = retry_after
+
+
+def utc_day(now):
+    return datetime.fromtimestamp(now, timezone.utc).date().isoformat()
+
+
+def add_blocked_until(conn):
+    """Add buckets.blocked_until to a bucket file made before it existed."""
+
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(buckets)')]
+
+    if 'blocked_until' not in columns:
+        try:
+            conn.execute(
+                'ALTER TABLE buckets '
+                'ADD COLUMN blocked_until REAL NOT NULL DEFAULT 0'
+            )
+        except sqlite3.OperationalError:
+            # another worker added it first
+            pass
+
+
+class RateScheduler:
+    """Token buckets for a set of API keys, kept in the SQLite file at path.
+
+    per_minute tokens refill steadily over each minute (a full minute's
+    worth can be spent at once); per_day calls are allowed per key per UTC
+    day. Interactive calls wait up to max_wait seconds for a token, then
+    raise QuotaExhausted; background calls raise it straight away. Grant
+    and throttle counts are available from stats(), remaining quota per
+    key from remaining().
+    """
+
+    def __init__(self, path, keys, per_minute=0, per_day=0,
+                 background_reserve=0.25, max_wait=5, clock=time.time,
+                 sleep=time.sleep):
+        if not keys:
+            raise ValueError('RateScheduler needs at least one API key')
+
+        self.path = path
+        self.keys = list(keys)
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.background_reserve = background_reserve
+        self.max_wait = max_wait
+        self._clock = clock
+        self._sleep = sleep
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.granted = dict.fromkeys(PRIORITIES, 0)
+        self.throttled = dict.fromkeys(PRIORITIES, 0)
+
+        self._connect()
+
+    def acquire(self, priority=INTERACTIVE):
+        """Take a token and return the API key to call with. Raises
+        QuotaExhausted if none is to be had (see the class docstring).
+        """
+
+        deadline = self._clock() + (
+            self.max_wait if priority == INTERACTIVE else 0
+        )
+
+        while True:
+            key, wait = self.try_acquire(priority)
+
+            if key is not None:
+                return key
+
+            if wait is None or self._clock() + wait > deadline:
+                self.reject(priority, wait)
+
+            self._sleep(wait)
+
+    def reject(self, priority, retry_after=None):
+        """Count a call turned away for want of a token, and raise
+        QuotaExhausted for it.
+        """
+
+        with self._lock:
+            self.throttled[priority] += 1
+
+        raise QuotaExhausted(
+            f'Perenual quota exhausted for {priority} calls',
+            retry_after=retry_after,
+        )
+
+    def try_acquire(self, priority=INTERACTIVE):
+        """Take a token without waiting. Returns (key, None), or (None,
+        seconds until one may be free) if none is free now; that's None if
+        no key has any daily quota left.
+        """
+
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unknown priority {priority!r}')
+
+        reserve = self.background_reserve if priority == BACKGROUND else 0
+        minute_floor = self.per_minute * reserve
+        day_limit = self.per_day * (1 - reserve)
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+
+        try:
+            now = self._clock()
+            best = None
+            waits = []
+
+            for key, tokens, day_used, blocked_until in self._buckets(
+                conn, now
+            ):
+                if self.per_day and day_used >= day_limit:
+                    continue
+
+                if blocked_until > now:
+                    waits.append(blocked_until - now)
+                    continue
+
+                if self.per_minute and tokens - 1 < minute_floor:
+                    waits.append(
+                        (minute_floor + 1 - tokens) * 60 / self.per_minute
+                    )
+                    continue
+
+                # the key with the most room left, so keys share the load
+                room = (tokens, -day_used)
+                if best is None or room > best[0]:
+                    best = (room, key, tokens, day_used)
+
+            if best is None:
+                conn.execute('ROLLBACK')
+                return None, min(waits) if waits else None
+
+            _room, key, tokens, day_used = best
+            conn.execute(
+                'UPDATE buckets SET tokens = ?, updated = ?, day_used = ? '
+                'WHERE key = ?',
+                (tokens - 1 if self.per_minute else 0, now, day_used + 1,
+                 key),
+            )
+            conn.execute('COMMIT')
+
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        with self._lock:
+            self.granted[priority] += 1
+
+        return key, None
+
+    def penalize(self, key):
+        """Perenual answered 429 for key: no worker uses it for the next
+        PENALTY_SECONDS (and its bucket starts empty after that).
+        """
+
+        now = self._clock()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+
+        try:
+            # makes key's row if no call has used it yet
+            self._buckets(conn, now)
+            conn.execute(
+                'UPDATE buckets SET tokens = 0, updated = ?, '
+                'blocked_until = ? WHERE key = ?',
+                (now, now + PENALTY_SECONDS, key),
+            )
+            conn.execute('COMMIT')
+
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def remaining(self):
+        """Return {key index: (tokens left this minute, calls left today)},
+        with None for a limit that isn't set.
+        """
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            buckets = self._buckets(conn, self._clock())
+        finally:
+            conn.execute('COMMIT')
+
+        return {
+            self.keys.index(key): (
+                tokens if self.per_minute else None,
+                max(self.per_day - day_used, 0) if self.per_day else None,
+            )
+            for key, tokens, day_used, _blocked_until in buckets
+        }
+
+    def stats(self):
+        """Return a dict of calls granted and throttled, by priority."""
+
+        with self._lock:
+            return {
+                **{f'granted_{name}': n for name, n in self.granted.items()},
+                **{f'throttled_{name}': n
+                   for name, n in self.throttled.items()},
+            }
+
+    def _buckets(self, conn, now):
+        """Return [(key, tokens, calls today, blocked until)] for every key,
+        refilled up to now. Caller must be in a transaction.
+        """
+
+        today = utc_day(now)
+        rows = {
+            key: (tokens, updated, day, day_used, blocked_until)
+            for key, tokens, updated, day, day_used, blocked_until
+            in conn.execute(
+                'SELECT key, tokens, updated, day, day_used, blocked_until '
+                'FROM buckets'
+            )
+        }
+        buckets = []
+
+        for key in self.keys:
+            if key not in rows:
+                conn.execute(
+                    'INSERT INTO buckets VALUES (?, ?, ?, ?, 0, 0)',
+                    (key, self.per_minute, now, today),
+                )
+                buckets.append((key, self.per_minute, 0, 0))
+                continue
+
+            tokens, updated, day, day_used, blocked_until = rows[key]
+            tokens = min(
+                self.per_minute,
+                tokens + (now - updated) * self.per_minute / 60,
+            )
+            buckets.append((
+                key, tokens, day_used if day == today else 0, blocked_until,
+            ))
+
+            if day != today:
+                conn.execute(
+                    'UPDATE buckets SET day = ?, day_used = 0 WHERE key = ?',
+                    (today, key),
+                )
+
+        return buckets
+
+    def _connect(self):
+        """This thread's connection to the bucket file (a new one in a
+        forked child).
+        """
+
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(SCHEMA)
+            add_blocked_until(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+
+        return conn
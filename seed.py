@@ -0,0 +1,607 @@
+"""Bulk import of the Perenual species catalog into the plants table.
+
+Registered on the app as the "plants" command group:
+
+    flask plants import                  # walk Perenual's whole species list
+    flask plants import dump.ndjson      # load a local dump, works offline
+    flask plants migrate-lists           # one-off: list columns to JSON
+    flask plants migrate-timestamps      # one-off: add timestamp columns
+    flask plants recount-facets          # rebuild the filter counts
+
+Dumps can be NDJSON (one plant, or one species-list page, per line) or a JSON
+array of plants. Both are read as a stream and written in large batches, so
+memory stays flat however big the catalog. Progress is checkpointed after
+every batch; rerunning the same command resumes where it stopped.
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from models import (
+    db, Like, Plant, PlantFacet, StringList, text_to_list, utcnow
+)
+from perenual import BACKGROUND
+from quota import QuotaExhausted
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CHECKPOINT = '.plants-import.json'
+READ_CHUNK_SIZE = 64 * 1024
+
+# stored as text before; migrate_list_columns moves them to JSON arrays
+LIST_COLUMNS = ('scientific_name', 'sunlight')
+LIST_INDEXES = ('ix_plants_scientific_name_trgm', 'ix_plants_sunlight')
+
+# added after the tables were first made; migrate_timestamp_columns adds
+# them, keyed by table, with the columns that identify a row
+TIMESTAMP_COLUMNS = {
+    'plants': (('id',), ('updated_at', 'fetched_at')),
+    'likes': (('user_id', 'plant_id'), ('created_at',)),
+}
+TIMESTAMP_INDEXES = ('ix_plants_updated_at', 'ix_likes_user_created')
+# fetched_at for rows from before it existed: long enough ago that local
+# search treats them as stale until Perenual sends them again
+NEVER_FETCHED = datetime(1970, 1, 1)
+
+plants_cli = AppGroup('plants', help='Manage the plants catalog.')
+
+
+#######################################
+# sources
+
+
+def iter_ndjson(path):
+    """Yield plant dicts from an NDJSON file.
+
+    A line may hold one plant, or a whole species-list page ({"data": [...]}).
+    """
+
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+
+            record = json.loads(line)
+
+            if isinstance(record, dict) and 'data' in record:
+                yield from record['data']
+            else:
+                yield record
+
+
+def iter_json_array(path):
+    """Yield plant dicts from a file holding one JSON array, without loading
+    the whole file.
+
+    A file holding a single species-list page ({"data": [...]}) is loaded in
+    one go instead.
+    """
+
+    decoder = json.JSONDecoder()
+
+    with open(path, encoding='utf-8') as file:
+        buffer = file.read(READ_CHUNK_SIZE).lstrip()
+
+        if buffer.startswith('{'):
+            yield from json.loads(buffer + file.read())['data']
+            return
+
+        if not buffer.startswith('['):
+            raise click.ClickException(f'{path} is not a JSON array.')
+
+        buffer = buffer[1:]
+        eof = False
+
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+
+            if buffer.startswith(']'):
+                return
+
+            try:
+                record, end = decoder.raw_decode(buffer)
+
+            except json.JSONDecodeError:
+                if eof:
+                    raise click.ClickException(f'{path} is truncated.')
+
+                chunk = file.read(READ_CHUNK_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+
+            yield record
+            buffer = buffer[end:]
+
+
+def iter_dump(path, skip=0):
+    """Yield plant dicts from a dump file, skipping the first skip of them."""
+
+    if path.endswith(('.ndjson', '.jsonl')):
+        records = iter_ndjson(path)
+    else:
+        records = iter_json_array(path)
+
+    for position, record in enumerate(records):
+        if position >= skip:
+            yield record
+
+
+def iter_upstream_pages(client, start_page=1, sleep=time.sleep):
+    """Yield (page, plants) for every page of Perenual's species list.
+
+    Calls are background priority, so the import leaves the rate
+    scheduler's reserve to users' searches; when it's turned away, it waits
+    as long as the scheduler says and tries again. With the daily quota
+    gone, it stops (rerun tomorrow to resume).
+    """
+
+    page = start_page
+
+    while True:
+        try:
+            plant_data = client.species_list(
+                None, page=page, priority=BACKGROUND
+            )
+
+        except QuotaExhausted as exc:
+            if exc.retry_after is None:
+                raise click.ClickException(
+                    f'Out of Perenual quota for today at page {page}; rerun '
+                    f'to resume.'
+                )
+            sleep(exc.retry_after)
+            continue
+
+        yield page, plant_data.get('data') or []
+
+        if page >= (plant_data.get('last_page') or page):
+            return
+
+        page += 1
+
+
+#######################################
+# checkpoints
+
+
+def read_checkpoint(path, source):
+    """Return the saved position for source, or 0 if there isn't one."""
+
+    try:
+        with open(path, encoding='utf-8') as file:
+            checkpoint = json.load(file)
+
+    except FileNotFoundError:
+        return 0
+
+    if checkpoint.get('source') != source:
+        return 0
+
+    return checkpoint['position']
+
+
+def write_checkpoint(path, source, position):
+    """Atomically save how far the import of source has got."""
+
+    tmp_path = f'{path}.tmp'
+
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({'source': source, 'position': position}, file)
+
+    os.replace(tmp_path, path)
+
+
+#######################################
+# loading
+
+
+class ImportProgress:
+    """Counts imported plants and reports the running rate."""
+
+    def __init__(self):
+        self.count = 0
+        self.started = time.perf_counter()
+
+    def add(self, count):
+        self.count += count
+        elapsed = time.perf_counter() - self.started
+        rate = self.count / elapsed if elapsed else 0
+
+        click.echo(f'{self.count} plants imported ({rate:,.0f}/s)')
+
+
+def load_batch(records):
+    """Normalize and upsert one batch of Perenual plant dicts; commit.
+
+    Returns how many records were in the batch.
+    """
+
+    Plant.upsert_many(
+        [Plant.from_perenual(record) for record in records if record.get('id')],
+        refresh=True,
+    )
+    db.session.commit()
+
+    return len(records)
+
+
+@plants_cli.command('import')
+@click.argument('dump', required=False, type=click.Path(exists=True))
+@click.option(
+    '--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True,
+    help='Plants written per statement/transaction.',
+)
+@click.option(
+    '--checkpoint', default=DEFAULT_CHECKPOINT, show_default=True,
+    type=click.Path(), help='File recording progress, for resuming.',
+)
+@click.option('--restart', is_flag=True, help='Ignore any saved checkpoint.')
+def import_plants(dump, batch_size, checkpoint, restart):
+    """Import plants from DUMP (JSON array or NDJSON), or, without DUMP, from
+    Perenual's whole species list.
+    """
+
+    source = os.path.abspath(dump) if dump else 'perenual:species-list'
+    position = 0 if restart else read_checkpoint(checkpoint, source)
+    progress = ImportProgress()
+
+    if position:
+        click.echo(f'Resuming {source} from {position}.')
+
+    if dump:
+        batch = []
+
+        for record in iter_dump(dump, skip=position):
+            batch.append(record)
+
+            if len(batch) >= batch_size:
+                position += load_batch(batch)
+                write_checkpoint(checkpoint, source, position)
+                progress.add(len(batch))
+                batch = []
+
+        if batch:
+            position += load_batch(batch)
+            write_checkpoint(checkpoint, source, position)
+            progress.add(len(batch))
+
+    else:
+        client = current_app.extensions['perenual']
+        batch = []
+
+        # flush on page boundaries, so the checkpoint is always a whole page
+        for page, records in iter_upstream_pages(client, position + 1):
+            batch.extend(records)
+
+            if len(batch) >= batch_size:
+                load_batch(batch)
+                write_checkpoint(checkpoint, source, page)
+                progress.add(len(batch))
+                batch = []
+
+        if batch:
+            load_batch(batch)
+            write_checkpoint(checkpoint, source, page)
+            progress.add(len(batch))
+
+    click.echo(f'Done: {progress.count} plants imported.')
+
+
+@plants_cli.command('recount-facets')
+def recount_facets():
+    """Rebuild the per-value plant counts behind the search filters from
+    the plants table. They're kept up to date as plants are stored; this is
+    for after plants were changed or deleted by hand, or a migration.
+    """
+
+    plants = PlantFacet.recount()
+    db.session.commit()
+
+    click.echo(f'Counted facets of {plants} plants.')
+
+
+#######################################
+# migrations
+
+
+def list_columns_pending(conn):
+    """Return the LIST_COLUMNS of the plants table that are still text."""
+
+    columns = {
+        column['name']: column['type']
+        for column in db.inspect(conn).get_columns('plants')
+    }
+
+    return [
+        name for name in LIST_COLUMNS
+        if not isinstance(columns[name], db.JSON)
+    ]
+
+
+def convert_list_batch(conn, columns, after, batch_size):
+    """Fill in the <column>_list copies of columns from the text originals,
+    for up to batch_size rows after id `after` that haven't been. Returns
+    (last id converted, rows converted), or None if none were left.
+    """
+
+    plants = db.table(
+        'plants', db.column('id'),
+        *(db.column(name, db.Text) for name in columns),
+        *(db.column(f'{name}_list', StringList) for name in columns),
+    )
+
+    rows = conn.execute(
+        db.select(plants.c.id, *(plants.c[name] for name in columns))
+        .where(plants.c.id > after)
+        .where(db.or_(*(
+            plants.c[f'{name}_list'].is_(None) for name in columns
+        )))
+        .order_by(plants.c.id)
+        .limit(batch_size)
+    ).all()
+
+    if not rows:
+        return None
+
+    conn.execute(
+        db.update(plants)
+        .where(plants.c.id == db.bindparam('plant_id'))
+        .values({
+            f'{name}_list': db.bindparam(f'new_{name}', type_=StringList)
+            for name in columns
+        }),
+        [
+            {'plant_id': row.id,
+             **{f'new_{name}': text_to_list(row._mapping[name])
+                for name in columns}}
+            for row in rows
+        ],
+    )
+
+    return rows[-1].id, len(rows)
+
+
+def migrate_list_columns(engine, batch_size=DEFAULT_BATCH_SIZE,
+                         echo=click.echo):
+    """Convert the plants table's text LIST_COLUMNS to JSON arrays (JSONB
+    on Postgres), without rewriting the table under one long lock:
+
+    1. add a nullable <column>_list JSON column beside each
+    2. fill them in from the text, batch_size rows per transaction
+    3. in one short transaction: fill in rows added meanwhile, drop the text
+       columns, rename the copies into their place, make them NOT NULL
+       (Postgres only; SQLite can't alter a column) and build their indexes
+
+    Safe to rerun: an interrupted run resumes where it stopped, and a
+    migrated table is left alone. Returns the number of rows converted.
+    """
+
+    with engine.begin() as conn:
+        columns = list_columns_pending(conn)
+        existing = {
+            column['name'] for column in db.inspect(conn).get_columns('plants')
+        }
+
+        for name in columns:
+            if f'{name}_list' not in existing:
+                conn.execute(db.text(
+                    f'ALTER TABLE plants ADD COLUMN {name}_list '
+                    f'{StringList.compile(dialect=engine.dialect)}'
+                ))
+
+    if not columns:
+        echo('List columns are already JSON.')
+        return 0
+
+    converted = after = 0
+
+    while True:
+        with engine.begin() as conn:
+            batch = convert_list_batch(conn, columns, after, batch_size)
+
+        if batch is None:
+            break
+
+        after, count = batch
+        converted += count
+        echo(f'{converted} plants converted.')
+
+    postgres = engine.dialect.name == 'postgresql'
+
+    with engine.begin() as conn:
+        # rows written since the batches above (by a still-running app)
+        after = 0
+        while batch := convert_list_batch(conn, columns, after, batch_size):
+            after, count = batch
+            converted += count
+
+        for name in columns:
+            if postgres:
+                conn.execute(db.text(
+                    f'DROP INDEX IF EXISTS ix_plants_{name}_trgm'
+                ))
+            conn.execute(db.text(f'ALTER TABLE plants DROP COLUMN {name}'))
+            conn.execute(db.text(
+                f'ALTER TABLE plants RENAME COLUMN {name}_list TO {name}'
+            ))
+            if postgres:
+                conn.execute(db.text(
+                    f'ALTER TABLE plants ALTER COLUMN {name} SET NOT NULL'
+                ))
+
+        if postgres:
+            for index in Plant.__table__.indexes:
+                if index.name in LIST_INDEXES:
+                    index.create(conn, checkfirst=True)
+
+    echo(f'Done: {", ".join(columns)} converted to JSON arrays.')
+
+    return converted
+
+
+@plants_cli.command('migrate-lists')
+@click.option(
+    '--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True,
+    help='Rows converted per transaction.',
+)
+def migrate_lists(batch_size):
+    """Convert scientific_name and sunlight from list-shaped text to JSON
+    arrays, in batches.
+    """
+
+    migrate_list_columns(db.engine, batch_size)
+
+
+def timestamp_columns_pending(conn):
+    """Return {table: [column, ...]} of the TIMESTAMP_COLUMNS that are
+    missing or still nullable.
+    """
+
+    pending = {}
+
+    for table, (_keys, columns) in TIMESTAMP_COLUMNS.items():
+        existing = {
+            column['name']: column
+            for column in db.inspect(conn).get_columns(table)
+        }
+        names = [
+            name for name in columns
+            if name not in existing or existing[name]['nullable']
+        ]
+        if names:
+            pending[table] = names
+
+    return pending
+
+
+def backfill_batch(conn, table, columns, values, batch_size):
+    """Set columns of up to batch_size rows of table where any is NULL to
+    values (column: value), leaving those already set alone. Returns the
+    number of rows updated.
+    """
+
+    keys = TIMESTAMP_COLUMNS[table][0]
+    rows = db.table(
+        table, *(db.column(name) for name in keys),
+        *(db.column(name, db.DateTime) for name in columns),
+    )
+    key = db.tuple_(*(rows.c[name] for name in keys))
+
+    return conn.execute(
+        db.update(rows)
+        .where(key.in_(
+            db.select(*(rows.c[name] for name in keys))
+            .where(db.or_(*(rows.c[name].is_(None) for name in columns)))
+            .limit(batch_size)
+        ))
+        .values({
+            name: db.func.coalesce(rows.c[name], values[name])
+            for name in columns
+        })
+    ).rowcount
+
+
+def migrate_timestamp_columns(engine, batch_size=DEFAULT_BATCH_SIZE,
+                              echo=click.echo):
+    """Add plants.updated_at, plants.fetched_at and likes.created_at, and
+    the indexes on them, to tables made before they existed, without
+    rewriting the tables under one long lock:
+
+    1. add each missing column, nullable
+    2. backfill them, batch_size rows per transaction: updated_at and
+       created_at with now (so liked plants keep their plant id order),
+       fetched_at with NEVER_FETCHED
+    3. in one short transaction: backfill rows added meanwhile, make the
+       columns NOT NULL and give created_at its server default (Postgres
+       only; SQLite can't alter a column) and build TIMESTAMP_INDEXES
+
+    Safe to rerun: an interrupted run resumes where it stopped. Returns the
+    number of rows backfilled.
+    """
+
+    with engine.begin() as conn:
+        pending = timestamp_columns_pending(conn)
+
+        for table, columns in pending.items():
+            existing = {
+                column['name']
+                for column in db.inspect(conn).get_columns(table)
+            }
+            for name in columns:
+                if name not in existing:
+                    conn.execute(db.text(
+                        f'ALTER TABLE {table} ADD COLUMN {name} '
+                        f'{db.DateTime().compile(dialect=engine.dialect)}'
+                    ))
+
+    if not pending:
+        echo('Timestamp columns are already in place.')
+        return 0
+
+    now = utcnow()
+    values = {
+        'updated_at': now, 'created_at': now, 'fetched_at': NEVER_FETCHED,
+    }
+    backfilled = 0
+
+    for table, columns in pending.items():
+        while True:
+            with engine.begin() as conn:
+                count = backfill_batch(
+                    conn, table, columns, values, batch_size
+                )
+
+            if not count:
+                break
+
+            backfilled += count
+            echo(f'{backfilled} rows backfilled.')
+
+    postgres = engine.dialect.name == 'postgresql'
+
+    with engine.begin() as conn:
+        for table, columns in pending.items():
+            # rows written since the batches above (by a still-running app)
+            while count := backfill_batch(
+                conn, table, columns, values, batch_size
+            ):
+                backfilled += count
+
+            if postgres:
+                for name in columns:
+                    conn.execute(db.text(
+                        f'ALTER TABLE {table} ALTER COLUMN {name} SET NOT NULL'
+                    ))
+                if 'created_at' in columns:
+                    conn.execute(db.text(
+                        f'ALTER TABLE {table} ALTER COLUMN created_at '
+                        f'SET DEFAULT now()'
+                    ))
+
+        for index in (*Plant.__table__.indexes, *Like.__table__.indexes):
+            if index.name in TIMESTAMP_INDEXES:
+                index.create(conn, checkfirst=True)
+
+    echo(f'Done: {backfilled} rows backfilled.')
+
+    return backfilled
+
+
+@plants_cli.command('migrate-timestamps')
+@click.option(
+    '--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True,
+    help='Rows backfilled per transaction.',
+)
+def migrate_timestamps(batch_size):
+    """Add plants.updated_at and fetched_at and likes.created_at to a
+    database made before them, in batches.
+    """
+
+    migrate_timestamp_columns(db.engine, batch_size)
@@ -57,6 +57,35 @@ async function checkLikes(plantId) {
 }
 
 
+/** checkLikesBatch: checks like status for a whole page of results with one
+ *  request, instead of one checkLikes call per card.
+ */
+
+async function checkLikesBatch(plantIds) {
+  if (plantIds.length === 0) return;
+
+  for (const plantId of plantIds) {
+    $(`#unlike-${plantId}`).on("click", unlike);
+    $(`#like-${plantId}`).on("click", like);
+  }
+
+  const params = new URLSearchParams();
+  for (const plantId of plantIds) params.append("plant_id", plantId);
+
+  const response = await axios.get("/api/likes/batch", { params });
+  const result = response.data;
+
+  if ("error" in result) {
+    console.log(result.error);
+  } else {
+    for (const plantId of plantIds) {
+      if (result.likes[plantId]) $(`#unlike-${plantId}`).show();
+      else $(`#like-${plantId}`).show();
+    }
+  }
+}
+
+
 /**
  *  Liking/Unliking/Checking Likes on Plant Detail Page:
  */
@@ -1,13 +1,17 @@
 "use strict";
 
 const BASE_URL = '/api/get-plant-list';
-const DEFAULT_IMG_URL = '/static/images/sadplant.png';
-const DEFAULT_UPGRADE_TEXT = 'upgrade API plan';
+const FACETS_URL = '/api/facets';
+const SUGGEST_URL = '/api/suggest';
 
 const $resultsArea = $("#resultsArea");
 const $searchForm = $("#search-form");
+const $moreResults = $("#more-results");
 
-let plantId = '';
+let currentTerm = '';
+let currentFilters = {};
+let currentPage = 1;
+let lastPage = 1;
 
 /** processSearchForm: handle submission of form:
  *
@@ -16,79 +20,23 @@ let plantId = '';
  * - else: show results
  */
 
-async function processSearchForm() {
-  console.log('We got into processSearchForm!');
-  console.debug('processSearchForm ran!');
-
-  const term = $("#plant-search").val();
-  console.log('This is term', term);
-
+async function processSearchForm(term, page = 1, filters = {}) {
   const formData = await fetch(BASE_URL, {
     method: "POST",
-    body: JSON.stringify({term}),
+    body: JSON.stringify({term, page, ...filters}),
     headers: {
       "Content-Type": "application/json"
     }
   });
 
   const plantData = await formData.json();
-  console.log('This is plantData', plantData);
-
-  const plants = [];
-  for (const plant of plantData.data) {
-    let {
-      id,
-      common_name,
-      scientific_name,
-      cycle,
-      watering,
-      sunlight,
-      default_image,
-    } = plant;
-
-    if (default_image === null ||
-      default_image.medium_url ===
-      "https://perenual.com/storage/image/upgrade_access.jpg") {
-        default_image = DEFAULT_IMG_URL;
-    } else if (default_image.medium_url === undefined) {
-      default_image = default_image.original_url;
-    } else {
-      default_image = default_image.medium_url;
-    }
-
-    if (cycle ===
-      ("Upgrade Plans To Premium/Supreme - " +
-      "https://perenual.com/subscription-api-pricing. I'm sorry")
-      ) {
-        cycle = DEFAULT_UPGRADE_TEXT;
-      }
-
-    if (watering ===
-      ("Upgrade Plans To Premium/Supreme - " +
-      "https://perenual.com/subscription-api-pricing. I'm sorry")
-      ) {
-        watering = DEFAULT_UPGRADE_TEXT;
-      }
 
-    if (sunlight ===
-      ("Upgrade Plans To Premium/Supreme - " +
-      "https://perenual.com/subscription-api-pricing. I'm sorry")
-      ) {
-        sunlight = DEFAULT_UPGRADE_TEXT;
-      }
+  currentPage = plantData.current_page || page;
+  lastPage = plantData.last_page || currentPage;
 
-    plants.push(
-      {
-        id,
-        common_name,
-        scientific_name,
-        cycle,
-        watering,
-        sunlight,
-        default_image,
-      }
-    );
-  }
+  // the server has already cleaned the plants up for display: image URLs
+  // resolved, "upgrade" placeholders replaced, lists joined into text
+  const plants = plantData.data || [];
 
   return plants;
 
@@ -130,8 +78,8 @@ function removeResults() {
 
 /** showResults: shows search results in the DOM.
  *
- *  data parameter is expecting an array of plant data with each item an
- *  individual plant
+ *  plants is an array of search-result cards from the server, one per
+ *  plant
 */
 
 function showResults(plants) {
@@ -140,12 +88,12 @@ function showResults(plants) {
     $resultsArea.append(result);
   }
 
+  checkLikesBatch(plants.map(plant => plant.id));
 }
 
 /** generateResultsMarkup: generates markup for plant data. */
 
 function generateResultsMarkup(plant) {
-  console.log('This is plant.id', plant.id);
   return `
     <div class="card h-150 text-bg-secondary gx-0" style="max-width: 19rem">
       <img
@@ -174,22 +122,107 @@ function generateResultsMarkup(plant) {
           <a href="/plants/${plant.id}" class="card-text"><i>More Details</i></a>
         </div>
       </div>
-
-      <script>
-        plantId = ${plant.id};
-        console.log('This is plantId from search.js', plantId);
-        checkLikes(${plant.id});
-      </script>
   `;
 }
 
 
+/** loadFacets: show how many plants have each filter value, adding any
+ *  value stored since the page was rendered.
+ */
+
+async function loadFacets() {
+  const resp = await fetch(FACETS_URL);
+  const facets = await resp.json();
+
+  $(".search-filter").each(function () {
+    const $select = $(this);
+    const counts = facets[$select.data("facet")] || {};
+
+    for (const [value, count] of Object.entries(counts)) {
+      let $option = $select.find("option").filter(
+        (i, option) => option.value === value
+      );
+      if (!$option.length) {
+        $option = $("<option>").val(value).appendTo($select);
+      }
+      $option.text(`${value} (${count})`);
+    }
+  });
+}
+
+/** searchFilters: the chosen filters, e.g. {cycle: "Perennial"}. */
+
+function searchFilters() {
+  const filters = {};
+
+  $(".search-filter").each(function () {
+    const value = $(this).val();
+    if (value) filters[$(this).data("facet")] = value;
+  });
+
+  return filters;
+}
+
+
+/** showSuggestions: offer plant names starting with what's been typed.
+ *  Answers can arrive out of order; only the latest one is shown.
+ */
+
+let suggestRequest = 0;
+
+async function showSuggestions() {
+  const q = $("#plant-search").val().trim();
+  const request = ++suggestRequest;
+  const $suggestions = $("#plant-suggestions");
+
+  if (!q) {
+    $suggestions.empty();
+    return;
+  }
+
+  const resp = await fetch(`${SUGGEST_URL}?${new URLSearchParams({q})}`);
+  const {suggestions} = await resp.json();
+  if (request !== suggestRequest) return;
+
+  $suggestions.empty();
+  for (const plant of suggestions) {
+    $suggestions.append($("<option>").val(plant.name));
+  }
+}
+
+
+/** toggleMoreResults: only offer the next page if there is one. */
+
+function toggleMoreResults() {
+  if (currentPage < lastPage) $moreResults.show();
+  else $moreResults.hide();
+}
+
+
 async function processFormDataDisplayResults(evt) {
   evt.preventDefault();
   $resultsArea.empty();
-  const plants = await processSearchForm();
+  currentTerm = $("#plant-search").val();
+  currentFilters = searchFilters();
+  const plants = await processSearchForm(currentTerm, 1, currentFilters);
   showResults(plants);
+  toggleMoreResults();
+}
+
+/** showMoreResults: append the next page of results. The server prefetches
+ *  upcoming pages, so this is usually answered from its cache.
+ */
 
+async function showMoreResults(evt) {
+  evt.preventDefault();
+  const plants = await processSearchForm(
+    currentTerm, currentPage + 1, currentFilters
+  );
+  showResults(plants);
+  toggleMoreResults();
 }
 
 $searchForm.on("submit", processFormDataDisplayResults);
+$moreResults.on("click", showMoreResults);
+$("#plant-search").on("input", showSuggestions);
+if ($(".search-filter").length) loadFacets();
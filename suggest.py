@@ -0,0 +1,244 @@
+"""In-memory prefix index of plant names, for search-as-you-type.
+
+/api/suggest?q=<prefix> is answered from a SuggestIndex, never from the
+database or Perenual. The index is a sorted list with one entry per way of
+finding a plant:
+
+    ("japanese maple", rank, plant id, "Japanese Maple")  its common name
+    ("maple", rank, plant id, "Japanese Maple")   ...from each later word
+    ("acer palmatum", rank, plant id, "Acer palmatum")  each scientific name
+
+A lookup bisects to the first key with the prefix and ranks the entries
+after it that share the prefix (at most MAX_SCAN of them, so a one-letter
+prefix costs no more than a long one): whole names before later words,
+common names before scientific ones, shorter names first.
+
+The index is loaded from a snapshot (gzipped JSON of every plant's names,
+written atomically, so workers can share one file), then plants stored
+since are added one by one with add().
+"""
+
+import bisect
+import gzip
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+from utils import normalize_term
+
+# entries looked at per lookup; bounds its cost however short the prefix
+MAX_SCAN = 200
+
+# rank buckets; a name's length is added on, so shorter names come first
+WHOLE_COMMON = 0
+WHOLE_SCIENTIFIC = 1000
+LATER_WORD = 2000
+
+
+def index_entries(plant_id, common_name, scientific_names):
+    """Return the sorted entries for one plant (see above)."""
+
+    entries = set()
+
+    for position, name in enumerate((common_name, *scientific_names)):
+        key = normalize_term(name)
+        if not key:
+            continue
+
+        length = min(len(key), 999)
+        whole = WHOLE_COMMON if position == 0 else WHOLE_SCIENTIFIC
+        entries.add((key, whole + length, plant_id, name))
+
+        if position == 0:
+            words = key.split(' ')
+            for start in range(1, len(words)):
+                entries.add((
+                    ' '.join(words[start:]), LATER_WORD + length, plant_id,
+                    name,
+                ))
+
+    return sorted(entries)
+
+
+class SuggestIndex:
+    """Plant names by prefix, kept in memory.
+
+    Lookups take no lock (one bisect plus a slice of at most MAX_SCAN
+    entries); add() and load() take one, so writers don't interleave.
+    Size and lookup counters are available from stats().
+    """
+
+    def __init__(self):
+        # sorted (key, rank, plant id, name); lookups read only this
+        self._entries = []
+        # plant id -> (common name, scientific names)
+        self._plants = {}
+        self._lock = threading.Lock()
+
+        # newest Plant.updated_at indexed, where catching up starts; and
+        # when (time.monotonic()) the caller last caught up
+        self.updated_at = None
+        self.checked = None
+        self.loaded = False
+
+        self.lookups = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._plants)
+
+    def load(self, plants, updated_at=None):
+        """Replace the whole index with plants, an iterable of (id, common
+        name, scientific names) tuples. Sorts once; much faster than add()
+        for a whole catalog.
+        """
+
+        names = {
+            plant_id: (common_name, tuple(scientific_names))
+            for plant_id, common_name, scientific_names in plants
+        }
+        entries = sorted(
+            entry
+            for plant_id, (common_name, scientific_names) in names.items()
+            for entry in index_entries(plant_id, common_name, scientific_names)
+        )
+
+        with self._lock:
+            self._entries = entries
+            self._plants = names
+            self.updated_at = updated_at
+            self.loaded = True
+
+    def add(self, plants, updated_at=None):
+        """Index plants ((id, common name, scientific names) tuples), or
+        re-index ones whose names changed. Returns how many changed.
+        """
+
+        changed = 0
+
+        with self._lock:
+            for plant_id, common_name, scientific_names in plants:
+                names = (common_name, tuple(scientific_names))
+                old = self._plants.get(plant_id)
+
+                if old == names:
+                    continue
+
+                if old is not None:
+                    for entry in index_entries(plant_id, *old):
+                        position = bisect.bisect_left(self._entries, entry)
+                        if self._entries[position:position + 1] == [entry]:
+                            del self._entries[position]
+
+                for entry in index_entries(plant_id, *names):
+                    bisect.insort(self._entries, entry)
+
+                self._plants[plant_id] = names
+                changed += 1
+
+            if updated_at and (
+                self.updated_at is None or updated_at > self.updated_at
+            ):
+                self.updated_at = updated_at
+
+        return changed
+
+    def complete(self, prefix, limit=8):
+        """Return up to limit [{"id", "name"}] of plants with a name (or a
+        later word of their common name) starting with prefix, best first.
+        """
+
+        key = normalize_term(prefix)
+        self.lookups += 1
+
+        if not key:
+            return []
+
+        entries = self._entries
+        start = bisect.bisect_left(entries, (key,))
+        matches = []
+
+        for entry in entries[start:start + MAX_SCAN]:
+            if not entry[0].startswith(key):
+                break
+            matches.append(entry)
+
+        if not matches:
+            self.misses += 1
+            return []
+
+        matches.sort(key=lambda entry: (entry[1], entry[0]))
+
+        results = []
+        seen = set()
+
+        for _key, _rank, plant_id, name in matches:
+            if plant_id in seen:
+                continue
+            seen.add(plant_id)
+
+            results.append({"id": plant_id, "name": name})
+
+            if len(results) >= limit:
+                break
+
+        return results
+
+    def stats(self):
+        """Return a dict of index size and lookup counters."""
+
+        return {
+            "plants": len(self._plants),
+            "entries": len(self._entries),
+            "lookups": self.lookups,
+            "misses": self.misses,
+        }
+
+    def save(self, path):
+        """Write a snapshot of the index to path (atomically)."""
+
+        with self._lock:
+            snapshot = {
+                "updated_at": (
+                    self.updated_at and self.updated_at.isoformat()
+                ),
+                "plants": [
+                    [plant_id, common_name, list(scientific_names)]
+                    for plant_id, (common_name, scientific_names)
+                    in self._plants.items()
+                ],
+            }
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+
+        try:
+            with gzip.open(os.fdopen(fd, 'wb'), 'wt') as snapshot_file:
+                json.dump(snapshot, snapshot_file, separators=(',', ':'))
+            os.replace(tmp_path, path)
+
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def load_snapshot(self, path):
+        """Load the index from a snapshot written by save(). Returns False
+        (leaving the index alone) if there's no readable snapshot at path.
+        """
+
+        try:
+            with gzip.open(path, 'rt') as snapshot_file:
+                snapshot = json.load(snapshot_file)
+
+        except (OSError, ValueError):
+            return False
+
+        updated_at = snapshot.get("updated_at")
+        self.load(
+            snapshot["plants"],
+            updated_at and datetime.fromisoformat(updated_at),
+        )
+
+        return True
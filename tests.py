@@ -1,14 +1,63 @@
 from sqlalchemy.exc import IntegrityError
-from models import db, Plant, User
-from app import app, CURR_USER_KEY
+from models import (
+    db, Plant, PlantDetails, PlantFacet, User, Like, DEFAULT_IMG_URL,
+    DEFAULT_UPGRADE_TEXT, FACETS, PLANT_CYCLES
+)
+from app import (
+    create_app, reset_after_fork, reset_apps_after_fork, CURR_USER_KEY,
+    prefetch_pages, species_cache_key, store_species_page, thumbnail_url,
+    _prefetching, _refreshing
+)
+from config import load_config, DevelopmentConfig
+from json_providers import make_json_provider
 from flask import session
 from unittest import TestCase
+from unittest.mock import patch, Mock
+from utils import SharedFlight, SingleFlight, TTLCache, make_cache_key
+from perenual import (
+    BACKGROUND, INTERACTIVE, PerenualClient, PerenualError
+)
+from quota import QuotaExhausted, RateScheduler
+from passwords import HasherBusy, PasswordHasher, hash_rounds
+from metrics import (
+    Histogram, PERENUAL_LATENCY, POOL_CHECKOUT_WAIT, TimedQueuePool
+)
+from sqlalchemy import create_engine, text
+from benchmarks.record_fixtures import FIXTURES_DIR
+from seed import (
+    NEVER_FETCHED, iter_upstream_pages, list_columns_pending,
+    migrate_list_columns, migrate_timestamp_columns,
+    timestamp_columns_pending
+)
+from suggest import SuggestIndex
+from benchmarks.stub_perenual import start_in_thread
+from thumbnails import ThumbnailCache, THUMBNAIL_SIZES
+from PIL import Image
 "Tests for Plant App."
 
+import click
+import gzip
+import io
+import json
+import json_providers
 import os
-
-os.environ["DATABASE_URL"] = "postgresql:///plant_app_test"
-
+import requests
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+# the testing profile uses TEST_DATABASE_URL (default plant_app_test)
+app = create_app('testing')
+perenual = app.extensions['perenual']
+species_cache = app.extensions['species_cache']
+user_cache = app.extensions['user_cache']
+password_hasher = app.extensions['password_hasher']
 
 # Make Flask errors be real errors, rather than HTML pages with error info
 app.config['TESTING'] = True
@@ -18,6 +67,9 @@ app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
 # Don't req CSRF for testing
 app.config['WTF_CSRF_ENABLED'] = False
 
+# the app no longer pushes a context of its own
+app.app_context().push()
+
 db.drop_all()
 db.create_all()
 
@@ -65,13 +117,111 @@ TEST_USER_DATA_NEW = dict(
 
 TEST_PLANT_DATA = dict(
     common_name="Rose",
-    scientific_name="Rosa",
+    scientific_name=["Rosa"],
     cycle="Perennial",
     watering="Weekly",
-    sunlight="Full Sun",
+    sunlight=["Full Sun"],
 )
 
 
+#######################################
+# app factory
+
+
+class AppFactoryTestCase(TestCase):
+    """Tests for create_app and its config profiles."""
+
+    def test_testing_profile(self):
+        self.assertTrue(app.config['TESTING'])
+        self.assertFalse(app.config['SQLALCHEMY_ECHO'])
+        self.assertNotIn('debugtoolbar', app.blueprints)
+        self.assertIn('main.homepage', app.view_functions)
+
+    def test_development_profile_installs_toolbar(self):
+        config = DevelopmentConfig()
+        config.SQLALCHEMY_DATABASE_URI = 'sqlite://'
+        config.LOG_FORMAT = None
+
+        dev_app = create_app(config)
+
+        self.assertIn('debugtoolbar', dev_app.blueprints)
+        self.assertFalse(dev_app.config['SQLALCHEMY_ECHO'])
+
+    def test_apps_keep_their_own_state(self):
+        config = load_config('testing')
+        config.SQLALCHEMY_DATABASE_URI = 'sqlite://'
+        config.BCRYPT_LOG_ROUNDS = 5
+        config.USER_CACHE_TTL = 1
+
+        other_app = create_app(config)
+
+        for name in ('species_cache', 'search_flights', 'user_cache',
+                     'password_hasher'):
+            self.assertIsNot(other_app.extensions[name], app.extensions[name])
+
+        # making another app left this one's settings alone
+        self.assertEqual(password_hasher.rounds, 4)
+        self.assertEqual(user_cache.ttl, app.config['USER_CACHE_TTL'])
+        self.assertEqual(other_app.extensions['password_hasher'].rounds, 5)
+
+        with patch("app.reset_after_fork") as reset:
+            reset_apps_after_fork()
+
+        reset_apps = [call.args[0] for call in reset.call_args_list]
+        self.assertIn(app, reset_apps)
+        self.assertIn(other_app, reset_apps)
+
+    def test_production_requires_settings(self):
+        with patch.dict(os.environ, {"DATABASE_URL": "sqlite://"}):
+            os.environ.pop("PERENUAL_API_KEY", None)
+
+            with self.assertRaises(RuntimeError):
+                load_config('production')
+
+    def test_production_requires_secret_key(self):
+        with patch.dict(os.environ, {"DATABASE_URL": "sqlite://",
+                                     "PERENUAL_API_KEY": "x",
+                                     "METRICS_TOKEN": "x"}):
+            os.environ.pop("FLASK_SECERT_KEY", None)
+
+            with self.assertRaisesRegex(RuntimeError, "SECRET_KEY"):
+                load_config('production')
+
+            os.environ["FLASK_SECERT_KEY"] = "not so secret"
+            self.assertEqual(
+                load_config('production').SECRET_KEY, "not so secret"
+            )
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            load_config('staging')
+
+    def test_json_providers(self):
+        when = datetime(2024, 5, 1, 12, 30)
+        data = {"b": 1, "a": when, 3: None}
+
+        for name in ("default", "orjson"):
+            if name == "orjson" and json_providers.orjson is None:
+                continue
+
+            provider = make_json_provider(app, name)
+            encoded = provider.dumps(data)
+
+            # both keep key order and write dates the way Flask does
+            self.assertEqual(list(provider.loads(encoded)), ["b", "a", "3"])
+            self.assertIn('"Wed, 01 May 2024 12:30:00 GMT"', encoded)
+
+        with self.assertRaises(ValueError):
+            make_json_provider(app, "simplejson")
+
+    def test_reset_after_fork(self):
+        reset_after_fork(app)
+
+        # the app still works on fresh connections
+        with app.test_client() as client:
+            self.assertEqual(client.get("/").status_code, 200)
+
+
 #######################################
 # homepage
 
@@ -87,6 +237,25 @@ class HomepageViewsTestCase(TestCase):
             self.assertIn(b'Plant App', resp.data)
             self.assertIn(b'An App to Document Your Plant Journey', resp.data)
 
+    def test_homepage_filters(self):
+        PlantFacet.add(Counter({("watering", "Frequent"): 3}))
+        db.session.commit()
+
+        try:
+            with app.test_client() as client:
+                resp = client.get("/")
+
+        finally:
+            PlantFacet.query.delete()
+            db.session.commit()
+
+        html = resp.get_data(as_text=True)
+        for facet in FACETS:
+            self.assertIn(f'data-facet="{facet}"', html)
+        for cycle in PLANT_CYCLES:
+            self.assertIn(f'<option value="{cycle}">', html)
+        self.assertIn('<option value="Frequent">', html)
+
 
 #######################################
 # saved plants page
@@ -108,6 +277,8 @@ class SavedViewsTestCase(TestCase):
 
         db.session.rollback()
 
+        Like.query.delete()
+        Plant.query.delete()
         User.query.delete()
         db.session.commit()
 
@@ -119,6 +290,143 @@ class SavedViewsTestCase(TestCase):
             self.assertIn(b'Test: saved.html loaded.', resp.data)
             self.assertIn(b'Saved Plants page coming soon!', resp.data)
 
+    def add_likes(self, count):
+        """Add count plants, liked a minute apart (plant 1 first)."""
+
+        Plant.query.delete()
+        start = datetime(2024, 1, 1)
+
+        for plant_id in range(1, count + 1):
+            db.session.add(Plant(
+                id=plant_id,
+                common_name=f"plant {plant_id}",
+                scientific_name=["Plantus"],
+                cycle="Annual" if plant_id % 2 else "Perennial",
+            ))
+            db.session.add(Like(
+                user_id=self.user_id,
+                plant_id=plant_id,
+                created_at=start + timedelta(minutes=plant_id),
+            ))
+
+        db.session.commit()
+
+    def test_saved_page_keyset(self):
+        self.add_likes(30)
+
+        rows, after = Like.saved_page(self.user_id, limit=20)
+        self.assertEqual([row.id for row in rows], list(range(30, 10, -1)))
+
+        rows, after = Like.saved_page(self.user_id, after, 20)
+        self.assertEqual([row.id for row in rows], list(range(10, 0, -1)))
+        self.assertIsNone(after)
+
+        # filters are keyword-only
+        with self.assertRaises(TypeError):
+            Like.saved_page(self.user_id, None, 20, "oldest", "Annual")
+
+        rows, after = Like.saved_page(
+            self.user_id, sort="oldest", cycle="Annual", limit=5
+        )
+        self.assertEqual([row.id for row in rows], [1, 3, 5, 7, 9])
+
+        Plant.query.filter(Plant.id <= 4).update({
+            "watering": "Minimum", "sunlight": ["full sun"]
+        })
+        rows, after = Like.saved_page(
+            self.user_id, sort="oldest", watering="Minimum",
+            sunlight="full sun",
+        )
+        self.assertEqual([row.id for row in rows], [1, 2, 3, 4])
+        self.assertEqual(
+            set(rows[0]._fields),
+            {"id", "common_name", "scientific_name", "default_image",
+             "liked_at"},
+        )
+
+    def test_saved_plants_page_next_link(self):
+        self.add_likes(30)
+
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+            resp = client.get("/saved")
+            html = resp.get_data(as_text=True)
+
+            self.assertIn("plant 30", html)
+            self.assertNotIn("plant 6<", html)
+            self.assertIn("Next page", html)
+
+            next_url = html.split('href="')[-1].split('"')[0].replace(
+                "&amp;", "&"
+            )
+            html = client.get(next_url).get_data(as_text=True)
+
+            self.assertIn("plant 6<", html)
+            self.assertNotIn("plant 7<", html)
+            self.assertNotIn("Next page", html)
+            self.assertIn("First page", html)
+
+    def test_saved_plants_page_no_matches(self):
+        self.add_likes(3)
+
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+            html = client.get("/saved?cycle=Biennial").get_data(as_text=True)
+
+        self.assertIn("No liked plants match these filters.", html)
+        self.assertNotIn("You have no liked plants.", html)
+
+    def test_saved_plants_page_bad_cursor(self):
+        self.add_likes(3)
+
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+            resp = client.get("/saved?after=not-a-cursor&sort=sideways")
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(b"plant 3", resp.data)
+
+    def test_export_saved_plants(self):
+        self.add_likes(3)
+
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+            resp = client.get("/saved/export?sort=oldest")
+
+            self.assertEqual(resp.mimetype, "text/csv")
+            self.assertIn("attachment", resp.headers["Content-Disposition"])
+            self.assertNotIn("Content-Length", resp.headers)
+            lines = resp.get_data(as_text=True).splitlines()
+            self.assertEqual(lines[0], (
+                "id,common_name,scientific_name,cycle,watering,sunlight,"
+                "default_image,liked_at"
+            ))
+            self.assertEqual(len(lines), 4)
+            self.assertTrue(lines[1].startswith("1,plant 1,Plantus,Annual,"))
+
+            resp = client.get(
+                "/saved/export?format=ndjson&cycle=Perennial",
+                headers={"Accept-Encoding": "gzip"},
+            )
+
+            self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+            plants = [
+                json.loads(line)
+                for line in gzip.decompress(resp.data).splitlines()
+            ]
+            self.assertEqual(plants, [{
+                "id": 2, "common_name": "plant 2",
+                "scientific_name": ["Plantus"], "cycle": "Perennial",
+                "watering": DEFAULT_UPGRADE_TEXT, "sunlight": [],
+                "default_image": DEFAULT_IMG_URL,
+                "liked_at": "2024-01-01T00:02:00",
+            }])
+
+    def test_export_saved_plants_not_logged_in(self):
+        with app.test_client() as client:
+            resp = client.get("/saved/export")
+            self.assertEqual(resp.status_code, 302)
+
     def test_saved_plants_page_not_logged_in(self):
         with app.test_client() as client:
             """Tests for saved plants page on not logged-in user."""
@@ -191,6 +499,89 @@ class UserModelTestCase(TestCase):
         db.session.rollback()
 
 
+    def test_authenticate_rehashes_old_work_factor(self):
+        self.addCleanup(setattr, password_hasher, 'rounds', password_hasher.rounds)
+        password_hasher.rounds = 5
+
+        res = User.authenticate("testname", "secretpassword")
+        self.assertEqual(res, self.user)
+        self.assertEqual(hash_rounds(res.hashed_password), 5)
+
+        # and the upgraded hash still works
+        db.session.commit()
+        self.assertEqual(User.authenticate("testname", "secretpassword"), res)
+
+    def test_authenticate_skips_rehash_when_busy(self):
+        self.addCleanup(setattr, password_hasher, 'rounds', password_hasher.rounds)
+        password_hasher.rounds = 5
+        old_hash = self.user.hashed_password
+
+        with patch.object(password_hasher, 'hash', side_effect=HasherBusy):
+            res = User.authenticate("testname", "secretpassword")
+
+        self.assertEqual(res, self.user)
+        self.assertEqual(res.hashed_password, old_hash)
+
+
+class PasswordHasherTestCase(TestCase):
+    """Tests for hashing passwords in a process pool."""
+
+    def test_hash_and_check_in_pool(self):
+        hasher = PasswordHasher(rounds=4, max_workers=1)
+        self.addCleanup(hasher.shutdown)
+
+        hashed = hasher.hash("secretpassword")
+        self.assertEqual(hashed[:7], "$2b$04$")
+        self.assertTrue(hasher.check(hashed, "secretpassword"))
+        self.assertFalse(hasher.check(hashed, "wrongpw"))
+
+        stats = hasher.stats()
+        self.assertEqual(stats["completed"], 3)
+        self.assertEqual(stats["pending"], 0)
+        self.assertEqual(stats["peak_pending"], 1)
+
+    def test_full_queue_is_rejected(self):
+        hasher = PasswordHasher(rounds=4, max_workers=1, max_pending=0)
+
+        with self.assertRaises(HasherBusy):
+            hasher.hash("secretpassword")
+
+        self.assertEqual(hasher.stats()["rejected"], 1)
+
+    def test_timeout_is_busy(self):
+        hasher = PasswordHasher(rounds=4, max_workers=1, timeout=0.01)
+        future = Mock()
+        future.result.side_effect = FutureTimeoutError
+        hasher._pool = Mock(**{"submit.return_value": future})
+        hasher._pid = os.getpid()
+
+        with self.assertRaises(HasherBusy):
+            hasher.hash("secretpassword")
+
+        future.result.assert_called_once_with(0.01)
+        future.cancel.assert_called_once_with()
+        self.assertEqual(hasher.stats()["pending"], 0)
+
+    def test_broken_pool_is_busy_and_replaced(self):
+        hasher = PasswordHasher(rounds=4, max_workers=1)
+        broken = Mock(**{"submit.side_effect": BrokenProcessPool})
+        hasher._pool = broken
+        hasher._pid = os.getpid()
+
+        with self.assertRaises(HasherBusy):
+            hasher.check("$2b$04$" + 53 * "x", "secretpassword")
+
+        self.assertIsNone(hasher._pool)
+
+    def test_needs_rehash(self):
+        hasher = PasswordHasher(rounds=5, max_workers=0)
+
+        self.assertFalse(hasher.needs_rehash(hasher.hash("pw")))
+        self.assertTrue(hasher.needs_rehash(
+            PasswordHasher(rounds=4, max_workers=0).hash("pw")
+        ))
+
+
 #######################################
 # login/logout/registration
 
@@ -255,6 +646,30 @@ class AuthViewsTestCase(TestCase):
 
             self.assertIn(b"Username already taken", resp.data)
 
+    def test_signup_username_taken_skips_hashing(self):
+        """A taken username is turned away before the password is hashed."""
+
+        with app.test_client() as client:
+            with patch.object(password_hasher, 'hash') as hash_password:
+                resp = client.post("/signup", data=TEST_USER_DATA)
+
+            self.assertIn(b"Username already taken", resp.data)
+            hash_password.assert_not_called()
+
+    def test_login_hasher_busy(self):
+        """Login answers 503 when too many hashes are waiting."""
+
+        with app.test_client() as client:
+            with patch.object(password_hasher, 'check', side_effect=HasherBusy):
+                resp = client.post(
+                    "/login",
+                    data={"username": "testname", "password": "secretpassword"},
+                )
+
+            self.assertEqual(resp.status_code, 503)
+            self.assertIn(b"try again", resp.data)
+            self.assertIsNone(session.get(CURR_USER_KEY))
+
     def test_login(self):
         """Tests for user login."""
 
@@ -307,6 +722,84 @@ class AuthViewsTestCase(TestCase):
             self.assertIn(b"Edit Your Profile", resp.data)
             self.assertIn(b"You have no liked plants.", resp.data)
 
+class UserCacheTestCase(TestCase):
+    """Tests for caching/lazily loading the logged-in user."""
+
+    def setUp(self):
+        User.query.delete()
+        user = User.register(**TEST_USER_DATA)
+        db.session.commit()
+        self.user_id = user.id
+        user_cache.clear()
+
+    def tearDown(self):
+        db.session.rollback()
+        User.query.delete()
+        db.session.commit()
+        user_cache.clear()
+
+    def test_user_served_from_cache(self):
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+            client.get("/features")
+
+            with patch.object(
+                db.session, "get", wraps=db.session.get
+            ) as mock_get:
+                resp = client.get("/features")
+
+            self.assertIn(b"test name", resp.data)
+            mock_get.assert_not_called()
+
+    def test_user_loaded_lazily(self):
+        with patch.object(User, "get_cached") as mock_get_cached:
+            with patch.object(
+                perenual, "species_list", return_value={"data": []}
+            ):
+                with app.test_client() as client:
+                    login_for_test(client, self.user_id)
+                    client.post("/api/get-plant-list", json={"term": "zzz"})
+
+        mock_get_cached.assert_not_called()
+
+    def test_logout_invalidates(self):
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+            client.get("/features")
+            self.assertEqual(len(user_cache), 1)
+
+            client.post("/logout")
+            self.assertEqual(len(user_cache), 0)
+
+    def test_update_invalidates(self):
+        User.get_cached(self.user_id)
+        db.session.get(User, self.user_id).first_name = "changed"
+        db.session.commit()
+
+        self.assertEqual(len(user_cache), 0)
+
+    def test_profile_edit_invalidates(self):
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+
+            resp = client.get("/profile/edit")
+            self.assertIn(b"Test: profile edit-form.html loaded.", resp.data)
+            self.assertEqual(len(user_cache), 1)
+
+            resp = client.post("/profile/edit", data={
+                "first_name": "changed",
+                "last_name": "name",
+                "email": "test@name.com",
+            }, follow_redirects=True)
+
+            self.assertIn(b"Profile edited.", resp.data)
+            self.assertIn(b"changed name", resp.data)
+
+            # the next request sees the edit, not the cached copy
+            resp = client.get("/features")
+            self.assertIn(b"changed name", resp.data)
+
+
 #######################################
 # navbar
 
@@ -358,7 +851,21 @@ class NavBarTestCase(TestCase):
 #######################################
 # plants/plant
 
-# TODO: add view test for plant detail page here
+ROSE_DETAILS = {
+    "id": 1,
+    "common_name": "Rose",
+    "description": "A thorny flowering shrub.",
+    "type": "Shrub",
+    "cycle": "Upgrade Plans To Premium/Supreme - "
+             "https://perenual.com/subscription-api-pricing. I'm sorry",
+    "watering": "Average",
+    "hardiness": {"min": "5", "max": "9"},
+    "attracts": ["Bees", "Butterflies"],
+    "indoor": False,
+    "medicinal": "Upgrade Plans To Premium/Supreme - "
+                 "https://perenual.com/subscription-api-pricing. I'm sorry",
+}
+
 
 class PlantDetailViewsTestCase(TestCase):
     """Tests for plant detail page."""
@@ -366,6 +873,7 @@ class PlantDetailViewsTestCase(TestCase):
     def setUp(self):
         """Before each test, add sample plant."""
 
+        PlantDetails.query.delete()
         Plant.query.delete()
         new_plant = Plant(**TEST_PLANT_DATA)
         db.session.add(new_plant)
@@ -374,12 +882,18 @@ class PlantDetailViewsTestCase(TestCase):
         except IntegrityError:
             db.session.rollback()
 
+        patcher = patch.object(
+            perenual, "species_details", return_value=ROSE_DETAILS
+        )
+        self.species_details = patcher.start()
+        self.addCleanup(patcher.stop)
 
     def tearDown(self):
         """After each test, remove all plants."""
 
         db.session.rollback()
 
+        PlantDetails.query.delete()
         Plant.query.delete()
         db.session.commit()
 
@@ -389,4 +903,1627 @@ class PlantDetailViewsTestCase(TestCase):
             resp = client.get('/plants/1')
             self.assertEqual(resp.status_code, 200)
             self.assertIn(b'Rose', resp.data)
-            self.assertIn(b'Cycle: Perennial', resp.data)
\ No newline at end of file
+            self.assertIn(b'Cycle: Perennial', resp.data)
+            self.assertIn(b'Sunlight: Full Sun<br>', resp.data)
+
+    def test_details_fetched_once(self):
+        with app.test_client() as client:
+            resp = client.get('/plants/1')
+            client.get('/plants/1')
+
+        self.species_details.assert_called_once_with(1, priority="interactive")
+        self.assertIn(b'A thorny flowering shrub.', resp.data)
+        self.assertIn(b'Bees, Butterflies', resp.data)
+        self.assertIn(b'5-9', resp.data)
+        self.assertNotIn(b'Medicinal', resp.data)
+
+        # real values fill in the plant; placeholders don't overwrite it
+        plant = db.session.get(Plant, 1)
+        self.assertEqual(plant.watering, "Average")
+        self.assertEqual(plant.cycle, "Perennial")
+
+    def test_stale_details_refresh_in_background(self):
+        with app.test_client() as client:
+            client.get('/plants/1')
+
+        details = db.session.get(PlantDetails, 1)
+        details.fetched_at = datetime(2000, 1, 1)
+        db.session.commit()
+
+        self.species_details.return_value = {
+            **ROSE_DETAILS, "description": "Freshly fetched.",
+        }
+
+        with app.test_client() as client:
+            resp = client.get('/plants/1')
+
+        # served the stored copy without waiting...
+        self.assertIn(b'A thorny flowering shrub.', resp.data)
+
+        # ...and refreshed it behind the scenes
+        deadline = time.monotonic() + 5
+        while _refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        db.session.expire_all()
+        details = db.session.get(PlantDetails, 1)
+        self.assertEqual(details.description, "Freshly fetched.")
+        self.assertFalse(details.is_stale(timedelta(days=1)))
+
+    def test_details_unavailable(self):
+        self.species_details.side_effect = PerenualError("down", 503)
+
+        with app.test_client() as client:
+            resp = client.get('/plants/1')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsNone(db.session.get(PlantDetails, 1))
+
+        # Perenual has nothing for this plant: remember that
+        self.species_details.side_effect = PerenualError("not found", 404)
+
+        with app.test_client() as client:
+            client.get('/plants/1')
+            client.get('/plants/1')
+
+        self.assertEqual(self.species_details.call_count, 2)
+        self.assertEqual(db.session.get(PlantDetails, 1).data, {})
+
+    def test_plant_detail_conditional_get(self):
+        """Repeat views are answered with 304 until the plant changes."""
+
+        with app.test_client() as client:
+            resp = client.get('/plants/1')
+            etag = resp.headers['ETag']
+            last_modified = resp.headers['Last-Modified']
+            self.assertTrue(resp.headers['Cache-Control'].startswith('public'))
+
+            resp = client.get('/plants/1', headers={'If-None-Match': etag})
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp.data, b'')
+            self.assertEqual(resp.headers['ETag'], etag)
+
+            resp = client.get(
+                '/plants/1', headers={'If-Modified-Since': last_modified}
+            )
+            self.assertEqual(resp.status_code, 304)
+
+            # newer details change the page, and its date, too
+            details = db.session.get(PlantDetails, 1)
+            details.fetched_at = datetime(2030, 1, 1)
+            db.session.commit()
+
+            resp = client.get(
+                '/plants/1', headers={'If-Modified-Since': last_modified}
+            )
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(
+                resp.headers['Last-Modified'], 'Tue, 01 Jan 2030 00:00:00 GMT'
+            )
+
+            plant = db.session.get(Plant, 1)
+            plant.updated_at = datetime(2030, 1, 1)
+            db.session.commit()
+
+            resp = client.get('/plants/1', headers={'If-None-Match': etag})
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_plant_detail_private_when_logged_in(self):
+        User.query.delete()
+        user = User.register(**TEST_USER_DATA)
+        db.session.commit()
+        self.addCleanup(User.query.delete)
+
+        with app.test_client() as client:
+            anon_etag = client.get('/plants/1').headers['ETag']
+
+            login_for_test(client, user.id)
+            resp = client.get('/plants/1', headers={'If-None-Match': anon_etag})
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.headers['Cache-Control'], 'private, no-cache')
+            self.assertIn(b'test name', resp.data)
+
+            # who's logged in has no date: only the ETag validates
+            self.assertNotIn('Last-Modified', resp.headers)
+            resp = client.get('/plants/1', headers={
+                'If-Modified-Since': 'Tue, 01 Jan 2100 00:00:00 GMT'
+            })
+            self.assertEqual(resp.status_code, 200)
+
+
+#######################################
+# caching
+
+class TTLCacheTestCase(TestCase):
+    """Tests for in-process TTL/LRU cache."""
+
+    def setUp(self):
+        """Before each test, make a cache w/ a controllable clock."""
+
+        self.now = 0
+        self.cache = TTLCache(
+            ttl=10, max_entries=2, max_bytes=10_000, timer=lambda: self.now
+        )
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get("rose"))
+        self.cache.set("rose", {"data": []})
+        self.assertEqual(self.cache.get("rose"), {"data": []})
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_ttl_expiry(self):
+        self.cache.set("rose", {"data": []})
+        self.now = 11
+        self.assertIsNone(self.cache.get("rose"))
+        self.assertEqual(self.cache.stats()["expirations"], 1)
+
+    def test_lru_eviction(self):
+        self.cache.set("rose", 1)
+        self.cache.set("fern", 2)
+        self.cache.get("rose")
+        self.cache.set("monstera", 3)
+
+        self.assertEqual(self.cache.get("rose"), 1)
+        self.assertIsNone(self.cache.get("fern"))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_memory_cap(self):
+        self.cache.set("rose", 1, size=6_000)
+        self.cache.set("fern", 2, size=6_000)
+        self.assertEqual(len(self.cache), 1)
+        self.assertLessEqual(self.cache.stats()["bytes"], 10_000)
+
+    def test_cache_key_normalized(self):
+        self.assertEqual(
+            make_cache_key("  ROSE ", {"order": "asc", "q": "rose"}),
+            make_cache_key("rose", {"q": "rose", "order": "asc"}),
+        )
+
+
+class SingleFlightTestCase(TestCase):
+    """Tests for coalescing concurrent identical calls."""
+
+    def run_together(self, count, call):
+        """Run call() on count threads at once; return their results."""
+
+        with ThreadPoolExecutor(count) as pool:
+            return list(pool.map(lambda _: call(), range(count)))
+
+    def test_concurrent_calls_share_one(self):
+        flights = SingleFlight()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"data": ["fern"]}
+
+        results = self.run_together(8, lambda: flights.do("fern", fetch))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"data": ["fern"]}] * 8)
+        self.assertEqual(flights.stats()["shared_calls"], 7)
+
+        # once it's done, the next call runs again
+        flights.do("fern", fetch)
+        self.assertEqual(len(calls), 2)
+
+    def test_errors_are_shared(self):
+        flights = SingleFlight()
+
+        def fetch():
+            time.sleep(0.2)
+            raise PerenualError("down", 503)
+
+        def call():
+            try:
+                flights.do("fern", fetch)
+            except PerenualError as exc:
+                return exc.status
+
+        self.assertEqual(self.run_together(4, call), [503] * 4)
+        self.assertEqual(flights.stats()["calls"], 1)
+
+    def test_shared_across_processes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # separate instances lock like separate worker processes do
+            first = SingleFlight(SharedFlight(tmpdir))
+            second = SingleFlight(SharedFlight(tmpdir))
+            started = threading.Event()
+            release = threading.Event()
+
+            def slow_fetch():
+                started.set()
+                release.wait(5)
+                return {"data": ["fern"]}
+
+            with ThreadPoolExecutor(2) as pool:
+                leader = pool.submit(first.do, "fern", slow_fetch)
+                started.wait(5)
+                follower = pool.submit(second.do, "fern", Mock())
+                time.sleep(0.1)
+                release.set()
+
+                self.assertEqual(leader.result(), {"data": ["fern"]})
+                self.assertEqual(follower.result(), {"data": ["fern"]})
+
+            self.assertEqual(second.stats()["cross_process_shared"], 1)
+
+    def test_concurrent_searches_fetch_once(self):
+        species_cache.clear()
+        self.addCleanup(species_cache.clear)
+        self.addCleanup(db.session.commit)
+        self.addCleanup(Plant.query.delete)
+        self.addCleanup(db.session.rollback)
+
+        def species_page(term, page=1, priority="interactive"):
+            time.sleep(0.2)
+            return {"data": [PERENUAL_PLANT], "current_page": 1,
+                    "last_page": 1}
+
+        def search():
+            with app.test_client() as client:
+                return client.post(
+                    "/api/get-plant-list", json={"term": "fir"}
+                ).status_code
+
+        with patch.object(
+            perenual, "species_list", side_effect=species_page
+        ) as mock_get:
+            self.assertEqual(self.run_together(5, search), [200] * 5)
+
+        self.assertEqual(mock_get.call_count, 1)
+
+
+EMPTY_RESULTS = {"data": [], "current_page": 1, "last_page": 1, "total": 0}
+
+
+class PlantSearchCacheTestCase(TestCase):
+    """Tests that repeat searches are served from the species-list cache."""
+
+    def setUp(self):
+        species_cache.clear()
+
+    def tearDown(self):
+        species_cache.clear()
+        db.session.rollback()
+        Plant.query.delete()
+        db.session.commit()
+
+    def test_repeat_search_skips_upstream(self):
+        with patch.object(
+            perenual, "species_list", return_value={"data": []}
+        ) as mock_get:
+            with app.test_client() as client:
+                resp = client.post("/api/get-plant-list", json={"term": "Rose"})
+                self.assertEqual(resp.json, EMPTY_RESULTS)
+
+                resp = client.post(
+                    "/api/get-plant-list", json={"term": " rose "}
+                )
+                self.assertEqual(resp.json, EMPTY_RESULTS)
+
+        self.assertEqual(mock_get.call_count, 1)
+
+    def test_prefetch_following_pages(self):
+        def species_page(term, page=1, priority="interactive"):
+            return {
+                "data": [{**PERENUAL_PLANT, "id": page}],
+                "current_page": page,
+                "last_page": 3,
+            }
+
+        with patch.object(
+            perenual, "species_list", side_effect=species_page
+        ) as mock_get:
+            futures = prefetch_pages("fir", 1, 3)
+            for future in futures:
+                future.result()
+
+            self.assertEqual(mock_get.call_count, 2)
+            self.assertEqual(mock_get.call_args.kwargs["priority"], BACKGROUND)
+            self.assertIn(species_cache_key("fir", 2), species_cache)
+            self.assertIn(species_cache_key("fir", 3), species_cache)
+            self.assertEqual(Plant.query.count(), 2)
+
+            # nothing left to prefetch, and page 3 is served from the cache
+            self.assertEqual(prefetch_pages("fir", 1, 3), [])
+
+            with app.test_client() as client:
+                resp = client.post(
+                    "/api/get-plant-list", json={"term": "fir", "page": 3}
+                )
+
+            self.assertEqual(resp.json["current_page"], 3)
+            self.assertEqual(mock_get.call_count, 2)
+
+    def test_search_doesnt_join_background_prefetch(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def species_page(term, page=1, priority="interactive"):
+            if priority == BACKGROUND:
+                started.set()
+                release.wait(5)
+                raise QuotaExhausted("saving the quota for searches")
+            return {
+                "data": [{**PERENUAL_PLANT, "id": page}],
+                "current_page": page,
+                "last_page": 2,
+            }
+
+        with patch.object(
+            perenual, "species_list", side_effect=species_page
+        ) as mock_get:
+            [future] = prefetch_pages("fir", 1, 2)
+            self.assertTrue(started.wait(5))
+            # were the search to join the prefetch, it would fail with it
+            timer = threading.Timer(0.5, release.set)
+            timer.start()
+            try:
+                with app.test_client() as client:
+                    resp = client.post(
+                        "/api/get-plant-list", json={"term": "fir", "page": 2}
+                    )
+            finally:
+                release.set()
+                timer.cancel()
+            future.result()
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json["current_page"], 2)
+        self.assertEqual(mock_get.call_count, 2)
+
+    def test_page_out_of_range(self):
+        with patch.object(perenual, "species_list") as mock_get:
+            with app.test_client() as client:
+                for page in (0, 101):
+                    resp = client.post(
+                        "/api/get-plant-list",
+                        json={"term": "fir", "page": page},
+                    )
+                    self.assertEqual(resp.status_code, 400)
+                    self.assertIn("page", resp.json["error"])
+
+        mock_get.assert_not_called()
+
+    def test_upstream_error(self):
+        with patch.object(
+            perenual, "species_list", side_effect=PerenualError("down", 503)
+        ):
+            with app.test_client() as client:
+                resp = client.post("/api/get-plant-list", json={"term": "fern"})
+                self.assertEqual(resp.status_code, 502)
+                self.assertIn("upstream", resp.json["error"])
+
+
+#######################################
+# Perenual client
+
+class PerenualClientTestCase(TestCase):
+    """Tests for the pooled Perenual client."""
+
+    def setUp(self):
+        self.client = PerenualClient("key", retries=2, sleep=lambda s: None)
+        self.client.session = Mock()
+
+    def test_retries_then_succeeds(self):
+        ok = Mock(ok=True)
+        ok.json.return_value = {"data": []}
+        self.client.session.get.side_effect = [
+            requests.ConnectionError("reset"),
+            Mock(ok=False, status_code=503),
+            ok,
+        ]
+
+        self.assertEqual(self.client.species_list("rose"), {"data": []})
+        stats = self.client.stats()
+        self.assertEqual(stats["calls"], 3)
+        self.assertEqual(stats["errors"], 2)
+        self.assertEqual(stats["retries"], 2)
+
+        _args, kwargs = self.client.session.get.call_args
+        self.assertEqual(kwargs["params"]["key"], "key")
+        self.assertEqual(kwargs["timeout"], self.client.timeout)
+
+    def test_no_retry_on_client_error(self):
+        self.client.session.get.return_value = Mock(ok=False, status_code=401)
+
+        with self.assertRaises(PerenualError) as ctx:
+            self.client.species_list("rose")
+
+        self.assertEqual(ctx.exception.status, 401)
+        self.assertEqual(self.client.session.get.call_count, 1)
+
+    def test_invalid_json_is_an_error(self):
+        garbled = Mock(ok=True, status_code=200)
+        garbled.json.side_effect = requests.JSONDecodeError("bad", "<html>", 0)
+        self.client.session.get.return_value = garbled
+        statuses = []
+        self.client.on_request = lambda elapsed, status: statuses.append(status)
+
+        with self.assertRaises(PerenualError) as ctx:
+            self.client.species_list("rose")
+
+        self.assertEqual(ctx.exception.status, 200)
+        self.assertEqual(statuses, [200])
+        self.assertEqual(self.client.stats()["errors"], 1)
+
+    def test_stub_serves_recorded_fixtures(self):
+        stub, base_url = start_in_thread(
+            latency=0, page_size=3, padding=10, fixtures=FIXTURES_DIR
+        )
+        self.addCleanup(stub.shutdown)
+
+        client = PerenualClient("key", base_url=base_url)
+
+        recorded = client.species_list("Rose")
+        self.assertEqual(recorded["data"][0]["common_name"], "Rose")
+        self.assertEqual(recorded["data"][0]["padding"], "x" * 10)
+        self.assertEqual(
+            client.species_details(7000)["scientific_name"], ["Rosa"]
+        )
+
+        # nothing recorded: made up
+        self.assertEqual(len(client.species_list("cactus")["data"]), 3)
+
+    def test_gives_up_after_retries(self):
+        self.client.session.get.side_effect = requests.Timeout("slow")
+
+        with self.assertRaises(PerenualError):
+            self.client.species_list("rose")
+
+        self.assertEqual(self.client.session.get.call_count, 3)
+
+
+#######################################
+# rate scheduler
+
+
+class RateSchedulerTestCase(TestCase):
+    """Tests for the shared Perenual rate scheduler."""
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "quota.db")
+        self.now = 1_700_000_000.0
+
+    def scheduler(self, keys=("a",), **settings):
+        return RateScheduler(
+            self.path, list(keys), clock=lambda: self.now,
+            sleep=self.advance, **settings,
+        )
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def test_per_minute_bucket(self):
+        scheduler = self.scheduler(per_minute=2, max_wait=0)
+
+        self.assertEqual(scheduler.acquire(), "a")
+        self.assertEqual(scheduler.acquire(), "a")
+        with self.assertRaises(QuotaExhausted) as ctx:
+            scheduler.acquire()
+        self.assertAlmostEqual(ctx.exception.retry_after, 30)
+
+        # a token comes back every 30 seconds
+        self.advance(30)
+        self.assertEqual(scheduler.acquire(), "a")
+
+    def test_interactive_waits_for_a_token(self):
+        scheduler = self.scheduler(per_minute=2, max_wait=60)
+        start = self.now
+
+        for _ in range(3):
+            scheduler.acquire()
+
+        self.assertAlmostEqual(self.now - start, 30)
+
+    def test_background_leaves_a_reserve(self):
+        scheduler = self.scheduler(per_minute=4, background_reserve=0.5)
+
+        scheduler.acquire(BACKGROUND)
+        scheduler.acquire(BACKGROUND)
+        with self.assertRaises(QuotaExhausted):
+            scheduler.acquire(BACKGROUND)
+
+        # what's left is kept for users' searches
+        scheduler.acquire(INTERACTIVE)
+        scheduler.acquire(INTERACTIVE)
+        self.assertEqual(scheduler.stats()["throttled_background"], 1)
+
+    def test_daily_quota_and_key_rotation(self):
+        scheduler = self.scheduler(keys=("a", "b"), per_day=2)
+
+        keys = [scheduler.acquire() for _ in range(4)]
+        self.assertEqual(sorted(keys), ["a", "a", "b", "b"])
+        self.assertEqual(scheduler.remaining(), {0: (None, 0), 1: (None, 0)})
+
+        with self.assertRaises(QuotaExhausted) as ctx:
+            scheduler.acquire()
+        self.assertIsNone(ctx.exception.retry_after)
+
+        # quotas reset at midnight UTC
+        self.advance(24 * 60 * 60)
+        self.assertIn(scheduler.acquire(), ("a", "b"))
+
+    def test_shared_between_processes(self):
+        # two schedulers on one file, like two workers
+        first = self.scheduler(per_minute=2, max_wait=0)
+        second = self.scheduler(per_minute=2, max_wait=0)
+
+        first.acquire()
+        second.acquire()
+        with self.assertRaises(QuotaExhausted):
+            first.acquire()
+
+    def test_client_uses_scheduler(self):
+        scheduler = self.scheduler(keys=("k1", "k2"), per_minute=10)
+        client = PerenualClient(
+            "unused", retries=0, sleep=lambda s: None
+        )
+        client.scheduler = scheduler
+        client.session = Mock()
+        client.session.get.return_value = Mock(ok=False, status_code=429)
+
+        with self.assertRaises(PerenualError):
+            client.species_list("rose")
+
+        # the key that got the 429 is rested; the other still has room
+        _args, kwargs = client.session.get.call_args
+        limited = scheduler.keys.index(kwargs["params"]["key"])
+        self.assertEqual(scheduler.remaining()[limited][0], 0)
+        self.assertEqual(scheduler.remaining()[1 - limited][0], 10)
+
+    def test_penalized_key_rests_without_a_minute_limit(self):
+        scheduler = self.scheduler(keys=("a", "b"), max_wait=0)
+
+        scheduler.penalize("a")
+        self.assertEqual({scheduler.acquire() for _ in range(3)}, {"b"})
+
+        scheduler.penalize("b")
+        with self.assertRaises(QuotaExhausted) as ctx:
+            scheduler.acquire()
+        self.assertAlmostEqual(ctx.exception.retry_after, 60)
+
+        self.advance(60)
+        self.assertIn(scheduler.acquire(), ("a", "b"))
+
+    def test_bucket_file_from_before_penalties(self):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE buckets (key TEXT PRIMARY KEY, tokens REAL "
+                "NOT NULL, updated REAL NOT NULL, day TEXT NOT NULL, "
+                "day_used INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT INTO buckets VALUES ('a', 0, 0, '', 0)")
+
+        scheduler = self.scheduler(per_day=5)
+        self.assertEqual(scheduler.acquire(), "a")
+        self.assertEqual(scheduler.remaining(), {0: (None, 4)})
+
+
+
+#######################################
+# persisting search results
+
+PERENUAL_PLANT = {
+    "id": 1,
+    "common_name": "European Silver Fir",
+    "scientific_name": ["Abies alba"],
+    "cycle": "Perennial",
+    "watering": "Frequent",
+    "sunlight": ["full sun"],
+    "default_image": {
+        "original_url": "https://perenual.com/storage/og.jpg",
+        "medium_url": "https://perenual.com/storage/medium.jpg",
+    },
+}
+
+
+class PlantUpsertTestCase(TestCase):
+    """Tests for batched plant upserts."""
+
+    def setUp(self):
+        Plant.query.delete()
+        PlantFacet.query.delete()
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        Plant.query.delete()
+        PlantFacet.query.delete()
+        db.session.commit()
+
+    def test_from_perenual(self):
+        row = Plant.from_perenual(PERENUAL_PLANT)
+        self.assertEqual(row["scientific_name"], ["Abies alba"])
+        self.assertEqual(row["sunlight"], ["full sun"])
+        self.assertEqual(
+            row["default_image"], "https://perenual.com/storage/medium.jpg"
+        )
+
+        row = Plant.from_perenual(
+            {"id": 2, "common_name": "Fir", "default_image": None}
+        )
+        self.assertEqual(row["default_image"], DEFAULT_IMG_URL)
+        self.assertEqual(row["cycle"], DEFAULT_UPGRADE_TEXT)
+        self.assertEqual(row["sunlight"], [])
+
+    def test_from_perenual_upgrade_placeholders(self):
+        upgrade = (
+            "Upgrade Plans To Premium/Supreme - "
+            "https://perenual.com/subscription-api-pricing. I'm sorry"
+        )
+        row = Plant.from_perenual({
+            **PERENUAL_PLANT,
+            "watering": upgrade,
+            "sunlight": ["part shade", upgrade],
+            "default_image": {
+                "medium_url": "https://perenual.com/storage/image/"
+                              "upgrade_access.jpg",
+                "original_url": "https://perenual.com/storage/og.jpg",
+            },
+        })
+
+        self.assertEqual(row["watering"], DEFAULT_UPGRADE_TEXT)
+        self.assertEqual(row["sunlight"], ["part shade"])
+        self.assertEqual(
+            row["default_image"], "https://perenual.com/storage/og.jpg"
+        )
+
+    def test_upsert_skips_existing(self):
+        row = Plant.from_perenual(PERENUAL_PLANT)
+        Plant.upsert_many([row, row])
+        db.session.commit()
+
+        Plant.upsert_many([{**row, "cycle": "Annual"}])
+        db.session.commit()
+
+        self.assertEqual(Plant.query.count(), 1)
+        self.assertEqual(db.session.get(Plant, 1).cycle, "Perennial")
+
+    def test_upsert_refresh(self):
+        row = Plant.from_perenual(PERENUAL_PLANT)
+        Plant.upsert_many([row])
+        db.session.commit()
+
+        Plant.upsert_many([{**row, "cycle": "Annual"}], refresh=True)
+        db.session.commit()
+        db.session.expire_all()
+
+        self.assertEqual(db.session.get(Plant, 1).cycle, "Annual")
+
+    def test_upsert_keeps_facet_counts(self):
+        row = Plant.from_perenual(PERENUAL_PLANT)
+        Plant.upsert_many([row, {**row, "id": 2, "sunlight": []}])
+        db.session.commit()
+
+        self.assertEqual(PlantFacet.counts(), {
+            "cycle": {"Perennial": 2},
+            "watering": {"Frequent": 2},
+            "sunlight": {"full sun": 1},
+        })
+
+        # skipped: already stored
+        Plant.upsert_many([{**row, "cycle": "Annual"}])
+        # refreshed: its old values are taken off
+        Plant.upsert_many([{
+            **row, "id": 2, "cycle": "Annual",
+            "sunlight": ["full sun", "part shade"],
+        }], refresh=True)
+        db.session.commit()
+
+        counts = PlantFacet.counts()
+        self.assertEqual(counts["cycle"], {"Annual": 1, "Perennial": 1})
+        self.assertEqual(
+            counts["sunlight"], {"full sun": 2, "part shade": 1}
+        )
+
+        PlantFacet.query.delete()
+        self.assertEqual(PlantFacet.recount(), 2)
+        self.assertEqual(PlantFacet.counts(), counts)
+
+    def test_facet_counts_written_in_key_order(self):
+        counts = Counter({
+            ("watering", "Frequent"): 1, ("cycle", "Perennial"): 2,
+            ("sunlight", "full sun"): 1, ("cycle", "Annual"): -1,
+        })
+
+        with patch.object(
+            db.session, "execute", wraps=db.session.execute
+        ) as execute:
+            PlantFacet.add(counts)
+
+        _stmt, rows = execute.call_args.args
+        self.assertEqual(
+            [(row["facet"], row["value"]) for row in rows],
+            [("cycle", "Annual"), ("cycle", "Perennial"),
+             ("sunlight", "full sun"), ("watering", "Frequent")],
+        )
+
+
+class LocalSearchTestCase(TestCase):
+    """Tests for answering searches from the plants table."""
+
+    def setUp(self):
+        Plant.query.delete()
+        PlantFacet.query.delete()
+        Plant.upsert_many([
+            Plant.from_perenual({**PERENUAL_PLANT, "id": 1}),
+            Plant.from_perenual({
+                **PERENUAL_PLANT, "id": 2, "common_name": "Fir Tree",
+            }),
+            Plant.from_perenual({
+                **PERENUAL_PLANT, "id": 3, "common_name": "Rose",
+                "scientific_name": ["Rosa"],
+            }),
+        ])
+        db.session.commit()
+
+        species_cache.clear()
+        app.config['LOCAL_SEARCH_MIN_RESULTS'] = 2
+
+    def tearDown(self):
+        app.config['LOCAL_SEARCH_MIN_RESULTS'] = 10
+        species_cache.clear()
+        db.session.rollback()
+        Plant.query.delete()
+        db.session.commit()
+
+    def test_search_local_ranking(self):
+        plants = Plant.search_local("FIR")
+        self.assertEqual([plant.id for plant in plants], [2, 1])
+
+    def test_sunlight_includes(self):
+        Plant.upsert_many([Plant.from_perenual({
+            **PERENUAL_PLANT, "id": 4, "sunlight": ["full sun-ish"],
+        })])
+        Plant.upsert_many([Plant.from_perenual({
+            **PERENUAL_PLANT, "id": 5, "sunlight": ["part shade", "full sun"],
+        })])
+        db.session.commit()
+
+        plants = db.session.scalars(
+            db.select(Plant.id)
+            .where(Plant.sunlight_includes("full sun"))
+            .order_by(Plant.id)
+        ).all()
+        self.assertEqual(plants, [1, 2, 3, 5])
+
+    def test_to_card(self):
+        plant = db.session.get(Plant, 1)
+        data = plant.to_card()
+        self.assertEqual(data["scientific_name"], "Abies alba")
+        self.assertEqual(data["sunlight"], "full sun")
+        self.assertEqual(
+            data["default_image"], "https://perenual.com/storage/medium.jpg"
+        )
+
+    def test_search_served_locally(self):
+        with patch.object(perenual, "species_list") as mock_get:
+            with app.test_client() as client:
+                resp = client.post("/api/get-plant-list", json={"term": "fir"})
+
+        mock_get.assert_not_called()
+        self.assertEqual(resp.json["total"], 2)
+        self.assertEqual(resp.json["data"][0]["common_name"], "Fir Tree")
+
+    def test_search_local_pages(self):
+        Plant.upsert_many([
+            Plant.from_perenual({
+                **PERENUAL_PLANT, "id": plant_id,
+                "common_name": f"Fir {plant_id}",
+            })
+            for plant_id in range(10, 45)
+        ])
+        db.session.commit()
+
+        with patch.object(perenual, "species_list") as mock_get:
+            with app.test_client() as client:
+                resp = client.post("/api/get-plant-list", json={"term": "fir"})
+                self.assertEqual(resp.json["total"], 37)
+                self.assertEqual(resp.json["last_page"], 2)
+                first = [plant["id"] for plant in resp.json["data"]]
+
+                resp = client.post(
+                    "/api/get-plant-list", json={"term": "fir", "page": 2}
+                )
+                self.assertEqual(resp.json["current_page"], 2)
+                second = [plant["id"] for plant in resp.json["data"]]
+
+        mock_get.assert_not_called()
+        self.assertEqual(len(first), 30)
+        self.assertEqual(len(set(first + second)), 37)
+
+    def test_search_out_of_quota(self):
+        with patch.object(
+            perenual, "species_list",
+            side_effect=QuotaExhausted("out", retry_after=12.2),
+        ):
+            with app.test_client() as client:
+                # too few local matches to skip upstream, but better than none
+                resp = client.post("/api/get-plant-list", json={"term": "rose"})
+                self.assertEqual(resp.status_code, 200)
+                self.assertTrue(resp.json["partial"])
+                self.assertEqual(
+                    [plant["id"] for plant in resp.json["data"]], [3]
+                )
+
+                resp = client.post(
+                    "/api/get-plant-list", json={"term": "cactus"}
+                )
+                self.assertEqual(resp.status_code, 429)
+                self.assertEqual(resp.headers["Retry-After"], "13")
+
+    def test_search_filtered(self):
+        Plant.upsert_many([Plant.from_perenual({
+            **PERENUAL_PLANT, "id": 4, "common_name": "Shady Fir",
+            "cycle": "Annual", "sunlight": ["part shade"],
+        })])
+        db.session.commit()
+
+        with patch.object(perenual, "species_list") as mock_get:
+            with app.test_client() as client:
+                resp = client.post("/api/get-plant-list", json={
+                    "term": "fir", "sunlight": "part shade",
+                })
+                self.assertEqual(
+                    [plant["id"] for plant in resp.json["data"]], [4]
+                )
+
+                resp = client.post("/api/get-plant-list", json={
+                    "term": "fir", "cycle": "Perennial",
+                    "watering": "Frequent", "sunlight": "full sun",
+                })
+                self.assertEqual(resp.json["total"], 2)
+                self.assertEqual(resp.json["last_page"], 1)
+
+                facets = client.get("/api/facets").json
+                self.assertEqual(facets["sunlight"]["part shade"], 1)
+
+        mock_get.assert_not_called()
+
+    def test_search_too_few_goes_upstream(self):
+        with patch.object(
+            perenual, "species_list", return_value={"data": []}
+        ) as mock_get:
+            with app.test_client() as client:
+                client.post("/api/get-plant-list", json={"term": "rose"})
+
+        mock_get.assert_called_once()
+
+    def wait_for_prefetches(self):
+        deadline = time.monotonic() + 5
+        while _prefetching and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_search_stale_served_and_refreshed(self):
+        Plant.query.update({"fetched_at": datetime(2000, 1, 1)})
+        db.session.commit()
+
+        with patch.object(perenual, "species_list", return_value={
+            "data": [{**PERENUAL_PLANT, "id": 1}], "last_page": 1,
+        }) as mock_get:
+            with app.test_client() as client:
+                resp = client.post("/api/get-plant-list", json={"term": "fir"})
+                self.wait_for_prefetches()
+
+        # served the stored copies without waiting...
+        self.assertEqual(resp.json["total"], 2)
+        self.assertEqual(mock_get.call_args.kwargs["priority"], BACKGROUND)
+
+        # ...and refreshed what Perenual sent, behind the scenes
+        db.session.expire_all()
+        self.assertGreater(
+            db.session.get(Plant, 1).fetched_at, datetime(2000, 1, 1)
+        )
+
+    def test_stale_plant_upstream_never_returns(self):
+        Plant.upsert_many([Plant.from_perenual({
+            **PERENUAL_PLANT, "id": 4, "common_name": "Old Fir",
+        })])
+        db.session.commit()
+        db.session.get(Plant, 4).fetched_at = datetime(2000, 1, 1)
+        db.session.commit()
+
+        # Perenual's "fir" results don't include plant 4
+        with patch.object(perenual, "species_list", return_value={
+            "data": [{**PERENUAL_PLANT, "id": 1}], "last_page": 1,
+        }) as mock_get:
+            with app.test_client() as client:
+                for _search in range(3):
+                    resp = client.post(
+                        "/api/get-plant-list", json={"term": "fir"}
+                    )
+                    self.assertEqual(resp.json["total"], 3)
+                    self.wait_for_prefetches()
+
+        # one background refresh, not an upstream call per search
+        self.assertEqual(mock_get.call_count, 1)
+
+
+class SuggestTestCase(TestCase):
+    """Tests for the /api/suggest prefix index."""
+
+    def setUp(self):
+        Plant.query.delete()
+        PlantFacet.query.delete()
+        Plant.upsert_many([
+            Plant.from_perenual({**PERENUAL_PLANT, "id": 1}),
+            Plant.from_perenual({
+                **PERENUAL_PLANT, "id": 2, "common_name": "Fir Tree",
+                "scientific_name": ["Abies"],
+            }),
+        ])
+        db.session.commit()
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.snapshot = os.path.join(self.tmpdir.name, "suggest.json.gz")
+        app.config['SUGGEST_SNAPSHOT'] = self.snapshot
+        self.index = app.extensions['suggest']
+        app.extensions['suggest'] = SuggestIndex()
+
+    def tearDown(self):
+        app.extensions['suggest'] = self.index
+        app.config['SUGGEST_SNAPSHOT'] = None
+        self.tmpdir.cleanup()
+        db.session.rollback()
+        Plant.query.delete()
+        db.session.commit()
+
+    def test_complete_ranking(self):
+        index = SuggestIndex()
+        index.load([
+            (1, "Japanese Maple", ["Acer palmatum"]),
+            (2, "Maple", ["Acer saccharum"]),
+            (3, "Mapleleaf Viburnum", []),
+            (4, "Red Maple", ["Acer rubrum"]),
+        ])
+
+        # whole names first, shortest first; then later words
+        self.assertEqual(
+            [plant["id"] for plant in index.complete(" MAP ")], [2, 3, 4, 1]
+        )
+        self.assertEqual(index.complete("acer", limit=2), [
+            {"id": 4, "name": "Acer rubrum"},
+            {"id": 1, "name": "Acer palmatum"},
+        ])
+        self.assertEqual(index.complete("oak"), [])
+        self.assertEqual(index.complete(""), [])
+
+    def test_add_reindexes_renamed_plants(self):
+        index = SuggestIndex()
+        index.load([(1, "Maple", ["Acer"])])
+
+        self.assertEqual(index.add([(1, "Maple", ["Acer"])]), 0)
+        self.assertEqual(index.add([(1, "Sugar Maple", ["Acer"])]), 1)
+
+        sugar_maple = [{"id": 1, "name": "Sugar Maple"}]
+        self.assertEqual(index.complete("map"), sugar_maple)
+        self.assertEqual(index.complete("sug"), sugar_maple)
+        self.assertEqual(index.stats()["entries"], 3)
+
+    def test_snapshot_round_trip(self):
+        index = SuggestIndex()
+        index.load([(1, "Maple", ["Acer"])], datetime(2024, 5, 1))
+        index.save(self.snapshot)
+
+        loaded = SuggestIndex()
+        self.assertTrue(loaded.load_snapshot(self.snapshot))
+        self.assertEqual(loaded.updated_at, datetime(2024, 5, 1))
+        self.assertEqual(loaded.complete("ac"), [{"id": 1, "name": "Acer"}])
+
+        self.assertFalse(SuggestIndex().load_snapshot(self.snapshot + "x"))
+
+    def test_suggest_served_from_memory(self):
+        with patch.object(perenual, "species_list") as mock_get:
+            with app.test_client() as client:
+                resp = client.get("/api/suggest?q=fir")
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(resp.json, {"suggestions": [
+                    {"id": 2, "name": "Fir Tree"},
+                    {"id": 1, "name": "European Silver Fir"},
+                ]})
+                self.assertTrue(os.path.exists(self.snapshot))
+
+                # stored by this worker: suggested straight away
+                store_species_page("firethorn", 1, {"data": [{
+                    **PERENUAL_PLANT, "id": 3, "common_name": "Firethorn",
+                }]})
+                resp = client.get("/api/suggest?q=fire&limit=1")
+                self.assertEqual(
+                    resp.json["suggestions"], [{"id": 3, "name": "Firethorn"}]
+                )
+
+        mock_get.assert_not_called()
+
+    def test_suggest_catches_up(self):
+        with app.test_client() as client:
+            client.get("/api/suggest?q=fir")
+
+            # stored by another worker
+            Plant.upsert_many([Plant.from_perenual({
+                **PERENUAL_PLANT, "id": 3, "common_name": "Firethorn",
+            })])
+            db.session.commit()
+
+            resp = client.get("/api/suggest?q=fireth")
+            self.assertEqual(resp.json["suggestions"], [])
+
+            app.extensions['suggest'].checked -= 3600
+            resp = client.get("/api/suggest?q=fireth")
+            self.assertEqual(
+                resp.json["suggestions"], [{"id": 3, "name": "Firethorn"}]
+            )
+
+        # a new worker starts from the snapshot, and catches up too
+        app.extensions['suggest'] = SuggestIndex()
+        with app.test_client() as client:
+            resp = client.get("/api/suggest?q=fireth")
+            self.assertEqual(len(resp.json["suggestions"]), 1)
+
+
+#######################################
+# image thumbnails
+
+
+class ThumbnailTestCase(TestCase):
+    """Tests for the image thumbnail proxy, against a stub image server."""
+
+    def setUp(self):
+        self.stub, base_url = start_in_thread(latency=0)
+        self.addCleanup(self.stub.shutdown)
+        self.storage = base_url.rsplit("/api", 1)[0] + "/storage"
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+
+        self.thumbnails = ThumbnailCache(
+            tmpdir.name, allowed_hosts=["127.0.0.1"]
+        )
+        self.addCleanup(
+            app.extensions.__setitem__, "thumbnails",
+            app.extensions["thumbnails"],
+        )
+        app.extensions["thumbnails"] = self.thumbnails
+
+    def image_url(self, plant_id):
+        return f"{self.storage}/{plant_id}/medium.jpg"
+
+    def test_serves_cached_thumbnails(self):
+        with app.test_client() as client:
+            resp = client.get("/images/card", query_string={
+                "src": self.image_url(7),
+            })
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.mimetype, "image/jpeg")
+            self.assertIn("immutable", resp.headers["Cache-Control"])
+            self.assertIn("max-age=31536000", resp.headers["Cache-Control"])
+            with Image.open(io.BytesIO(resp.data)) as image:
+                self.assertEqual(image.size, (480, 360))
+            etag = resp.headers["ETag"]
+
+            # every size came from that one fetch
+            resp = client.get("/images/detail", query_string={
+                "src": self.image_url(7),
+            })
+            self.assertEqual(resp.status_code, 200)
+
+            # and repeat views revalidate to a 304
+            resp = client.get(
+                "/images/card",
+                query_string={"src": self.image_url(7)},
+                headers={"If-None-Match": etag},
+            )
+            self.assertEqual(resp.status_code, 304)
+
+        self.assertEqual(self.stub.stats.requests, 1)
+        self.assertEqual(self.thumbnails.stats()["hits"], 2)
+
+    def test_rejects_unknown_images(self):
+        with app.test_client() as client:
+            resp = client.get("/images/card", query_string={
+                "src": "https://example.com/cat.jpg",
+            })
+            self.assertEqual(resp.status_code, 404)
+
+            resp = client.get("/images/huge", query_string={
+                "src": self.image_url(7),
+            })
+            self.assertEqual(resp.status_code, 404)
+
+        self.assertEqual(self.stub.stats.requests, 0)
+
+    def test_fetch_failure_redirects(self):
+        with app.test_client() as client:
+            resp = client.get("/images/card", query_string={
+                "src": self.storage.rsplit("/", 1)[0] + "/missing.jpg",
+            })
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp.location, DEFAULT_IMG_URL)
+        self.assertEqual(self.thumbnails.stats()["fetch_errors"], 1)
+
+    def test_evicts_least_recently_used(self):
+        first = [
+            self.thumbnails.get(self.image_url(1), size)
+            for size in THUMBNAIL_SIZES
+        ]
+        self.thumbnails.get(self.image_url(2), "card")
+
+        # image 1 was served longest ago
+        for path in first:
+            os.utime(path, (time.time() - 100,) * 2)
+
+        # room for what's cached now, but not for another image too
+        self.thumbnails.max_bytes = self.thumbnails.stats()["bytes"]
+        third = self.thumbnails.get(self.image_url(3), "card")
+
+        self.assertGreater(self.thumbnails.stats()["evictions"], 0)
+        self.assertFalse(any(os.path.exists(path) for path in first))
+        self.assertTrue(os.path.exists(third))
+
+    def test_thumbnail_url(self):
+        with app.test_request_context():
+            self.assertEqual(thumbnail_url(DEFAULT_IMG_URL), DEFAULT_IMG_URL)
+            self.assertTrue(
+                thumbnail_url(self.image_url(1)).startswith("/images/card?")
+            )
+
+
+#######################################
+# likes
+
+class LikesApiTestCase(TestCase):
+    """Tests for like-status API routes."""
+
+    def setUp(self):
+        """Before each test, add a user who likes one of two plants."""
+
+        Like.query.delete()
+        Plant.query.delete()
+        User.query.delete()
+
+        user = User.register(**TEST_USER_DATA)
+        db.session.add_all([
+            Plant(id=1, **TEST_PLANT_DATA),
+            Plant(id=2, **TEST_PLANT_DATA),
+        ])
+        db.session.commit()
+
+        db.session.add(Like(user_id=user.id, plant_id=1))
+        db.session.commit()
+        self.user_id = user.id
+
+    def tearDown(self):
+        db.session.rollback()
+        Like.query.delete()
+        Plant.query.delete()
+        User.query.delete()
+        db.session.commit()
+
+    def test_batch_likes(self):
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+            resp = client.get("/api/likes/batch?plant_id=1&plant_id=2&plant_id=3")
+
+            self.assertEqual(
+                resp.json, {"likes": {"1": True, "2": False, "3": False}}
+            )
+
+    def test_likes_conditional_get(self):
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+            resp = client.get("/api/likes?plant_id=1")
+            etag = resp.headers['ETag']
+
+            self.assertEqual(resp.json, {"likes": True})
+            self.assertEqual(resp.headers['Cache-Control'], 'private, no-cache')
+
+            resp = client.get(
+                "/api/likes?plant_id=1", headers={'If-None-Match': etag}
+            )
+            self.assertEqual(resp.status_code, 304)
+
+            Like.query.delete()
+            db.session.commit()
+
+            resp = client.get(
+                "/api/likes?plant_id=1", headers={'If-None-Match': etag}
+            )
+            self.assertEqual(resp.json, {"likes": False})
+
+    def test_like_is_idempotent(self):
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+
+            for _ in range(2):
+                resp = client.post("/api/like", json={"plant_id": 2})
+                self.assertEqual(resp.json, {"liked": 2})
+
+            resp = client.post("/api/like", json={"plant_id": 99})
+            self.assertEqual(resp.status_code, 404)
+
+        self.assertEqual(
+            sorted(like.plant_id for like in Like.query.all()), [1, 2]
+        )
+
+    def test_unlike_is_idempotent(self):
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+
+            for _ in range(2):
+                resp = client.post("/api/unlike", json={"plant_id": 1})
+                self.assertEqual(resp.json, {"unliked": 1})
+
+        self.assertEqual(Like.query.count(), 0)
+
+    def test_like_writes_one_statement(self):
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+            # loads the user into the cache
+            client.get("/api/likes?plant_id=1")
+
+            with self.assertLogs("app", "INFO") as logs:
+                client.post("/api/like", json={"plant_id": 2})
+                client.post("/api/unlike", json={"plant_id": 2})
+
+        self.assertEqual(
+            [record.sql_queries for record in logs.records], [1, 1]
+        )
+
+    def test_batch_likes_not_logged_in(self):
+        with app.test_client() as client:
+            resp = client.get("/api/likes/batch?plant_id=1")
+            self.assertEqual(resp.json, {"error": "Not logged in"})
+
+    def test_batch_likes_bad_id(self):
+        with app.test_client() as client:
+            login_for_test(client, self.user_id)
+            resp = client.get("/api/likes/batch?plant_id=rose")
+            self.assertEqual(resp.status_code, 400)
+
+
+#######################################
+# bulk import
+
+class PlantImportTestCase(TestCase):
+    """Tests for the `flask plants import` command."""
+
+    def setUp(self):
+        Plant.query.delete()
+        db.session.commit()
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.tmpdir.name, "checkpoint.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        db.session.rollback()
+        Plant.query.delete()
+        db.session.commit()
+
+    def write_dump(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w") as file:
+            file.write(content)
+        return path
+
+    def run_import(self, *args):
+        return app.test_cli_runner().invoke(args=[
+            "plants", "import", *args, "--checkpoint", self.checkpoint,
+        ])
+
+    def test_import_ndjson(self):
+        lines = [
+            json.dumps({**PERENUAL_PLANT, "id": 1}),
+            json.dumps({"data": [
+                {**PERENUAL_PLANT, "id": 2}, {**PERENUAL_PLANT, "id": 3},
+            ]}),
+        ]
+        path = self.write_dump("dump.ndjson", "\n".join(lines))
+
+        result = self.run_import(path, "--batch-size", "2")
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Done: 3 plants imported.", result.output)
+        self.assertEqual(Plant.query.count(), 3)
+        self.assertEqual(db.session.get(Plant, 2).sunlight, ["full sun"])
+
+    def test_import_json_array_resumes(self):
+        plants = [{**PERENUAL_PLANT, "id": plant_id} for plant_id in range(1, 6)]
+        path = self.write_dump("dump.json", json.dumps(plants, indent=2))
+
+        with open(self.checkpoint, "w") as file:
+            json.dump({"source": os.path.abspath(path), "position": 3}, file)
+
+        result = self.run_import(path)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Resuming", result.output)
+        self.assertEqual(
+            sorted(plant.id for plant in Plant.query.all()), [4, 5]
+        )
+
+    def test_upstream_import_backs_off(self):
+        client = Mock()
+        client.species_list.side_effect = [
+            QuotaExhausted("busy", retry_after=5),
+            {"data": [PERENUAL_PLANT], "last_page": 2},
+            QuotaExhausted("done for today"),
+        ]
+        slept = []
+
+        pages = iter_upstream_pages(client, sleep=slept.append)
+
+        self.assertEqual(next(pages), (1, [PERENUAL_PLANT]))
+        with self.assertRaises(click.ClickException):
+            next(pages)
+
+        self.assertEqual(slept, [5])
+        self.assertEqual(
+            client.species_list.call_args.kwargs["priority"], BACKGROUND
+        )
+
+
+class ListColumnsMigrationTestCase(TestCase):
+    """Tests for `flask plants migrate-lists`, on a plants table in the old
+    text layout.
+    """
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+
+        self.engine = create_engine(f"sqlite:///{tmpdir.name}/old.db")
+        self.addCleanup(self.engine.dispose)
+
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE plants (id INTEGER PRIMARY KEY, "
+                "common_name TEXT NOT NULL, scientific_name TEXT NOT NULL, "
+                "cycle TEXT NOT NULL, watering TEXT NOT NULL, "
+                "sunlight TEXT NOT NULL, default_image TEXT NOT NULL, "
+                "updated_at DATETIME NOT NULL, fetched_at DATETIME NOT NULL)"
+            ))
+            conn.execute(text(
+                "INSERT INTO plants VALUES (:id, 'x', :sci, 'Annual', "
+                "'Average', :sun, 'x.jpg', '2024-01-01', '2024-01-01')"
+            ), [
+                {"id": 1, "sci": "{Abies alba}",
+                 "sun": '{"full sun","part shade"}'},
+                {"id": 2, "sci": "['Rosa canina']", "sun": "['full sun']"},
+                {"id": 3, "sci": "Rosa", "sun": DEFAULT_UPGRADE_TEXT},
+            ])
+
+    def test_migrate_in_batches(self):
+        output = []
+        converted = migrate_list_columns(
+            self.engine, batch_size=2, echo=output.append
+        )
+
+        self.assertEqual(converted, 3)
+        self.assertEqual(output[:2], ["2 plants converted.",
+                                      "3 plants converted."])
+
+        with self.engine.connect() as conn:
+            self.assertEqual(list_columns_pending(conn), [])
+            rows = conn.execute(text(
+                "SELECT id, scientific_name, sunlight FROM plants ORDER BY id"
+            )).all()
+
+        self.assertEqual(
+            [(id, json.loads(sci), json.loads(sun)) for id, sci, sun in rows],
+            [(1, ["Abies alba"], ["full sun", "part shade"]),
+             (2, ["Rosa canina"], ["full sun"]),
+             (3, ["Rosa"], [])],
+        )
+
+        # already done: nothing to do
+        self.assertEqual(
+            migrate_list_columns(self.engine, echo=output.append), 0
+        )
+
+
+class TimestampColumnsMigrationTestCase(TestCase):
+    """Tests for `flask plants migrate-timestamps`, on plants and likes
+    tables from before their timestamp columns.
+    """
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+
+        self.engine = create_engine(f"sqlite:///{tmpdir.name}/old.db")
+        self.addCleanup(self.engine.dispose)
+
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE plants (id INTEGER PRIMARY KEY, "
+                "common_name TEXT NOT NULL, scientific_name JSON NOT NULL, "
+                "cycle TEXT NOT NULL, watering TEXT NOT NULL, "
+                "sunlight JSON NOT NULL, default_image TEXT NOT NULL)"
+            ))
+            conn.execute(text(
+                "CREATE TABLE likes (user_id INTEGER NOT NULL, "
+                "plant_id INTEGER NOT NULL, PRIMARY KEY (user_id, plant_id))"
+            ))
+            conn.execute(text(
+                "INSERT INTO plants VALUES (:id, 'x', '[]', 'Annual', "
+                "'Average', '[]', 'x.jpg')"
+            ), [{"id": id} for id in (1, 2, 3)])
+            conn.execute(text(
+                "INSERT INTO likes VALUES (1, :plant_id)"
+            ), [{"plant_id": id} for id in (1, 2, 3)])
+
+    def test_migrate_in_batches(self):
+        output = []
+        backfilled = migrate_timestamp_columns(
+            self.engine, batch_size=2, echo=output.append
+        )
+
+        self.assertEqual(backfilled, 6)
+        self.assertEqual(output[:2], ["2 rows backfilled.",
+                                      "3 rows backfilled."])
+
+        with self.engine.connect() as conn:
+            plants = conn.execute(text(
+                "SELECT updated_at, fetched_at FROM plants"
+            )).all()
+            likes = conn.execute(text(
+                "SELECT DISTINCT created_at FROM likes"
+            )).all()
+            indexes = {
+                index["name"]
+                for table in ("plants", "likes")
+                for index in db.inspect(conn).get_indexes(table)
+            }
+
+        self.assertEqual(len(likes), 1)
+        self.assertTrue(all(updated for updated, _fetched in plants))
+        self.assertEqual(
+            {fetched[:10] for _updated, fetched in plants},
+            {NEVER_FETCHED.date().isoformat()},
+        )
+        self.assertLessEqual(
+            {"ix_plants_updated_at", "ix_likes_user_created"}, indexes
+        )
+
+        # a rerun fills in rows old code wrote since, and only those
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO likes (user_id, plant_id) VALUES (2, 1)"
+            ))
+
+        self.assertEqual(
+            migrate_timestamp_columns(self.engine, echo=output.append), 1
+        )
+
+    def test_up_to_date_database(self):
+        with db.engine.connect() as conn:
+            self.assertEqual(timestamp_columns_pending(conn), {})
+
+        output = []
+        self.assertEqual(
+            migrate_timestamp_columns(db.engine, echo=output.append), 0
+        )
+        self.assertEqual(output, ["Timestamp columns are already in place."])
+
+
+#######################################
+# metrics
+
+
+class MetricsTestCase(TestCase):
+    """Tests for request metrics and /metrics."""
+
+    def tearDown(self):
+        app.config['METRICS_TOKEN'] = None
+
+    def test_metrics_endpoint(self):
+        with app.test_client() as client:
+            client.get("/")
+            resp = client.get("/metrics")
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.content_type.startswith("text/plain"))
+            self.assertIn(
+                b'plant_app_request_duration_seconds_count'
+                b'{method="GET",route="/",status="200"}',
+                resp.data,
+            )
+            self.assertIn(b"plant_app_species_cache_hits", resp.data)
+
+    def test_metrics_token(self):
+        app.config['METRICS_TOKEN'] = "s3cret"
+
+        with app.test_client() as client:
+            self.assertEqual(client.get("/metrics").status_code, 401)
+
+            resp = client.get(
+                "/metrics", headers={"Authorization": "Bearer s3cret"}
+            )
+            self.assertEqual(resp.status_code, 200)
+
+    def test_production_metrics_need_token(self):
+        with patch.dict(os.environ, {"DATABASE_URL": "sqlite://",
+                                     "PERENUAL_API_KEY": "x",
+                                     "FLASK_SECERT_KEY": "x"}):
+            os.environ.pop("METRICS_TOKEN", None)
+
+            with self.assertRaisesRegex(RuntimeError, "METRICS_TOKEN"):
+                load_config('production')
+
+            os.environ["METRICS_TOKEN"] = "s3cret"
+            config = load_config('production')
+
+        config.LOG_FORMAT = None
+        prod_app = create_app(config)
+
+        with prod_app.test_client() as client:
+            self.assertEqual(client.get("/metrics").status_code, 401)
+            resp = client.get(
+                "/metrics", headers={"Authorization": "Bearer wrong"}
+            )
+            self.assertEqual(resp.status_code, 401)
+
+    def test_request_log_counts_sql(self):
+        with app.test_client() as client:
+            with self.assertLogs("app", "INFO") as logs:
+                client.get("/plants/999999")
+
+        record = logs.records[-1]
+        self.assertEqual(record.route, "/plants/<int:plant_id>")
+        self.assertGreaterEqual(record.sql_queries, 1)
+
+    def test_histogram_render(self):
+        histogram = Histogram("h", "test", ("route",), buckets=(0.1, 1))
+        histogram.observe(0.05, route="/")
+        histogram.observe(0.5, route="/")
+        histogram.observe(5, route="/")
+
+        samples = list(histogram.samples())
+
+        self.assertEqual(
+            [value for suffix, _labels, value in samples], [1, 2, 3, 5.55, 3]
+        )
+        self.assertEqual(samples[2][1], '{route="/",le="+Inf"}')
+
+    def test_perenual_latency_recorded(self):
+        def count():
+            return sum(
+                value for suffix, labels, value in PERENUAL_LATENCY.samples()
+                if suffix == "_count" and 'status="503"' in labels
+            )
+
+        before = count()
+        perenual._record(0.2, 503, failed=True)
+
+        self.assertEqual(count(), before + 1)
+
+    def test_timed_queue_pool(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            engine = create_engine(
+                f"sqlite:///{tmpdir}/pool.db", poolclass=TimedQueuePool
+            )
+            before = self.checkouts()
+
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+
+            engine.dispose()
+
+        self.assertEqual(self.checkouts(), before + 1)
+
+    @staticmethod
+    def checkouts():
+        return sum(
+            value for suffix, _labels, value in POOL_CHECKOUT_WAIT.samples()
+            if suffix == "_count"
+        )
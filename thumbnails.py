@@ -0,0 +1,301 @@
+"""Thumbnails of remote plant images, cached on local disk.
+
+Plant.default_image points at Perenual's storage, so every card used to
+make the browser fetch a full-size image from a third party. Instead,
+/images/<size>?src=<url> fetches each image once, scales it down to every
+size in THUMBNAIL_SIZES and serves the results from a disk cache:
+
+    <root>/blobs/ab/ab12...jpg   a thumbnail, named by the SHA-256 of its bytes
+    <root>/index/cd/cd34...      the digest of the thumbnail for one
+                                 (size, source URL)
+
+Thumbnails are content-addressed, so the same picture behind several URLs
+is stored once, and a digest doubles as an ETag. Once the blobs add up to
+more than max_bytes, the least recently served ones are deleted (serving a
+blob touches its mtime). Several processes can share one root: files are
+written to a temporary name and renamed into place.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image, ImageOps
+
+# name -> bounding box in pixels; the image keeps its aspect ratio
+THUMBNAIL_SIZES = {
+    'card': (480, 480),
+    'detail': (960, 960),
+}
+
+THUMBNAIL_MIMETYPE = 'image/jpeg'
+
+# evict down to this share of max_bytes, so one write doesn't evict per call
+EVICT_TO = 0.9
+
+
+class ThumbnailError(Exception):
+    """The source image couldn't be fetched, or isn't an image we can read."""
+
+
+class ThumbnailCache:
+    """Fetches remote images, and makes and keeps their thumbnails on disk.
+
+    Only http(s) URLs on allowed_hosts (or their subdomains) are fetched,
+    so the proxy can't be pointed at arbitrary servers; redirects aren't
+    followed, for the same reason. Sources over max_source_bytes are
+    refused. Hit, miss and eviction counters are available from stats().
+    """
+
+    def __init__(self, root, max_bytes=256 * 1024 * 1024,
+                 allowed_hosts=('perenual.com',),
+                 max_source_bytes=10 * 1024 * 1024, connect_timeout=3.05,
+                 read_timeout=10, quality=85):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.allowed_hosts = tuple(allowed_hosts)
+        self.max_source_bytes = max_source_bytes
+        self.timeout = (connect_timeout, read_timeout)
+        self.quality = quality
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        # bytes of blobs on disk; counted on first write, then kept up to date
+        self._bytes = None
+
+        self.hits = 0
+        self.misses = 0
+        self.fetch_errors = 0
+        self.evictions = 0
+
+    def allows(self, url):
+        """May the proxy fetch url?"""
+
+        parsed = urlparse(url)
+        host = (parsed.hostname or '').lower()
+
+        return parsed.scheme in ('http', 'https') and any(
+            host == allowed or host.endswith('.' + allowed)
+            for allowed in self.allowed_hosts
+        )
+
+    def get(self, url, size):
+        """Return the path of url's thumbnail at size (a THUMBNAIL_SIZES
+        name), fetching and scaling the image first if it isn't cached.
+
+        Raises ValueError for an unknown size or a URL that isn't allowed,
+        and ThumbnailError if the image can't be fetched or read.
+        """
+
+        if size not in THUMBNAIL_SIZES:
+            raise ValueError(f'Unknown thumbnail size {size!r}')
+        if not self.allows(url):
+            raise ValueError(f'Not an allowed image URL: {url!r}')
+
+        path = self._lookup(url, size)
+        if path is not None:
+            with self._lock:
+                self.hits += 1
+            return path
+
+        with self._lock:
+            self.misses += 1
+
+        source = self._fetch(url)
+
+        # every size from one fetch; the other sizes are usually next
+        paths = {}
+        for name, box in THUMBNAIL_SIZES.items():
+            paths[name] = self._store(self._render(source, box))
+            self._write_atomic(
+                self._index_path(url, name), os.path.basename(paths[name])
+            )
+
+        self._evict_if_needed()
+
+        return paths[size]
+
+    def stats(self):
+        """Return a dict of hit, miss, error and eviction counters."""
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "fetch_errors": self.fetch_errors,
+                "evictions": self.evictions,
+                "bytes": self._bytes or 0,
+            }
+
+    def _lookup(self, url, size):
+        """Return the cached thumbnail's path (marking it recently used), or
+        None.
+        """
+
+        try:
+            with open(self._index_path(url, size)) as index:
+                path = self._blob_path(index.read().strip())
+
+            os.utime(path)
+
+        except (FileNotFoundError, ValueError):
+            # never made, or evicted since
+            return None
+
+        return path
+
+    def _fetch(self, url):
+        """Return the bytes of the image at url."""
+
+        try:
+            return self._download(url)
+
+        except ThumbnailError:
+            with self._lock:
+                self.fetch_errors += 1
+            raise
+
+    def _download(self, url):
+        try:
+            with self.session.get(
+                url, timeout=self.timeout, stream=True, allow_redirects=False
+            ) as resp:
+                if resp.status_code != 200:
+                    raise ThumbnailError(f'{url} answered {resp.status_code}')
+
+                body = resp.raw.read(
+                    self.max_source_bytes + 1, decode_content=True
+                )
+
+        except requests.RequestException as exc:
+            raise ThumbnailError(f'Could not fetch {url}: {exc}') from exc
+
+        if len(body) > self.max_source_bytes:
+            raise ThumbnailError(
+                f'{url} is over {self.max_source_bytes} bytes'
+            )
+
+        return body
+
+    def _render(self, source, box):
+        """Scale the image in source to fit box; return it as JPEG bytes."""
+
+        try:
+            with Image.open(io.BytesIO(source)) as image:
+                # JPEGs can decode straight to a reduced size: much faster
+                image.draft('RGB', box)
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail(box, Image.Resampling.LANCZOS)
+
+                if image.mode in ('RGBA', 'LA', 'P'):
+                    image = image.convert('RGBA')
+                    background = Image.new('RGB', image.size, 'white')
+                    background.paste(image, mask=image.getchannel('A'))
+                    image = background
+                elif image.mode != 'RGB':
+                    image = image.convert('RGB')
+
+                out = io.BytesIO()
+                image.save(
+                    out, 'JPEG', quality=self.quality, optimize=True,
+                    progressive=True,
+                )
+
+        except (OSError, Image.DecompressionBombError) as exc:
+            raise ThumbnailError(f'Not a readable image: {exc}') from exc
+
+        return out.getvalue()
+
+    def _store(self, data):
+        """Write data under its digest (unless it's there already); return
+        its path.
+        """
+
+        path = self._blob_path(hashlib.sha256(data).hexdigest() + '.jpg')
+
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+
+        self._write_atomic(path, data)
+
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += len(data)
+
+        return path
+
+    def _evict_if_needed(self):
+        """Delete least recently used blobs until they fit in max_bytes."""
+
+        with self._lock:
+            if self._bytes is not None and self._bytes <= self.max_bytes:
+                return
+
+            # first call, or over the limit: count what's really on disk,
+            # which other processes may have added to or evicted from
+            blobs = []
+            for dirpath, _dirnames, filenames in os.walk(
+                os.path.join(self.root, 'blobs')
+            ):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    blobs.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _mtime, size, _path in blobs)
+
+            if total > self.max_bytes:
+                target = self.max_bytes * EVICT_TO
+
+                for _mtime, size, path in sorted(blobs):
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    self.evictions += 1
+
+            self._bytes = total
+
+    def _blob_path(self, name):
+        if not name or os.sep in name or name.startswith('.'):
+            raise ValueError(f'Bad thumbnail name {name!r}')
+
+        return os.path.join(self.root, 'blobs', name[:2], name)
+
+    def _index_path(self, url, size):
+        key = hashlib.sha256(f'{size} {url}'.encode()).hexdigest()
+        return os.path.join(self.root, 'index', key[:2], key)
+
+    def _write_atomic(self, path, data):
+        """Write data (bytes or str) to path via a temporary file, so readers
+        never see a partial file.
+        """
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        mode = 'wb' if isinstance(data, bytes) else 'w'
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, mode) as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
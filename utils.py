@@ -0,0 +1,423 @@
+"""Utility helpers for Plant App."""
+
+import base64
+import binascii
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+# attributes every LogRecord has; anything else came in through extra=
+_LOG_RECORD_ATTRS = {
+    *vars(logging.makeLogRecord({})), 'message', 'asctime', 'taskName',
+}
+
+
+def normalize_term(term):
+    """Normalize a search term so equivalent searches share a cache entry.
+
+    Lowercases, strips, and collapses inner whitespace:
+
+        >>> normalize_term('  Monstera   DELICIOSA ')
+        'monstera deliciosa'
+    """
+
+    return ' '.join((term or '').lower().split())
+
+
+def make_cache_key(term, params=None):
+    """Build a hashable cache key from a search term and query params.
+
+    The term is normalized; params are sorted so their order doesn't matter.
+    Never include the API key in params passed here.
+    """
+
+    return (normalize_term(term), tuple(sorted((params or {}).items())))
+
+
+def encode_cursor(*values):
+    """Pack a keyset-pagination position into an opaque, URL-safe token.
+
+    Values must be JSON-serializable; datetimes are sent as ISO strings.
+    """
+
+    data = json.dumps(
+        [value.isoformat() if isinstance(value, datetime) else value
+         for value in values],
+        separators=(',', ':'),
+    )
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Unpack a token from encode_cursor into a list of values, or return
+    None if it isn't a valid token.
+    """
+
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(data)
+
+    except (binascii.Error, ValueError):
+        return None
+
+    return values if isinstance(values, list) else None
+
+
+def make_etag(*parts):
+    """Hash parts (anything with a stable str()) into an ETag value."""
+
+    digest = hashlib.blake2b(digest_size=16)
+
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b'\0')
+
+    return digest.hexdigest()
+
+
+def approx_size(obj):
+    """Roughly estimate the memory footprint of a JSON-like object in bytes."""
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+
+    elif isinstance(obj, (list, tuple)):
+        size += sum(approx_size(item) for item in obj)
+
+    return size
+
+
+class TTLCache:
+    """Thread-safe in-process cache with TTL expiry and LRU eviction.
+
+    Bounded both by number of entries and by an approximate memory cap
+    (sizes come from approx_size unless a size is passed to set). Keeps
+    hit/miss/eviction counters, available from stats().
+    """
+
+    def __init__(self, ttl=3600, max_entries=1024, max_bytes=32 * 1024 * 1024,
+                 timer=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._timer = timer
+        self._lock = threading.Lock()
+        # key -> (expires_at, size, value); ordered oldest to newest use
+        self._data = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        """Is there a live entry for key? Doesn't count as a hit or miss, or
+        refresh the entry's LRU position.
+        """
+
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > self._timer()
+
+    def get(self, key, default=None):
+        """Return cached value for key, or default if missing/expired."""
+
+        with self._lock:
+            entry = self._data.get(key)
+
+            if entry is not None and entry[0] <= self._timer():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, ttl=None, size=None):
+        """Store value under key, evicting least-recently-used entries until
+        the cache is back under its entry and memory limits.
+
+        Values larger than the whole memory cap aren't stored.
+        """
+
+        if size is None:
+            size = approx_size(value)
+
+        if size > self.max_bytes:
+            return
+
+        expires_at = self._timer() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+            self._data[key] = (expires_at, size, value)
+            self._bytes += size
+
+            while (len(self._data) > self.max_entries
+                   or self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove key from the cache, if present."""
+
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        """Empty the cache. Counters are kept."""
+
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return a dict of cache size and hit/miss counters."""
+
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _remove(self, key):
+        """Drop key; caller must hold the lock."""
+
+        _expires_at, size, _value = self._data.pop(key)
+        self._bytes -= size
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key.
+
+    The first caller for a key runs the function; callers that arrive while
+    it's running wait for it and share its result (or its exception)
+    instead of repeating the work. Once the call finishes, the next caller
+    for the key starts a new one.
+
+    That covers threads in this process. With shared (a SharedFlight),
+    the first caller in each process also coordinates with other processes,
+    so one call can serve several gunicorn workers.
+    """
+
+    def __init__(self, shared=None):
+        self.shared = shared
+        self._lock = threading.Lock()
+        # key -> Future of the call in flight
+        self._calls = {}
+
+        self.calls = 0
+        self.shared_calls = 0
+
+    def do(self, key, func):
+        """Return func(), or the result of the call for key already in
+        flight.
+        """
+
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+
+            if leader:
+                future = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.shared_calls += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            if self.shared is not None:
+                result = self.shared.do(key, func)
+            else:
+                result = func()
+
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+
+        else:
+            future.set_result(result)
+            return result
+
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        """Return a dict of call counters: calls made, calls joined, and
+        (with shared) results taken from other processes.
+        """
+
+        with self._lock:
+            stats = {
+                "in_flight": len(self._calls),
+                "calls": self.calls,
+                "shared_calls": self.shared_calls,
+            }
+
+        stats["cross_process_shared"] = (
+            self.shared.shared_results if self.shared is not None else 0
+        )
+        return stats
+
+
+class SharedFlight:
+    """Coalesces calls for the same key across processes on one host, with
+    lock files in directory.
+
+    A caller holds an exclusive lock (flock) for its key while it runs, and
+    leaves the result, as JSON, for ttl seconds. Callers in other processes
+    wait for the lock, then take that result instead of calling again. If
+    the call failed, there's no result, and the next caller runs it again.
+    Keys share stripes lock files, so unrelated keys only rarely wait on
+    each other. A caller that waits longer than lock_timeout goes ahead
+    without the lock.
+
+    Results must be JSON-serializable.
+    """
+
+    def __init__(self, directory, ttl=10, stripes=256, lock_timeout=30):
+        self.directory = directory
+        self.ttl = ttl
+        self.stripes = stripes
+        self.lock_timeout = lock_timeout
+
+        os.makedirs(os.path.join(directory, 'results'), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.shared_results = 0
+
+    def do(self, key, func):
+        """Return a recent result for key from any process, else func()
+        (shared with the others).
+        """
+
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        lock_path = os.path.join(
+            self.directory, f'{int(digest, 16) % self.stripes}.lock'
+        )
+        result_path = os.path.join(self.directory, 'results', digest)
+
+        with open(lock_path, 'a') as lock_file:
+            locked = self._acquire(lock_file)
+
+            try:
+                found, result = self._read_result(result_path)
+                if found:
+                    with self._lock:
+                        self.shared_results += 1
+                    return result
+
+                result = func()
+                self._write_result(result_path, result)
+                return result
+
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _acquire(self, lock_file):
+        """Lock lock_file, waiting up to lock_timeout; did it lock?"""
+
+        deadline = time.monotonic() + self.lock_timeout
+
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.01)
+
+    def _read_result(self, path):
+        """Return (True, result) for a result under ttl seconds old, else
+        (False, None).
+        """
+
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return False, None
+
+            with open(path) as file:
+                return True, json.load(file)
+
+        except (OSError, ValueError):
+            return False, None
+
+    def _write_result(self, path, result):
+        """Leave result for other processes, and clear out expired ones."""
+
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}'
+        with open(tmp_path, 'w') as file:
+            json.dump(result, file, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+        results_dir = os.path.dirname(path)
+        cutoff = time.time() - self.ttl
+
+        for entry in os.scandir(results_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as one JSON object per line.
+
+    Fields passed with extra= become top-level keys, so a line like
+
+        logger.info('request', extra={"route": "/", "duration_ms": 3.1})
+
+    can be filtered and aggregated by field.
+    """
+
+    def format(self, record):
+        created = datetime.fromtimestamp(record.created, timezone.utc)
+        entry = {
+            "ts": created.isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+
+        for key, value in vars(record).items():
+            if key not in _LOG_RECORD_ATTRS:
+                entry[key] = value
+
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)